@@ -1,11 +1,20 @@
 # -*- mode: python ; coding: utf-8 -*-
 # FastType 第一版打包配置
 # 使用：pyinstaller FastType.spec
+# 打包方式由环境变量 FASTTYPE_BUILD 选择：
+#   onefile（默认）：单个 FastType.exe，UPX 压缩；每次启动都要先解压到临时目录
+#   onedir：dist/FastType/ 目录版，不用 UPX，启动时无需解压、无需解压缩，冷启动更快
+#   例：set FASTTYPE_BUILD=onedir && pyinstaller FastType.spec
 
 import os
 
 block_cipher = None
 
+build_profile = os.environ.get('FASTTYPE_BUILD', 'onefile').strip().lower()
+if build_profile not in ('onefile', 'onedir'):
+    raise SystemExit(f"未知的 FASTTYPE_BUILD={build_profile!r}，可选 onefile / onedir")
+onedir = build_profile == 'onedir'
+
 # 只打包 build 下的图标文件，不打包整个 build/（避免把 build/FastType 打进包）
 build_dir = os.path.join(SPECPATH, 'build')
 datas = []
@@ -44,7 +53,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=datas,
-    hiddenimports=['PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'keyboard', 'pyperclip'],
+    hiddenimports=['PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'keyboard'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -57,19 +66,13 @@ a = Analysis(
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
+exe_options = dict(
     name='FastType',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=not onedir,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=False,  # 无黑窗口
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -78,3 +81,31 @@ exe = EXE(
     entitlements_file=None,
     icon=icon,
 )
+
+if onedir:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        **exe_options,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='FastType',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        runtime_tmpdir=None,
+        **exe_options,
+    )
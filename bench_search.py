@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+FastType 搜索基准：用可复现的合成片段库测加载/保存耗时、逐键搜索延迟和内存峰值。
+
+每个库规模在单独的子进程里测（内存峰值互不影响），用户目录指向临时目录，不碰真实数据；
+Qt 使用 offscreen 平台，Linux 无显示环境也能运行。
+
+测量项：
+    save_ms / parse_ms / records_ms / index_ms   save_snippets、load_snippets、转 Snippet、建索引
+    window_ready_ms                              创建主窗口到片段后台加载完成
+    typing                                       按脚本逐字输入，每次按键的搜索耗时与刷新列表耗时；
+                                                 包含模式另测旧的线性 filter_snippets 作对照
+    peak_rss_mb                                  进程内存峰值
+
+用法：
+    python bench_search.py                                   # 默认 1k、10k、100k
+    python bench_search.py --sizes 1000,500000 --output bench_search.json
+    python bench_search.py --baseline old.json               # 与上次结果对比
+    python bench_search.py --baseline old.json --max-regression 25   # 比本机基线慢 25% 以上时失败
+    python bench_search.py --sizes 100000 --max-substring-ratio 0.2 --max-fuzzy-ratio 0.5   # 与同次线性过滤耗时之比超限时失败
+    python bench_search.py --sizes 100000 --max-substring-p95-ms 30 --max-fuzzy-p95-ms 50   # 超过上限时失败
+    python bench_search.py --typing 邮箱 --typing "ssh root"  # 自定义输入脚本
+    python bench_search.py --generate 50000 --home ./bench_home   # 只生成片段库（可配合 bench_startup.py --home）
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_TYPING = ("邮箱", "服务器密码", "deploy", "ssh root", "slyx", "数据库 连接")
+LINEAR_MAX_SIZE = 100000   # 更大的库跳过线性 filter_snippets（单次按键要几百毫秒）
+
+_ZH_WORDS = (
+    "示例", "邮箱", "密码", "服务器", "数据库", "连接", "配置", "地址", "账号", "测试", "生产", "日志",
+    "部署", "回复", "模板", "客户", "订单", "发票", "会议", "通知", "签名", "电话", "问候", "感谢",
+    "报错", "排查", "备份", "恢复", "脚本", "命令", "接口", "文档", "项目", "周报", "审批", "合同",
+)
+_EN_WORDS = (
+    "deploy", "ssh", "root", "server", "docker", "kubectl", "select", "from", "where", "user", "password",
+    "email", "config", "nginx", "restart", "status", "log", "tail", "grep", "git", "commit", "push",
+    "hello", "thanks", "regards", "meeting", "invoice", "order", "api", "token", "backup", "restore",
+)
+_SYMBOLS = (" ", " ", " ", "，", "。", ", ", ". ", "\n", " -f ", " | ", "@example.com ", "://", "/", "=")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def _text_pool(rng, chars: int) -> str:
+    parts = []
+    size = 0
+    while size < chars:
+        word = rng.choice(_ZH_WORDS) if rng.random() < 0.5 else rng.choice(_EN_WORDS)
+        sep = rng.choice(_SYMBOLS)
+        parts.append(word + sep)
+        size += len(word) + len(sep)
+    return "".join(parts)
+
+
+def _content_length(rng) -> int:
+    """多数是一两行的短文本，少数是段落，极少数是几 KB 的脚本/长文。"""
+    r = rng.random()
+    if r < 0.70:
+        return rng.randint(8, 120)
+    if r < 0.95:
+        return rng.randint(120, 1000)
+    return rng.randint(1000, 8000)
+
+
+def generate_corpus(n: int, seed: int = 1) -> list:
+    """生成 n 条中英文混合的片段字典（同一 seed 结果相同）。"""
+    rng = random.Random(seed)
+    pool = _text_pool(rng, 1 << 20)
+    snippets = []
+    for i in range(1, n + 1):
+        words = [rng.choice(_ZH_WORDS) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.4:
+            words.insert(rng.randint(0, len(words)), rng.choice(_EN_WORDS))
+        sep = "：" if rng.random() < 0.3 else ""
+        title = sep.join([words[0], "".join(words[1:])]) if sep and len(words) > 1 else "".join(words)
+        if rng.random() < 0.2:
+            title += f" {i}"
+        length = _content_length(rng)
+        start = rng.randrange(0, len(pool) - length)
+        snippets.append({"id": str(i), "title": title, "content": pool[start:start + length]})
+    return snippets
+
+
+def peak_rss_mb():
+    """进程内存峰值（MB），取不到时返回 None。"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return round(counters.PeakWorkingSetSize / (1 << 20), 1)
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _latency_summary(samples: list) -> dict:
+    return {
+        "keystrokes": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "max": max(samples),
+    }
+
+
+def _type_sequences(window, app, mode: str, sequences) -> dict:
+    """逐字输入每个脚本：先清空搜索框（空查询），再每加一个字符搜索一次并刷新列表。"""
+    window.search_mode = mode
+    search_ms, refresh_ms, total_ms = [], [], []
+    per_query = {}
+    edit = window.search_edit
+    edit.blockSignals(True)   # 由本函数同步搜索，不走输入防抖和后台线程
+    try:
+        for text in sequences:
+            query_total = []
+            for end in range(len(text) + 1):
+                edit.setText(text[:end])
+                keyword = text[:end].strip()
+                t0 = time.perf_counter()
+                index = window.store.index
+                if not keyword:
+                    results = index.ranked(window.usage.ranked())
+                elif mode == "fuzzy":
+                    results = index.fuzzy_search(keyword, usage=window._usage)
+                else:
+                    results = index.search(keyword)
+                t1 = time.perf_counter()
+                window._show_results(window._next_search_generation(), results)
+                app.processEvents()
+                t2 = time.perf_counter()
+                search_ms.append(round((t1 - t0) * 1000, 3))
+                refresh_ms.append(round((t2 - t1) * 1000, 3))
+                query_total.append(round((t2 - t0) * 1000, 3))
+            per_query[text] = {"max": max(query_total), "results": len(window.filtered)}
+            total_ms.extend(query_total)
+    finally:
+        edit.blockSignals(False)
+    return {
+        "search": _latency_summary(search_ms),
+        "refresh": _latency_summary(refresh_ms),
+        "total": _latency_summary(total_ms),
+        "queries": per_query,
+    }
+
+
+def _linear_typing(main, snippets: list, sequences) -> dict:
+    samples = []
+    for text in sequences:
+        for end in range(1, len(text) + 1):
+            t0 = time.perf_counter()
+            main.filter_snippets(snippets, text[:end])
+            samples.append(_ms(t0))
+    return _latency_summary(samples)
+
+
+def run_worker(size: int, seed: int, sequences, output: str) -> None:
+    """子进程：在临时用户目录里生成片段库并完成全部测量，结果写入 output。"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    import main
+
+    result = {"size": size}
+    corpus = generate_corpus(size, seed)
+    path = main.get_snippets_path()
+
+    t0 = time.perf_counter()
+    main.save_snippets(corpus, path)
+    result["save_ms"] = _ms(t0)
+    result["file_mb"] = round(os.path.getsize(path) / (1 << 20), 2)
+    del corpus
+
+    t0 = time.perf_counter()
+    loaded = main.load_snippets(path)
+    result["parse_ms"] = _ms(t0)
+    if size <= LINEAR_MAX_SIZE:
+        result["linear_filter"] = _linear_typing(main, loaded, sequences)
+    t0 = time.perf_counter()
+    records = main._to_records(loaded)
+    result["records_ms"] = _ms(t0)
+    del loaded
+    t0 = time.perf_counter()
+    main.SnippetIndex(records)
+    result["index_ms"] = _ms(t0)
+    del records
+    result["peak_rss_after_load_mb"] = peak_rss_mb()
+
+    app = QApplication(sys.argv[:1])
+    t0 = time.perf_counter()
+    window = main.MainWindow()
+    window.show()
+    while not window.store.is_loaded():
+        app.processEvents()
+        time.sleep(0.001)
+    app.processEvents()
+    result["window_ready_ms"] = _ms(t0)
+
+    result["typing"] = {mode: _type_sequences(window, app, mode, sequences) for mode in ("substring", "fuzzy")}
+    result["peak_rss_mb"] = peak_rss_mb()
+    window.stop_search_thread()
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+def run_size(size: int, args) -> dict:
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory(prefix="fasttype-bench-") as home:
+        output = os.path.join(home, "result.json")
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+        cmd = [sys.executable, os.path.join(here, "bench_search.py"), "--worker-size", str(size),
+               "--worker-output", output, "--seed", str(args.seed)]
+        for text in args.typing:
+            cmd += ["--typing", text]
+        proc = subprocess.run(cmd, env=env, timeout=args.timeout, check=False, stdout=subprocess.DEVNULL)
+        if proc.returncode != 0 or not os.path.exists(output):
+            return None
+        with open(output, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _git_commit(here: str):
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True,
+                             text=True, timeout=5, check=False)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def _headline(run: dict) -> dict:
+    """用于打印和对比的主要指标。"""
+    row = {k: run.get(k) for k in ("save_ms", "parse_ms", "records_ms", "index_ms", "window_ready_ms", "peak_rss_mb")}
+    for mode, data in run.get("typing", {}).items():
+        row[f"{mode}_p95"] = data["total"]["p95"]
+        row[f"{mode}_max"] = data["total"]["max"]
+    if "linear_filter" in run:
+        linear = run["linear_filter"]["p95"]
+        row["linear_p95"] = linear
+        # 与同一次运行里线性过滤的比值，不受机器快慢影响
+        for mode in ("substring", "fuzzy"):
+            if f"{mode}_p95" in row and linear:
+                row[f"{mode}_ratio"] = round(row[f"{mode}_p95"] / linear, 3)
+    return row
+
+
+def print_report(runs: list, baseline: dict = None) -> None:
+    base_runs = {r["size"]: _headline(r) for r in (baseline or {}).get("runs", [])}
+    for run in runs:
+        print(f"\n== {run['size']} 条片段（{run['file_mb']} MB）==")
+        base = base_runs.get(run["size"], {})
+        for key, value in _headline(run).items():
+            if value is None:
+                continue
+            line = f"  {key:<18}{value:>12}"
+            old = base.get(key)
+            if old:
+                line += f"   基线 {old:>10}  ({(value - old) / old * 100:+.1f}%)"
+            print(line)
+
+
+# 可设上限的指标：(命令行参数名, _headline 中的键)
+LIMITS = (
+    ("max_index_ms", "index_ms"),
+    ("max_window_ready_ms", "window_ready_ms"),
+    ("max_substring_p95_ms", "substring_p95"),
+    ("max_fuzzy_p95_ms", "fuzzy_p95"),
+    ("max_rss_mb", "peak_rss_mb"),
+    ("max_substring_ratio", "substring_ratio"),
+    ("max_fuzzy_ratio", "fuzzy_ratio"),
+)
+# 比值是相对量，不参与 --max-regression
+RATIO_KEYS = ("substring_ratio", "fuzzy_ratio")
+# 与基线相差不到这么多（毫秒或 MB）时不算回退，避免小库上的计时噪声
+REGRESSION_SLACK = 1.0
+
+
+def check_limits(runs: list, args, baseline: dict = None) -> list:
+    """按 --max-* 上限、--max-*-ratio 比值和 --max-regression（相对基线的百分比）检查结果，返回超限说明。"""
+    failures = []
+    base_runs = {r["size"]: _headline(r) for r in (baseline or {}).get("runs", [])}
+    for run in runs:
+        row = _headline(run)
+        for option, key in LIMITS:
+            limit = getattr(args, option)
+            value = row.get(key)
+            if limit is not None and value is not None and value > limit:
+                failures.append(f"{run['size']} 条：{key} = {value} 超过上限 {limit}")
+        if args.max_regression is None:
+            continue
+        base = base_runs.get(run["size"], {})
+        for _, key in LIMITS:
+            if key in RATIO_KEYS:
+                continue
+            value, old = row.get(key), base.get(key)
+            if value is None or not old:
+                continue
+            if value > old * (1 + args.max_regression / 100) and value - old > REGRESSION_SLACK:
+                failures.append(
+                    f"{run['size']} 条：{key} = {value} 比基线 {old} 慢 {(value - old) / old * 100:.1f}%"
+                    f"（上限 {args.max_regression}%）"
+                )
+    return failures
+
+
+def write_corpus(size: int, seed: int, home: str) -> None:
+    home = os.path.abspath(home)
+    path = os.path.join(home, ".fasttype", "snippets.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(generate_corpus(size, seed), f, ensure_ascii=False, indent=2)
+    print(f"已生成 {size} 条片段：{path}")
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="FastType 搜索、加载与内存基准")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="逗号分隔的片段数量（默认 1000,10000,100000，最大建议 500000）")
+    parser.add_argument("--seed", type=int, default=1, help="语料随机种子（默认 1）")
+    parser.add_argument("--typing", action="append", help="逐字输入的查询，可重复；默认一组中英文查询")
+    parser.add_argument("--timeout", type=float, default=1800, help="单个规模的超时秒数")
+    parser.add_argument("--output", help="把结果写入该 JSON 文件")
+    parser.add_argument("--baseline", help="与之前在本机用 --output 写出的结果对比")
+    parser.add_argument("--max-regression", type=float,
+                        help="相对 --baseline 的回退上限（百分比），建索引、就绪、逐键 p95、内存任一项超出则失败；"
+                             "基线须在同一台机器上生成")
+    parser.add_argument("--max-index-ms", type=float, help="建索引耗时上限")
+    parser.add_argument("--max-window-ready-ms", type=float, help="主窗口就绪耗时上限")
+    parser.add_argument("--max-substring-p95-ms", type=float, help="包含模式逐键耗时 p95 上限")
+    parser.add_argument("--max-fuzzy-p95-ms", type=float, help="模糊模式逐键耗时 p95 上限")
+    parser.add_argument("--max-rss-mb", type=float, help="内存峰值上限（MB）")
+    parser.add_argument("--max-substring-ratio", type=float,
+                        help="包含模式逐键 p95 与同次线性 filter_snippets p95 之比的上限（只检查有线性对照的规模）")
+    parser.add_argument("--max-fuzzy-ratio", type=float,
+                        help="模糊模式逐键 p95 与同次线性 filter_snippets p95 之比的上限（只检查有线性对照的规模）")
+    parser.add_argument("--generate", type=int, help="只生成该数量的片段库到 --home 下，不测量")
+    parser.add_argument("--home", help="配合 --generate：片段库写到 <home>/.fasttype/snippets.json")
+    parser.add_argument("--worker-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.typing = args.typing or list(DEFAULT_TYPING)
+
+    if args.max_regression is not None and not args.baseline:
+        parser.error("--max-regression 需要同时指定 --baseline")
+    if args.worker_size:
+        run_worker(args.worker_size, args.seed, args.typing, args.worker_output)
+        return
+    if args.generate:
+        if not args.home:
+            parser.error("--generate 需要同时指定 --home")
+        write_corpus(args.generate, args.seed, args.home)
+        return
+
+    runs = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"测量 {size} 条…", flush=True)
+        run = run_size(size, args)
+        if run is None:
+            print(f"{size} 条：子进程失败或超时")
+            continue
+        runs.append(run)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("platform") != sys.platform or baseline.get("python") != sys.version.split()[0]:
+            print(f"注意：基线来自 {baseline.get('platform')} / Python {baseline.get('python')}，"
+                  f"与本机不同，绝对耗时不可直接比较")
+    print_report(runs, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "platform": sys.platform,
+                "python": sys.version.split()[0],
+                "commit": _git_commit(here),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seed": args.seed,
+                "typing": args.typing,
+                "runs": runs,
+            }, f, ensure_ascii=False, indent=2)
+
+    failures = check_limits(runs, args, baseline)
+    for line in failures:
+        print(line)
+    sys.exit(0 if runs and not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
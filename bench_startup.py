@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+FastType 启动耗时基准：多次冷启动 FastType，统计“托盘出现”和“首次弹窗”的耗时。
+
+每次启动都带上 --startup-probe，由程序自己在各阶段打点并写出 JSON；
+起点是本脚本启动子进程之前的时间，所以包含解释器启动、导入和（打包版的）解压时间。
+
+用法：
+    python bench_startup.py                        # 测 main.py，默认 10 次
+    python bench_startup.py --exe dist/FastType.exe -n 20
+    python bench_startup.py --home ./bench_home --output bench_startup.json
+    python bench_startup.py --max-tray-ms 800 --max-popup-ms 1500   # 超出阈值时退出码为 1
+
+Linux 无显示环境：QT_QPA_PLATFORM=offscreen python bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ("tray_shown", "window_created", "snippets_loaded", "first_popup")
+
+
+def run_once(cmd, env, timeout):
+    fd, probe_path = tempfile.mkstemp(prefix="fasttype-probe-", suffix=".json")
+    os.close(fd)
+    try:
+        env = dict(env, FASTTYPE_PROBE_T0=repr(time.time()))
+        subprocess.run(
+            cmd + ["--startup-probe", probe_path],
+            env=env,
+            timeout=timeout,
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        with open(probe_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        os.remove(probe_path)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(runs):
+    summary = {}
+    for stage in STAGES:
+        values = [r[stage] for r in runs if stage in r]
+        if not values:
+            continue
+        summary[stage] = {
+            "min": min(values),
+            "median": round(statistics.median(values), 2),
+            "p95": percentile(values, 95),
+            "max": max(values),
+        }
+    return summary
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="FastType 冷启动耗时基准")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="启动次数（默认 10）")
+    parser.add_argument("--exe", help="测打包后的可执行文件，不指定则测 main.py")
+    parser.add_argument("--home", help="用该目录作为用户目录（片段数据取自其中的 .fasttype）")
+    parser.add_argument("--timeout", type=float, default=60, help="单次启动超时秒数")
+    parser.add_argument("--output", help="把每次结果和汇总写入该 JSON 文件")
+    parser.add_argument("--max-tray-ms", type=float, help="托盘出现耗时中位数上限")
+    parser.add_argument("--max-popup-ms", type=float, help="首次弹窗耗时中位数上限")
+    args = parser.parse_args()
+
+    cmd = [args.exe] if args.exe else [sys.executable, os.path.join(here, "main.py")]
+    env = dict(os.environ)
+    if args.home:
+        home = os.path.abspath(args.home)
+        env["HOME"] = home
+        env["USERPROFILE"] = home
+
+    runs = []
+    for i in range(args.runs):
+        result = run_once(cmd, env, args.timeout)
+        if result is None:
+            print(f"第 {i + 1} 次启动未得到结果（超时或异常退出）")
+            continue
+        runs.append(result)
+        print(f"第 {i + 1} 次：" + "  ".join(f"{k}={result[k]}ms" for k in STAGES if k in result))
+
+    summary = summarize(runs)
+    print()
+    print(f"{'阶段':<16}{'min':>10}{'median':>10}{'p95':>10}{'max':>10}")
+    for stage, st in summary.items():
+        print(f"{stage:<16}{st['min']:>10}{st['median']:>10}{st['p95']:>10}{st['max']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "command": cmd,
+                "platform": sys.platform,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "runs": runs,
+                "summary": summary,
+            }, f, ensure_ascii=False, indent=2)
+
+    failed = not runs
+    for stage, limit in (("tray_shown", args.max_tray_ms), ("first_popup", args.max_popup_ms)):
+        if limit is not None and stage in summary and summary[stage]["median"] > limit:
+            print(f"{stage} 中位数 {summary[stage]['median']}ms 超过上限 {limit}ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+FastType 命令行客户端：连接正在运行的 FastType（托盘进程），用它已加载的片段索引查询、取内容或粘贴。
+
+不导入 PyQt，只用标准库，几毫秒内返回，适合 Shell 脚本和 Rofi、PowerToys Run 等启动器调用。
+
+用法：
+    python fasttype_cli.py search 邮箱                # 每行：id<Tab>标题<Tab>内容预览
+    python fasttype_cli.py search slyx --fuzzy -n 5
+    python fasttype_cli.py search "" --json           # 空查询：常用片段在前
+    python fasttype_cli.py get 12                     # 输出片段内容
+    python fasttype_cli.py paste 12                   # 粘贴到当前前台窗口
+    python fasttype_cli.py show                       # 调出搜索窗口
+
+FastType 未运行时退出码为 2。
+"""
+import argparse
+import getpass
+import json
+import os
+import re
+import socket
+import sys
+
+IPC_PIPE_PREFIX = "FastType-"
+IPC_SOCKET_FILE = "fasttype.sock"
+
+
+def get_ipc_address() -> str:
+    """与 main.get_ipc_name() 相同的计算（这里不导入 main，避免加载 PyQt）。"""
+    if sys.platform == "win32":
+        return r"\\.\pipe" + "\\" + IPC_PIPE_PREFIX + re.sub(r"[^\w.-]", "_", getpass.getuser())
+    return os.path.join(os.path.expanduser("~"), ".fasttype", IPC_SOCKET_FILE)
+
+
+def request(payload: dict, timeout: float = 5.0) -> dict:
+    line = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+    address = get_ipc_address()
+    if sys.platform == "win32":
+        with open(address, "r+b", buffering=0) as pipe:
+            pipe.write(line)
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = pipe.read(65536)
+                if not chunk:
+                    break
+                data += chunk
+    else:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(line)
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+    return json.loads(data.decode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FastType 命令行客户端（需要 FastType 正在运行）")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_search = sub.add_parser("search", help="搜索片段")
+    p_search.add_argument("query", nargs="?", default="")
+    p_search.add_argument("--fuzzy", action="store_true", help="模糊搜索")
+    p_search.add_argument("-n", "--limit", type=int, default=20, help="最多返回条数（默认 20）")
+    p_search.add_argument("--json", action="store_true", help="输出 JSON")
+    p_get = sub.add_parser("get", help="输出片段内容")
+    p_get.add_argument("id")
+    p_paste = sub.add_parser("paste", help="把片段粘贴到当前前台窗口")
+    p_paste.add_argument("id")
+    sub.add_parser("show", help="调出搜索窗口")
+    sub.add_parser("ping", help="检查 FastType 是否在运行")
+    args = parser.parse_args()
+
+    payload = {"cmd": args.cmd}
+    if args.cmd == "search":
+        payload.update(query=args.query, limit=args.limit, mode="fuzzy" if args.fuzzy else "substring")
+    elif args.cmd in ("get", "paste"):
+        payload["id"] = args.id
+
+    try:
+        response = request(payload)
+    except (OSError, ValueError) as e:
+        print(f"无法连接 FastType（是否已启动？）：{e}", file=sys.stderr)
+        sys.exit(2)
+    if not response.get("ok"):
+        print(response.get("error", "请求失败"), file=sys.stderr)
+        sys.exit(1)
+
+    if args.cmd == "search":
+        if args.json:
+            print(json.dumps(response["results"], ensure_ascii=False, indent=2))
+        else:
+            for item in response["results"]:
+                print(f"{item['id']}\t{item['title']}\t{item['preview']}")
+    elif args.cmd == "get":
+        sys.stdout.write(response["snippet"]["content"])
+    elif args.cmd == "ping":
+        print(f"FastType 正在运行（pid {response.get('pid')}）")
+
+
+if __name__ == "__main__":
+    main()
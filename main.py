@@ -3,16 +3,28 @@
 FastType - 快捷键调出，搜索常用文本后回车粘贴到当前焦点。
 Python + PyQt5 方案，可直接向系统发送按键，无沙箱限制。
 """
+import array
+import bisect
+import functools
+import getpass
+import heapq
+import html
 import json
+import math
 import os
 import re
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import ctypes
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
 
-import keyboard
-import pyperclip
+# 启动计时起点（--startup-probe 未提供 FASTTYPE_PROBE_T0 时使用）
+_PROCESS_T0 = time.time()
 
 # Windows: 保存/恢复“按快捷键前获得焦点的窗口”，以及原生全局热键
 if sys.platform == "win32":
@@ -21,10 +33,9 @@ if sys.platform == "win32":
     HWND_TOPMOST = -1
     SWP_NOMOVE = 0x0002
     SWP_NOSIZE = 0x0001
-    MOD_ALT = 0x0001
-    VK_Q = 0x51
+    MOD_NOREPEAT = 0x4000
     WM_HOTKEY = 0x0312
-    HOTKEY_ID = 1
+    VK_MODIFIERS = (0x10, 0x11, 0x12, 0x5B, 0x5C)  # Shift、Ctrl、Alt、左右 Win
 
     def get_foreground_hwnd():
         return user32.GetForegroundWindow()
@@ -56,40 +67,184 @@ if sys.platform == "win32":
         else:
             user32.SetForegroundWindow(our_hwnd)
 
-    def register_native_hotkey(hwnd):
-        """用 Windows RegisterHotKey 注册 Alt+Q，比 keyboard 钩子更稳定。"""
-        return user32.RegisterHotKey(hwnd, HOTKEY_ID, MOD_ALT, VK_Q)
+    def register_native_hotkey(hwnd, hotkey_id, modifiers, vk):
+        """用 Windows RegisterHotKey 注册热键，比 keyboard 钩子更稳定；按住不放不重复触发。"""
+        return user32.RegisterHotKey(hwnd, hotkey_id, modifiers | MOD_NOREPEAT, vk)
 
-    def unregister_native_hotkey(hwnd):
-        user32.UnregisterHotKey(hwnd, HOTKEY_ID)
+    def unregister_native_hotkey(hwnd, hotkey_id):
+        user32.UnregisterHotKey(hwnd, hotkey_id)
+
+    def modifier_keys_down():
+        return any(user32.GetAsyncKeyState(vk) & 0x8000 for vk in VK_MODIFIERS)
 
     GA_ROOT = 2
 
-    def is_xshell_window(hwnd):
-        """判断窗口是否属于 Xshell（Xshell 使用 Ctrl+Shift+V 粘贴）。"""
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    SYNCHRONIZE = 0x00100000
+    WAIT_OBJECT_0 = 0
+
+    def _root_window(hwnd):
+        return user32.GetAncestor(hwnd, GA_ROOT) or hwnd
+
+    def get_window_pid(hwnd):
+        """窗口所属进程 ID（只调 GetWindowThreadProcessId，很便宜），窗口无效时返回 None。"""
         if not hwnd or not user32.IsWindow(hwnd):
-            return False
-        root = user32.GetAncestor(hwnd, GA_ROOT) or hwnd
-        buf = ctypes.create_unicode_buffer(260)
-        if user32.GetWindowTextW(root, buf, 260) and "xshell" in buf.value.lower():
-            return True
+            return None
         pid = ctypes.c_ulong()
-        user32.GetWindowThreadProcessId(root, ctypes.byref(pid))
-        if not pid.value:
+        user32.GetWindowThreadProcessId(_root_window(hwnd), ctypes.byref(pid))
+        return pid.value or None
+
+    def get_window_class(hwnd):
+        buf = ctypes.create_unicode_buffer(256)
+        if hwnd and user32.GetClassNameW(_root_window(hwnd), buf, 256):
+            return buf.value
+        return ""
+
+    def get_window_title(hwnd):
+        buf = ctypes.create_unicode_buffer(260)
+        if hwnd and user32.GetWindowTextW(_root_window(hwnd), buf, 260):
+            return buf.value
+        return ""
+
+    def open_process(pid):
+        """打开进程句柄（可查询映像名、可等待退出），失败返回 None。"""
+        return kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION | SYNCHRONIZE, False, pid) or None
+
+    def process_image_name(handle):
+        """进程映像名（小写，如 "xshell.exe"），取不到时返回空串。"""
+        size = ctypes.c_ulong(260)
+        path_buf = ctypes.create_unicode_buffer(260)
+        if kernel32.QueryFullProcessImageNameW(handle, 0, path_buf, ctypes.byref(size)):
+            return os.path.basename(path_buf.value).lower()
+        return ""
+
+    def process_exited(handle):
+        return kernel32.WaitForSingleObject(handle, 0) == WAIT_OBJECT_0
+
+    def close_process(handle):
+        kernel32.CloseHandle(handle)
+
+    # 剪贴板：用独立的 WinDLL 实例设置 argtypes，避免影响其他模块对 windll.user32 的调用
+    CF_UNICODETEXT = 13
+    GMEM_MOVEABLE = 0x0002
+    WM_RENDERFORMAT = 0x0305
+    WM_RENDERALLFORMATS = 0x0306
+    _cb_user32 = ctypes.WinDLL("user32")
+    _cb_kernel32 = ctypes.WinDLL("kernel32")
+    _cb_user32.OpenClipboard.argtypes = [ctypes.c_void_p]
+    _cb_user32.GetOpenClipboardWindow.restype = ctypes.c_void_p
+    _cb_user32.GetClipboardOwner.restype = ctypes.c_void_p
+    _cb_user32.GetClipboardSequenceNumber.restype = ctypes.c_ulong
+    _cb_user32.SetClipboardData.argtypes = [ctypes.c_uint, ctypes.c_void_p]
+    _cb_user32.SetClipboardData.restype = ctypes.c_void_p
+    _cb_kernel32.GlobalAlloc.argtypes = [ctypes.c_uint, ctypes.c_size_t]
+    _cb_kernel32.GlobalAlloc.restype = ctypes.c_void_p
+    _cb_kernel32.GlobalLock.argtypes = [ctypes.c_void_p]
+    _cb_kernel32.GlobalLock.restype = ctypes.c_void_p
+    _cb_kernel32.GlobalUnlock.argtypes = [ctypes.c_void_p]
+    _cb_kernel32.GlobalFree.argtypes = [ctypes.c_void_p]
+
+    def get_clipboard_sequence():
+        return _cb_user32.GetClipboardSequenceNumber()
+
+    def clipboard_is_open():
+        return bool(_cb_user32.GetOpenClipboardWindow())
+
+    def offer_clipboard_text(hwnd):
+        """延迟渲染：只声明剪贴板里有文本，目标真正读取时 hwnd 才会收到 WM_RENDERFORMAT。"""
+        for _ in range(10):
+            if _cb_user32.OpenClipboard(hwnd):
+                break
+            time.sleep(0.005)
+        else:
             return False
-        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
-        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        try:
+            _cb_user32.EmptyClipboard()
+            _cb_user32.SetClipboardData(CF_UNICODETEXT, None)
+        finally:
+            _cb_user32.CloseClipboard()
+        return True
+
+    def render_clipboard_text(text):
+        """处理 WM_RENDERFORMAT：此时剪贴板已由读取方打开，直接放入文本。"""
+        data = (text + "\0").encode("utf-16-le")
+        handle = _cb_kernel32.GlobalAlloc(GMEM_MOVEABLE, len(data))
         if not handle:
-            return False
+            return
+        ptr = _cb_kernel32.GlobalLock(handle)
+        if not ptr:
+            _cb_kernel32.GlobalFree(handle)
+            return
+        ctypes.memmove(ptr, data, len(data))
+        _cb_kernel32.GlobalUnlock(handle)
+        if not _cb_user32.SetClipboardData(CF_UNICODETEXT, handle):
+            _cb_kernel32.GlobalFree(handle)
+
+    # 逐字键入：SendInput 批量发送 KEYEVENTF_UNICODE 事件
+    INPUT_KEYBOARD = 1
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+    VK_RETURN = 0x0D
+    VK_ESCAPE = 0x1B
+
+    class _KEYBDINPUT(ctypes.Structure):
+        _fields_ = [
+            ("wVk", ctypes.c_ushort),
+            ("wScan", ctypes.c_ushort),
+            ("dwFlags", ctypes.c_ulong),
+            ("time", ctypes.c_ulong),
+            ("dwExtraInfo", ctypes.c_size_t),
+        ]
+
+    class _MOUSEINPUT(ctypes.Structure):
+        _fields_ = [
+            ("dx", ctypes.c_long),
+            ("dy", ctypes.c_long),
+            ("mouseData", ctypes.c_ulong),
+            ("dwFlags", ctypes.c_ulong),
+            ("time", ctypes.c_ulong),
+            ("dwExtraInfo", ctypes.c_size_t),
+        ]
+
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [("ki", _KEYBDINPUT), ("mi", _MOUSEINPUT)]
+
+    class _INPUT(ctypes.Structure):
+        _fields_ = [("type", ctypes.c_ulong), ("u", _INPUTUNION)]
+
+    def send_unicode_text(text):
+        """一次 SendInput 发送整段文本（每个 UTF-16 单元一对按下/抬起），换行按回车键发送。"""
+        events = []
+        for ch in text:
+            if ch == "\n":
+                events.append((VK_RETURN, 0, 0))
+                events.append((VK_RETURN, 0, KEYEVENTF_KEYUP))
+                continue
+            data = ch.encode("utf-16-le")
+            for i in range(0, len(data), 2):
+                unit = int.from_bytes(data[i:i + 2], "little")
+                events.append((0, unit, KEYEVENTF_UNICODE))
+                events.append((0, unit, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP))
+        inputs = (_INPUT * len(events))()
+        for item, (vk, scan, flags) in zip(inputs, events):
+            item.type = INPUT_KEYBOARD
+            item.u.ki.wVk = vk
+            item.u.ki.wScan = scan
+            item.u.ki.dwFlags = flags
+        return user32.SendInput(len(events), inputs, ctypes.sizeof(_INPUT))
+
+    def escape_pressed():
+        return bool(user32.GetAsyncKeyState(VK_ESCAPE) & 0x8000)
+
+    def render_all_clipboard_text(hwnd, text):
+        """处理 WM_RENDERALLFORMATS（窗口销毁前仍持有剪贴板）：需自己打开剪贴板再放入。"""
+        if not _cb_user32.OpenClipboard(hwnd):
+            return
         try:
-            size = ctypes.c_ulong(ctypes.sizeof(ctypes.c_wchar) * 260)
-            path_buf = ctypes.create_unicode_buffer(260)
-            if kernel32.QueryFullProcessImageNameW(handle, 0, path_buf, ctypes.byref(size)):
-                path = path_buf.value.lower()
-                return "xshell.exe" in path or "xshellex.exe" in path
+            if _cb_user32.GetClipboardOwner() == hwnd:
+                render_clipboard_text(text)
         finally:
-            kernel32.CloseHandle(handle)
-        return False
+            _cb_user32.CloseClipboard()
 
     class _MSG(ctypes.Structure):
         _fields_ = [
@@ -108,7 +263,34 @@ else:
     def set_foreground_hwnd(hwnd):
         pass
 
-    def is_xshell_window(hwnd):
+    def get_window_pid(hwnd):
+        return None
+
+    def get_window_class(hwnd):
+        return ""
+
+    def get_window_title(hwnd):
+        return ""
+
+    def open_process(pid):
+        return None
+
+    def process_image_name(handle):
+        return ""
+
+    def process_exited(handle):
+        return True
+
+    def close_process(handle):
+        pass
+
+    def get_clipboard_sequence():
+        return None
+
+    def clipboard_is_open():
+        return False
+
+    def offer_clipboard_text(hwnd):
         return False
 
     def _set_window_topmost(widget, on_top=True):
@@ -117,16 +299,36 @@ else:
     def _force_our_window_foreground(widget):
         pass
 
-    def register_native_hotkey(hwnd):
+    def register_native_hotkey(hwnd, hotkey_id, modifiers, vk):
         return False
 
-    def unregister_native_hotkey(hwnd):
+    def unregister_native_hotkey(hwnd, hotkey_id):
         pass
 
+    def modifier_keys_down():
+        try:
+            import keyboard
+            return any(keyboard.is_pressed(name) for name in ("ctrl", "alt", "shift", "windows"))
+        except Exception:
+            return False
+
     _MSG = None
 
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import (
+    Qt,
+    QItemSelectionModel,
+    QTimer,
+    QAbstractTableModel,
+    QModelIndex,
+    QObject,
+    QThread,
+    QFileSystemWatcher,
+    QMimeData,
+    QByteArray,
+    pyqtSignal,
+    pyqtSlot,
+)
+from PyQt5.QtGui import QIcon, QColor, QTextCharFormat, QTextCursor
 from PyQt5.QtWidgets import (
     QApplication,
     QWidget,
@@ -143,19 +345,42 @@ from PyQt5.QtWidgets import (
     QAction,
     QStyle,
     QDialog,
-    QTableWidget,
-    QTableWidgetItem,
+    QTableView,
     QHeaderView,
+    QSplitter,
+    QTextEdit,
     QPlainTextEdit,
     QFormLayout,
     QMessageBox,
+    QInputDialog,
+    QComboBox,
+    QFileDialog,
+    QProgressBar,
     QDialogButtonBox,
     QStyledItemDelegate,
     QStyleOptionViewItem,
 )
 
 SNIPPETS_FILE = "snippets.json"
+SQLITE_FILE = "snippets.db"
+CONFIG_FILE = "config.json"
 HOTKEY = "alt+q"
+# config.json "hotkeys" 中每个热键的动作：打开（可限定范围的）搜索窗口，或不弹窗直接粘贴某条片段
+HOTKEY_SEARCH = "search"
+HOTKEY_PASTE = "paste"
+HOTKEY_ID_BASE = 1
+# 直接粘贴的热键：等组合键里的 Ctrl/Alt 等松开再发送粘贴键，最多等这么久
+HOTKEY_RELEASE_TIMEOUT_MS = 1000
+# RegisterHotKey 的修饰键位和虚拟键码
+_HOTKEY_MODIFIERS = {"alt": 0x0001, "ctrl": 0x0002, "control": 0x0002, "shift": 0x0004, "win": 0x0008, "windows": 0x0008}
+_HOTKEY_KEYS = {
+    "space": 0x20, "tab": 0x09, "enter": 0x0D, "return": 0x0D, "esc": 0x1B, "escape": 0x1B,
+    "backspace": 0x08, "insert": 0x2D, "delete": 0x2E, "home": 0x24, "end": 0x23,
+    "page up": 0x21, "pageup": 0x21, "page down": 0x22, "pagedown": 0x22,
+    "left": 0x25, "up": 0x26, "right": 0x27, "down": 0x28,
+    ";": 0xBA, "=": 0xBB, ",": 0xBC, "-": 0xBD, ".": 0xBE, "/": 0xBF, "`": 0xC0,
+    "[": 0xDB, "\\": 0xDC, "]": 0xDD, "'": 0xDE,
+}
 # Logo 放这里：项目根目录下 build/icon.ico（或 build/icon.png）
 # 打包后 PyInstaller 解压到 sys._MEIPASS，图标从该目录读
 _APP_DIR = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
@@ -176,8 +401,103 @@ PASTE_DELAY_AFTER_FOCUS_MS = 180
 PASTE_DELAY_AFTER_FOCUS_XSHELL_MS = 350  # Xshell 等终端需要更长时间才能接收按键
 # 发送 Ctrl+V 后等目标应用读完剪贴板再恢复，否则会贴成旧内容
 PASTE_DELAY_BEFORE_RESTORE_CLIP_MS = 250
-# 首次弹出后多次尝试把焦点放到搜索框
-FOCUS_SEARCH_DELAYS_MS = (50, 120, 220)
+# 以上固定延迟现在只是上限：实际按轮询到的条件提前继续，并按目标程序学习等待时间
+PASTE_POLL_MS = 5
+PASTE_SETTLE_MIN_MS = 10
+PASTE_SETTLE_SHRINK = 0.7
+PASTE_TIMING_FILE = "paste_timing.json"
+
+# 按目标程序选择粘贴方式（规则在片段目录的 paste_strategies.json，可自行增改）
+PASTE_STRATEGY_FILE = "paste_strategies.json"
+PASTE_CTRL_V = "ctrl+v"
+PASTE_CTRL_SHIFT_V = "ctrl+shift+v"
+PASTE_SHIFT_INSERT = "shift+insert"
+PASTE_TYPEWRITER = "typewriter"
+PASTE_BRACKETED = "bracketed"
+PASTE_METHODS = (PASTE_CTRL_V, PASTE_CTRL_SHIFT_V, PASTE_SHIFT_INSERT, PASTE_TYPEWRITER, PASTE_BRACKETED)
+PASTE_TARGET_CACHE = 64
+
+# 批量粘贴：条目之间按的分隔键（按键名, 逐字键入时用的字符）
+BATCH_SEPARATOR_TAB = "tab"
+BATCH_SEPARATOR_ENTER = "enter"
+BATCH_SEPARATOR_NONE = "none"
+BATCH_SEPARATORS = {
+    BATCH_SEPARATOR_TAB: ("tab", "\t"),
+    BATCH_SEPARATOR_ENTER: ("enter", "\n"),
+    BATCH_SEPARATOR_NONE: (None, ""),
+}
+BATCH_SEPARATOR_LABELS = {BATCH_SEPARATOR_TAB: "Tab", BATCH_SEPARATOR_ENTER: "回车", BATCH_SEPARATOR_NONE: "无"}
+# 预览区：选择停留这么久才读取未缓存的长内容；最多显示这么多字符，每次向控件填入一块；
+# 预读当前行上下各这么多行；缓存最近这么多条；最多高亮这么多处匹配
+PREVIEW_SETTLE_MS = 60
+PREVIEW_MAX_CHARS = 256 * 1024
+PREVIEW_CHUNK_CHARS = 8192
+PREVIEW_PREFETCH_ROWS = 2
+PREVIEW_CACHE = 32
+PREVIEW_MAX_HIGHLIGHTS = 200
+# 弹出后等窗口真正被激活再把焦点放到搜索框；这么久仍未激活时再抢一次前台，到 GIVE_UP 仍不行记为超时
+FOCUS_ACQUIRE_TIMEOUT_MS = 150
+FOCUS_GIVE_UP_MS = 400
+# 窗口隐藏或数据变化后过这么久（避开粘贴过程）在后台把窗口恢复到就绪状态
+READY_STATE_DELAY_MS = 500
+# 搜索模式：包含（子串，按文件顺序）/ 模糊（子序列打分，按相关度排序）
+SEARCH_MODE_SUBSTRING = "substring"
+SEARCH_MODE_FUZZY = "fuzzy"
+SEARCH_MODE_LABELS = {SEARCH_MODE_SUBSTRING: "包含", SEARCH_MODE_FUZZY: "模糊"}
+# 模糊模式只保留得分最高的前 K 条；内容只扫描前若干字符，控制单次打分耗时
+FUZZY_TOP_K = 200
+FUZZY_CONTENT_SCAN = 4096
+# 模糊模式单次最多给这么多条候选打分（约一帧），超出时先打常用片段和标题命中的，其余按文件顺序截断
+FUZZY_SCORE_LIMIT = 2000
+# 搜索索引常驻内存的小写化内容只保留前这么多字符，更长的部分按需读取；字符倒排表覆盖前 FUZZY_CONTENT_SCAN 个字符
+INDEX_PREFIX_CHARS = 512
+# 不超过这么长的查询词在长内容里只需从前段末尾往前这么多字符处开始找（更前面的已在内存前段里查过）
+INDEX_TAIL_OVERLAP = 64
+# 搜索在后台线程执行：输入停顿这么久才发起查询；每处理这么多条检查一次是否已被新查询取代
+SEARCH_DEBOUNCE_MS = 30
+SEARCH_CANCEL_CHECK_EVERY = 2048
+# 片段文件变化后等这么久再重新加载，合并编辑器保存时的多次写入事件
+STORE_RELOAD_DELAY_MS = 200
+
+# 使用统计：追加写 usage.log，累计到一定条数（或退出时）合并进 usage.json
+USAGE_FILE = "usage.json"
+USAGE_LOG_FILE = "usage.log"
+USAGE_COMPACT_ENTRIES = 200
+FRECENCY_HALF_LIFE_DAYS = 7
+FRECENCY_TOP = 100
+
+# 本机 IPC（单实例 + fasttype_cli.py）：Windows 为命名管道，其他系统为片段目录下的 Unix socket
+IPC_PIPE_PREFIX = "FastType-"
+IPC_SOCKET_FILE = "fasttype.sock"
+IPC_CONNECT_TIMEOUT_MS = 300
+IPC_SEARCH_LIMIT = 20
+# 托盘出现后过这么久再预先导入粘贴用的模块
+STARTUP_PRELOAD_DELAY_MS = 1500
+# 变更日志累计这么多条后合并进 snippets.json
+JOURNAL_COMPACT_ENTRIES = 500
+# 片段存储后端：json（默认，适合小库）/ sqlite（FTS5 全文索引，适合大库）
+STORE_BACKEND_JSON = "json"
+STORE_BACKEND_SQLITE = "sqlite"
+# SQLite 后端：每次从库里取多少行、最多缓存多少行
+SQLITE_PAGE_SIZE = 256
+SQLITE_ROW_CACHE = 4096
+# 超过这么多字符的内容不常驻内存，放到 mmap 的临时文件（或数据库）里按需读取
+SNIPPET_INLINE_CONTENT_CHARS = 512
+
+# 导入/导出格式：JSON Lines（每行一个片段对象）、CSV（表头含 title/content）、文本文件目录（每个文件一条）
+TRANSFER_JSONL = "jsonl"
+TRANSFER_CSV = "csv"
+TRANSFER_DIR = "dir"
+TRANSFER_TEXT_SUFFIXES = (".txt", ".md", ".text")
+TRANSFER_FILENAME_CHARS = 80
+
+# 逐字键入：每块字符数和块间间隔（config.json 的 typewriter_chunk_chars / typewriter_interval_ms 可覆盖）
+TYPEWRITER_CHUNK_CHARS = 64
+TYPEWRITER_INTERVAL_MS = 8
+
+# 延迟追踪（默认关闭，config.json 中 "trace": true 或环境变量 FASTTYPE_TRACE=1 开启）
+TRACE_FILE = "latency.jsonl"
+TRACE_WINDOW = 500
 
 
 def get_snippets_path() -> str:
@@ -186,19 +506,143 @@ def get_snippets_path() -> str:
     return os.path.join(base, SNIPPETS_FILE)
 
 
-def load_snippets() -> list:
-    path = get_snippets_path()
+def get_journal_path(path: str = None) -> str:
+    """片段变更日志：snippets.json 旁的 snippets.journal，每行一条 put/delete 记录。"""
+    path = path or get_snippets_path()
+    return os.path.splitext(path)[0] + ".journal"
+
+
+def _fsync_dir(path: str) -> None:
+    """rename 之后同步目录项（仅 POSIX 支持对目录 fsync）。"""
+    if sys.platform == "win32":
+        return
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write_json(path: str, data) -> None:
+    """先写临时文件并 fsync，再 rename 覆盖，任何时刻崩溃都不会留下写了一半的文件。"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _read_journal(journal_path: str) -> list:
+    """读出日志中的完整记录；末尾写了一半的行（崩溃）直接忽略。"""
+    entries = []
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+    except OSError:
+        pass
+    return entries
+
+
+def _apply_journal(snippets: list, entries: list) -> list:
+    """按顺序重放日志：put 按 id 原位替换或追加，delete 按 id 删除（可重复执行）。"""
+    pos = {s.get("id"): i for i, s in enumerate(snippets)}
+    removed = False
+    for e in entries:
+        op = e.get("op")
+        if op == "put" and isinstance(e.get("snippet"), dict):
+            s = e["snippet"]
+            i = pos.get(s.get("id"))
+            if i is None:
+                pos[s.get("id")] = len(snippets)
+                snippets.append(s)
+            else:
+                snippets[i] = s
+        elif op == "delete":
+            i = pos.pop(e.get("id"), None)
+            if i is not None:
+                snippets[i] = None
+                removed = True
+    if removed:
+        snippets = [s for s in snippets if s is not None]
+    return snippets
+
+
+def load_snippets(path: str = None, defaults: bool = True) -> list:
+    """读取片段文件并重放变更日志；文件不存在或损坏时返回示例片段（defaults 为假时返回空列表）。"""
+    path = path or get_snippets_path()
     try:
         with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+            snippets = json.load(f)
     except Exception:
-        return get_default_snippets()
+        snippets = get_default_snippets() if defaults else []
+    entries = _read_journal(get_journal_path(path))
+    if entries:
+        snippets = _apply_journal(snippets, entries)
+    return snippets
 
 
-def save_snippets(snippets: list) -> None:
-    path = get_snippets_path()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(snippets, f, ensure_ascii=False, indent=2)
+def save_snippets(snippets: list, path: str = None) -> None:
+    """整体写入 snippets.json（原子替换），并清空已合并进来的变更日志。"""
+    path = path or get_snippets_path()
+    _atomic_write_json(path, snippets)
+    journal = get_journal_path(path)
+    if os.path.exists(journal):
+        os.remove(journal)
+
+
+def append_journal(entry: dict, path: str = None) -> None:
+    """追加一条变更记录并 fsync，单次编辑的写入量与片段库大小无关。"""
+    journal = get_journal_path(path or get_snippets_path())
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def get_config_path() -> str:
+    return os.path.join(os.path.dirname(get_snippets_path()), CONFIG_FILE)
+
+
+def get_default_config() -> dict:
+    return {
+        "search_mode": SEARCH_MODE_SUBSTRING,
+        "store": STORE_BACKEND_JSON,
+        "trace": False,
+        "typewriter_chunk_chars": TYPEWRITER_CHUNK_CHARS,
+        "typewriter_interval_ms": TYPEWRITER_INTERVAL_MS,
+        "batch_separator": BATCH_SEPARATOR_TAB,
+    }
+
+
+def load_config() -> dict:
+    config = get_default_config()
+    try:
+        with open(get_config_path(), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            config.update(data)
+    except Exception:
+        pass
+    return config
+
+
+def save_config(config: dict) -> None:
+    with open(get_config_path(), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
 
 
 def get_default_snippets() -> list:
@@ -208,6 +652,154 @@ def get_default_snippets() -> list:
     ]
 
 
+# 片段模板占位符：{date} {time} {datetime}（可带 strftime 格式，如 {date:%Y%m%d}）、
+# {clipboard}、{input:提示文字}、{snippet:片段id}；其他花括号内容原样保留
+_TEMPLATE_RE = re.compile(r"\{(date|time|datetime|clipboard|input|snippet)(?::([^{}\n]*))?\}")
+_TEMPLATE_TIME_FORMATS = {"date": "%Y-%m-%d", "time": "%H:%M:%S", "datetime": "%Y-%m-%d %H:%M:%S"}
+TEMPLATE_MAX_DEPTH = 8
+
+
+def compile_template(text: str) -> tuple:
+    """把内容编译成渲染计划：文本片段与 (占位符, 参数) 交替排列；没有占位符时返回空元组。"""
+    if "{" not in text:
+        return ()
+    parts = []
+    pos = 0
+    for m in _TEMPLATE_RE.finditer(text):
+        name, arg = m.group(1), m.group(2)
+        if name in ("input", "snippet") and not arg:
+            continue
+        if m.start() > pos:
+            parts.append(text[pos:m.start()])
+        parts.append((name, arg))
+        pos = m.end()
+    if not parts:
+        return ()
+    if pos < len(text):
+        parts.append(text[pos:])
+    return tuple(parts)
+
+
+class _ContentBlob:
+    """长内容的只读存放区：加载时写入匿名临时文件再 mmap，片段只记 (偏移, 字节数)。
+
+    临时文件随对象释放自动删除；读取走操作系统页缓存，不占 Python 堆内存。
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix="fasttype-")
+        self._size = 0
+        self._map = None
+
+    def append(self, text: str):
+        data = text.encode("utf-8")
+        self._file.write(data)
+        key = (self._size, len(data))
+        self._size += len(data)
+        return key
+
+    def seal(self) -> None:
+        """写完后调用，之后才能读取；之后再追加需再次调用（重新映射）。"""
+        import mmap
+        self._file.flush()
+        if self._size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, key) -> str:
+        offset, length = key
+        return self._map[offset:offset + length].decode("utf-8")
+
+    def read_prefix(self, key, chars: int) -> str:
+        """只解码开头约 chars 个字符（UTF-8 每字符最多 4 字节）。"""
+        offset, length = key
+        data = self._map[offset:offset + min(length, chars * 4)]
+        return data.decode("utf-8", errors="ignore")[:chars]
+
+    def find(self, key, data: bytes) -> bool:
+        """该条内容（UTF-8）是否包含 data；在映射上直接查找，不解码、不复制。"""
+        offset, length = key
+        return self._map.find(data, offset, offset + length) >= 0
+
+
+class Snippet:
+    """紧凑的片段记录：__slots__ 对象，标题 intern。
+
+    长内容不常驻内存，由 _blob（_ContentBlob 或 SQLite 库）按 _key 在粘贴/预览时读取；
+    JSON 中除 id/title/content 以外的字段原样保存在 extra 里。
+    """
+
+    __slots__ = ("id", "title", "extra", "_content", "_blob", "_key", "_plan")
+
+    def __init__(self, id=None, title="", content="", blob=None, key=None, extra=None):
+        self.id = id
+        self.title = sys.intern(title) if type(title) is str else ""
+        self.extra = extra
+        self._content = None if blob is not None else content
+        self._blob = blob
+        self._key = key
+        # 模板渲染计划：常驻内存的内容在加载时编译，长内容到第一次粘贴时再编译
+        self._plan = None if blob is not None else compile_template(content)
+
+    @classmethod
+    def from_dict(cls, data: dict, blob=None) -> "Snippet":
+        content = data.get("content", "")
+        if not isinstance(content, str):
+            content = str(content)
+        extra = {k: v for k, v in data.items() if k not in ("id", "title", "content")} or None
+        sid, title = data.get("id"), data.get("title", "")
+        if blob is not None and len(content) > SNIPPET_INLINE_CONTENT_CHARS:
+            return cls(sid, title, blob=blob, key=blob.append(content), extra=extra)
+        return cls(sid, title, content, extra=extra)
+
+    def to_dict(self) -> dict:
+        data = {"id": self.id, "title": self.title, "content": self.content}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def content(self) -> str:
+        if self._content is not None:
+            return self._content
+        return self._blob.read(self._key)
+
+    @content.setter
+    def content(self, text: str) -> None:
+        self._content = text
+        self._blob = None
+        self._key = None
+        self._plan = compile_template(text)
+
+    @property
+    def plan(self) -> tuple:
+        if self._plan is None:
+            self._plan = compile_template(self.content)
+        return self._plan
+
+    @property
+    def content_source(self):
+        """内容存放在外部时返回 (blob, key)，常驻内存时返回 None。"""
+        return None if self._content is not None else (self._blob, self._key)
+
+    def head(self, chars: int) -> str:
+        """内容的前 chars 个字符；长内容只读取这么多。"""
+        if self._content is not None:
+            return self._content[:chars]
+        return self._blob.read_prefix(self._key, chars)
+
+    def preview(self, length: int) -> str:
+        content = self.head(length + 1)
+        return (content[:length] + "…") if len(content) > length else content
+
+
+def _to_records(snippets: list) -> list:
+    """把 load_snippets 得到的字典列表转成 Snippet，长内容写入同一个 _ContentBlob。"""
+    blob = _ContentBlob()
+    records = [Snippet.from_dict(s, blob) for s in snippets if isinstance(s, dict)]
+    blob.seal()
+    return records
+
+
 def filter_snippets(snippets: list, keyword: str) -> list:
     if not keyword or not keyword.strip():
         return snippets
@@ -219,103 +811,2097 @@ def filter_snippets(snippets: list, keyword: str) -> list:
     return [s for s in snippets if r.search(s.get("title", "")) or r.search(s.get("content", ""))]
 
 
+# casefold 后会变成多个字符的字符（ß→ss、ﬁ→fi 等），re.I 不认为它们与展开后的字母相等
+_FOLD_EXPANDING_RE = re.compile(
+    "[\xdf\u0149\u01f0\u0390\u03b0\u0587\u1e96-\u1e9a\u1e9e\u1f50\u1f52\u1f54\u1f56\u1f80-\u1faf"
+    "\u1fb2-\u1fb4\u1fb6\u1fb7\u1fbc\u1fc2-\u1fc4\u1fc6\u1fc7\u1fcc\u1fd2\u1fd3\u1fd6\u1fd7"
+    "\u1fe2-\u1fe4\u1fe6\u1fe7\u1ff2-\u1ff4\u1ff6\u1ff7\u1ffc\ufb00-\ufb06\ufb13-\ufb17]"
+)
+_FOLD_DOTLESS = str.maketrans({"\u0131": "i", "\u0130": "i"})
+
+
+def _fold(text: str) -> str:
+    """搜索用的大小写归一化：casefold，另把 ı/İ 归为 i。
+
+    re.I 视为等价的字符折叠后相同，反之亦然；只有 _FOLD_EXPANDING_RE 中的字符折叠后变长，
+    查询或片段含这些字符时需用 re.I 复核（见 SnippetIndex.search）。
+    """
+    if "\u0131" in text or "\u0130" in text:
+        text = text.translate(_FOLD_DOTLESS)
+    return text.casefold()
+
+
+# GB2312 一级汉字按拼音排序，每个声母区间的起始编码（无 i/u/v 开头的音节）
+_PINYIN_INITIAL_CODES = (
+    (0xB0A1, "a"), (0xB0C5, "b"), (0xB2C1, "c"), (0xB4EE, "d"), (0xB6EA, "e"),
+    (0xB7A2, "f"), (0xB8C1, "g"), (0xB9FE, "h"), (0xBBF7, "j"), (0xBFA6, "k"),
+    (0xC0AC, "l"), (0xC2E8, "m"), (0xC4C3, "n"), (0xC5B6, "o"), (0xC5BE, "p"),
+    (0xC6DA, "q"), (0xC8BB, "r"), (0xC8F6, "s"), (0xCBFA, "t"), (0xCDDA, "w"),
+    (0xCEF4, "x"), (0xD1B9, "y"), (0xD4D1, "z"),
+)
+_PINYIN_CODE_KEYS = [code for code, _ in _PINYIN_INITIAL_CODES]
+_PINYIN_LAST_CODE = 0xD7F9
+
+
+def _pinyin_initial(ch: str) -> str:
+    """常用汉字的拼音首字母（不依赖第三方库）；非汉字或生僻字返回空串。"""
+    try:
+        raw = ch.encode("gb2312")
+    except UnicodeEncodeError:
+        return ""
+    if len(raw) != 2:
+        return ""
+    code = raw[0] << 8 | raw[1]
+    if code < _PINYIN_CODE_KEYS[0] or code > _PINYIN_LAST_CODE:
+        return ""
+    return _PINYIN_INITIAL_CODES[bisect.bisect_right(_PINYIN_CODE_KEYS, code) - 1][1]
+
+
+def _title_initials(title: str) -> str:
+    """标题的首字母串：汉字取拼音首字母，字母数字原样保留，如“示例：邮箱”→“slyx”。"""
+    out = []
+    for ch in title:
+        if ch.isascii():
+            if ch.isalnum():
+                out.append(ch)
+        else:
+            out.append(_pinyin_initial(ch))
+    return "".join(out)
+
+
+_SCORE_MATCH = 16
+_BONUS_BOUNDARY = 8
+_BONUS_CONSECUTIVE = 6
+_BONUS_EXACT = 12
+_PENALTY_GAP_START = 3
+_PENALTY_GAP_EXTENSION = 1
+_PENALTY_GAP_MAX = 15
+
+
+def _fuzzy_positions(needle: str, text: str):
+    """needle 是 text 的子序列时返回匹配位置列表，否则 None。
+
+    先正向找到最早的结束位置，再反向收缩出更紧凑的匹配。
+    """
+    i = -1
+    for ch in needle:
+        i = text.find(ch, i + 1)
+        if i < 0:
+            return None
+    positions = []
+    j = i + 1
+    for ch in reversed(needle):
+        j = text.rfind(ch, 0, j)
+        positions.append(j)
+    positions.reverse()
+    return positions
+
+
+def _fuzzy_score(needle: str, text: str):
+    """fzf 风格打分：连续命中、词首命中加分，间隔扣分；不匹配返回 None。"""
+    n = len(needle)
+    start = text.find(needle)
+    if start >= 0:
+        # 连续子串命中：不必逐位置计算，直接按公式给分
+        score = n * _SCORE_MATCH + (n - 1) * _BONUS_CONSECUTIVE + _BONUS_EXACT
+        if start == 0 or not text[start - 1].isalnum():
+            score += _BONUS_BOUNDARY * 2
+        for k in range(1, n):
+            if not needle[k - 1].isalnum():
+                score += _BONUS_BOUNDARY
+        return score - min(start // 8, 10)
+    positions = _fuzzy_positions(needle, text)
+    if positions is None:
+        return None
+    score = 0
+    prev = -1
+    for k, p in enumerate(positions):
+        score += _SCORE_MATCH
+        if p == 0 or not text[p - 1].isalnum():
+            score += _BONUS_BOUNDARY * (2 if k == 0 else 1)
+        if k and p == prev + 1:
+            score += _BONUS_CONSECUTIVE
+        elif k:
+            gap = p - prev - 1
+            score -= min(_PENALTY_GAP_MAX, _PENALTY_GAP_START + (gap - 1) * _PENALTY_GAP_EXTENSION)
+        prev = p
+    # 起点越靠后略微扣分
+    return score - min(positions[0] // 8, 10)
+
+
+def _score_terms(terms, title: str, initials: str, content_prefix):
+    """多个搜索词的总分：每个词取标题/首字母命中（权重 2）或内容前段命中，任一词不中返回 None。
+
+    content_prefix 是返回内容前段（已小写）的函数，只有标题不中时才调用，避免读取长内容。
+    """
+    total = 0
+    content = None
+    for term in terms:
+        best = _fuzzy_score(term, title)
+        sc = _fuzzy_score(term, initials)
+        if sc is not None and (best is None or sc > best):
+            best = sc
+        if best is not None:
+            best *= 2
+        else:
+            if content is None:
+                content = content_prefix()[:FUZZY_CONTENT_SCAN]
+            best = _fuzzy_score(term, content)
+            if best is None:
+                return None
+        total += best
+    return total
+
+
+def _usage_bonus(entry, now: float) -> float:
+    """使用频率（对数）+ 最近使用（按周衰减）带来的加分，entry 为 (次数, 最近时间戳)。"""
+    if not entry:
+        return 0.0
+    count, last_used = entry
+    age_weeks = max(0.0, now - last_used) / (7 * 86400)
+    return 8 * math.log2(1 + count) + 24 * 0.5 ** age_weeks
+
+
+class _QueryCache:
+    """最近查询 -> 命中文档号列表 的小型 LRU，用于边输入边收窄搜索。"""
+
+    def __init__(self, capacity: int = 32):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get(self, needle: str):
+        docs = self._entries.get(needle)
+        if docs is not None:
+            self._entries.move_to_end(needle)
+        return docs
+
+    def best_base(self, needle: str):
+        """找出作为 needle 子串、命中数最少的已缓存查询的结果；没有则返回 None。
+
+        新查询包含旧查询时，新结果一定是旧结果的子集，只需在旧结果里过滤。
+        """
+        best = None
+        for key, docs in self._entries.items():
+            if key in needle and (best is None or len(docs) < len(best)):
+                best = docs
+        return best
+
+    def put(self, needle: str, docs: list) -> None:
+        self._entries[needle] = docs
+        self._entries.move_to_end(needle)
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+
+
+def _locked(method):
+    """在 self._lock 内执行：索引会被后台搜索线程读取，修改和查询需要互斥。"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SnippetIndex:
+    """片段搜索索引：常驻内存的是小写化的标题 + 内容前段，以及字符倒排表（array 存文档号）。
+
+    每条片段分配一个递增的文档号，结果按文档号排序，与文件顺序一致。
+    倒排表覆盖标题和内容前 FUZZY_CONTENT_SCAN 个字符；查询先按查询词的字符求交得到候选
+    （内容更长的文档总是候选），再做子串校验。超出内存前段的内容建索引时小写化一次，
+    以 UTF-8 存进索引自己的 _ContentBlob，校验时在映射上直接查找，不再逐条读取原文、重新小写化。
+    大小写按 _fold 归一化，查询或片段含 ß 等折叠后变长的字符时再用 re.I 复核，结果与 filter_snippets 相同。
+    可在后台线程查询；cancelled 回调返回 True 时查询中途放弃并返回 None。
+    """
+
+    def __init__(self, snippets=None):
+        self._docs = {}        # 文档号 -> 片段
+        self._titles = {}      # 文档号 -> 小写标题
+        self._texts = {}       # 文档号 -> "小写标题\0小写内容前 INDEX_PREFIX_CHARS 个字符"，子串校验一次查完
+        self._tails = {}       # 文档号 -> (完整小写内容, 从前段末尾附近开始的部分) 在 _folded 中的 key（仅长内容）
+        self._folded = None    # 长内容的小写化副本（_ContentBlob），有新内容写入后 _folded_dirty 为真
+        self._folded_dirty = False
+        self._unindexed = set()  # 内容超出倒排表范围（FUZZY_CONTENT_SCAN）的文档，子串查询总是候选
+        self._inexact = set()  # 标题或内容含折叠后变长字符的文档，命中后用 re.I 复核
+        self._initials = {}    # 文档号 -> 标题拼音首字母串（小写）
+        self._doc_of = {}      # id(片段对象) -> 文档号
+        self._ids = {}         # 文档号 -> 加入时的片段 id
+        self._by_id = {}       # 片段 id -> 文档号（id 重复时取最靠前的）
+        self._dup_ids = set()  # 出现过不止一次的 id，删除时才需要重新查找
+        self._chars = {}       # 单字符 -> array(文档号)
+        self._title_chars = {}  # 标题中的字符 -> array(文档号)
+        self._initial_chars = {}  # 首字母串中的字符 -> array(文档号)
+        self._next_doc = 0
+        self._cache = _QueryCache()
+        self._fuzzy_cache = _QueryCache()  # 模糊查询（词以空格连接）-> 全部命中文档号，只缓存未截断的结果
+        self._term_cache = _QueryCache(8)  # 模糊查询的单个词 -> (候选集合, 标题/首字母候选集合)，输入时只需重算最后一个词
+        self._all = None       # 空查询结果（全部文档号，按顺序）缓存
+        self._ranked = None    # (常用片段 id 元组, 空查询结果) 缓存
+        self._lock = threading.RLock()
+        if snippets:
+            self.build(snippets)
+
+    def __len__(self):
+        return len(self._docs)
+
+    @_locked
+    def build(self, snippets: list) -> None:
+        self._docs.clear()
+        self._titles.clear()
+        self._texts.clear()
+        self._tails.clear()
+        self._folded = None
+        self._folded_dirty = False
+        self._unindexed.clear()
+        self._inexact.clear()
+        self._initials.clear()
+        self._doc_of.clear()
+        self._ids.clear()
+        self._by_id.clear()
+        self._dup_ids.clear()
+        self._chars.clear()
+        self._title_chars.clear()
+        self._initial_chars.clear()
+        self._next_doc = 0
+        self._invalidate()
+        for s in snippets:
+            self.add(s)
+
+    def _invalidate(self):
+        self._cache.clear()
+        self._fuzzy_cache.clear()
+        self._term_cache.clear()
+        self._all = None
+        self._ranked = None
+
+    def _folded_blob(self):
+        if self._folded_dirty:
+            self._folded.seal()
+            self._folded_dirty = False
+        return self._folded
+
+    def _content(self, doc: int, limit: int = None) -> str:
+        """文档的小写内容；超出前段的从小写化副本读取，limit 限定只读开头若干字符。"""
+        keys = self._tails.get(doc)
+        if keys is None or (limit is not None and limit <= INDEX_PREFIX_CHARS):
+            text = self._texts[doc][len(self._titles[doc]) + 1:]
+            return text if limit is None else text[:limit]
+        blob = self._folded_blob()
+        return blob.read(keys[0]) if limit is None else blob.read_prefix(keys[0], limit)
+
+    @staticmethod
+    def _post(table: dict, keys, doc: int) -> None:
+        for k in keys:
+            postings = table.get(k)
+            if postings is None:
+                table[k] = array.array("I", (doc,))
+            else:
+                postings.append(doc)
+
+    @staticmethod
+    def _unpost(table: dict, keys, doc: int) -> None:
+        for k in keys:
+            postings = table.get(k)
+            if postings is not None and doc in postings:
+                postings.remove(doc)
+                if not postings:
+                    del table[k]
+
+    @staticmethod
+    def prepare(snippet: Snippet) -> tuple:
+        """add 的纯计算部分（小写化、字符集合），不改动索引，可在后台线程先为新片段算好。"""
+        content = snippet.content
+        title = _fold(snippet.title)
+        folded = _fold(content)
+        inexact = bool(_FOLD_EXPANDING_RE.search(snippet.title) or _FOLD_EXPANDING_RE.search(content))
+        chars = set(title).union(folded[:FUZZY_CONTENT_SCAN])
+        return title, folded, len(content) > INDEX_PREFIX_CHARS, inexact, _fold(_title_initials(snippet.title)), chars
+
+    @_locked
+    def add(self, snippet: Snippet, prepared: tuple = None) -> None:
+        """加入一条片段；prepared 为 prepare(snippet) 预先算好的结果。"""
+        title, folded, long, inexact, initials, chars = prepared or self.prepare(snippet)
+        doc = self._next_doc
+        self._next_doc += 1
+        self._invalidate()
+        self._docs[doc] = snippet
+        self._titles[doc] = title
+        if long:
+            self._texts[doc] = title + "\0" + folded[:INDEX_PREFIX_CHARS]
+            if self._folded is None:
+                self._folded = _ContentBlob()
+            offset, length = key = self._folded.append(folded)
+            skip = len(folded[:INDEX_PREFIX_CHARS - INDEX_TAIL_OVERLAP].encode("utf-8"))
+            self._tails[doc] = (key, (offset + skip, length - skip))
+            self._folded_dirty = True
+            if len(folded) > FUZZY_CONTENT_SCAN:
+                self._unindexed.add(doc)
+        else:
+            self._texts[doc] = title + "\0" + folded
+        if inexact:
+            self._inexact.add(doc)
+        self._initials[doc] = initials
+        self._doc_of[id(snippet)] = doc
+        sid = snippet.id
+        if sid is not None:
+            self._ids[doc] = sid
+            current = self._by_id.get(sid)
+            if current is None or doc < current:
+                self._by_id[sid] = doc
+            if current is not None:
+                self._dup_ids.add(sid)
+        self._post(self._chars, chars, doc)
+        self._post(self._title_chars, set(title), doc)
+        self._post(self._initial_chars, set(initials), doc)
+
+    @_locked
+    def remove(self, snippet: Snippet) -> None:
+        doc = self._doc_of.pop(id(snippet), None)
+        if doc is None:
+            return
+        self._invalidate()
+        # 片段对象可能已被就地修改，按索引里保存的旧文本撤销倒排
+        title_chars = set(self._titles[doc])
+        chars = title_chars.union(self._content(doc, FUZZY_CONTENT_SCAN))
+        del self._docs[doc]
+        del self._titles[doc]
+        del self._texts[doc]
+        # 小写化副本只追加不回收，整体重建（重新加载）时随旧索引释放
+        self._tails.pop(doc, None)
+        self._unindexed.discard(doc)
+        self._inexact.discard(doc)
+        self._unpost(self._chars, chars, doc)
+        self._unpost(self._title_chars, title_chars, doc)
+        self._unpost(self._initial_chars, set(self._initials.pop(doc)), doc)
+        sid = self._ids.pop(doc, None)
+        if sid is not None and self._by_id.get(sid) == doc:
+            del self._by_id[sid]
+            if sid in self._dup_ids:
+                others = [d for d, other in self._ids.items() if other == sid]
+                if others:
+                    self._by_id[sid] = min(others)
+                if len(others) < 2:
+                    self._dup_ids.discard(sid)
+
+    @_locked
+    def update(self, snippet: Snippet) -> None:
+        """片段标题/内容被修改后调用，保留原文档号（即原有顺序）。"""
+        doc = self._doc_of.get(id(snippet))
+        if doc is None:
+            self.add(snippet)
+            return
+        self.remove(snippet)
+        self._next_doc, saved = doc, self._next_doc
+        try:
+            self.add(snippet)
+        finally:
+            self._next_doc = saved
+
+    @_locked
+    def get(self, snippet_id):
+        """按 id 取片段（O(1)），没有时返回 None。"""
+        doc = self._by_id.get(snippet_id)
+        return None if doc is None else self._docs[doc]
+
+    def _candidates(self, needle: str) -> set:
+        """用字符倒排表求交得到候选文档号集合；内容超出倒排表范围的文档总是候选。"""
+        return self._intersect(self._chars, set(needle)) | self._unindexed
+
+    @staticmethod
+    def _intersect(table: dict, keys: set):
+        postings = []
+        for k in keys:
+            p = table.get(k)
+            if not p:
+                return set()
+            postings.append(p)
+        if not postings:
+            return None
+        postings.sort(key=len)
+        result = set(postings[0])
+        for p in postings[1:]:
+            result.intersection_update(p)
+            if not result:
+                break
+        return result
+
+    @_locked
+    def search(self, keyword: str, cancelled=None):
+        if not keyword or not keyword.strip():
+            if self._all is None:
+                self._all = sorted(self._docs)
+            return [self._docs[d] for d in self._all]
+        keyword = keyword.strip()
+        needle = _fold(keyword)
+        # 查询含折叠后变长的字符（或标题与内容间的分隔符）时全部命中都要复核，复核结果与折叠后的查询不再单调，不用缓存
+        exact = not (_FOLD_EXPANDING_RE.search(keyword) or "\0" in keyword)
+        docs = self._cache.get(needle) if exact else None
+        if docs is None:
+            base = self._cache.best_base(needle) if exact else None
+            known = ()
+            if base is None:
+                cands = self._candidates(needle)
+                if len(needle) == 1:
+                    # 单字符：倒排表覆盖到的文档必然命中，只需校验内容超出范围的
+                    known = cands - self._unindexed
+                base = sorted(cands)
+            texts = self._texts
+            tails = self._tails
+            folded = self._folded_blob() if tails else None
+            data = needle.encode("utf-8")
+            part = 1 if len(needle) <= INDEX_TAIL_OVERLAP else 0
+            docs = []
+            step = SEARCH_CANCEL_CHECK_EVERY
+            for start in range(0, len(base), step):
+                if cancelled is not None and cancelled():
+                    return None
+                docs.extend(
+                    d for d in base[start:start + step]
+                    if d in known or needle in texts[d] or (d in tails and folded.find(tails[d][part], data))
+                )
+            if self._inexact or not exact:
+                pattern = re.compile(re.escape(keyword), re.I)
+                inexact = self._inexact
+                docs = [
+                    d for d in docs
+                    if (exact and d not in inexact)
+                    or pattern.search(self._docs[d].title) or pattern.search(self._docs[d].content)
+                ]
+            if exact:
+                self._cache.put(needle, docs)
+        return [self._docs[d] for d in docs]
+
+    @_locked
+    def ranked(self, ids) -> list:
+        """空查询结果：ids 中的片段按给定顺序排在最前，其余保持文件顺序。
+
+        只做一次线性扫描、不排序；结果缓存到索引或 ids 变化为止。
+        """
+        ids = tuple(ids)
+        if self._ranked is not None and self._ranked[0] == ids:
+            return self._ranked[1]
+        if self._all is None:
+            self._all = sorted(self._docs)
+        wanted = {sid: pos for pos, sid in enumerate(ids)}
+        front = [None] * len(ids)
+        rest = []
+        for d in self._all:
+            snippet = self._docs[d]
+            pos = wanted.get(snippet.id)
+            if pos is not None and front[pos] is None:
+                front[pos] = snippet
+            else:
+                rest.append(snippet)
+        result = [snippet for snippet in front if snippet is not None] + rest
+        self._ranked = (ids, result)
+        return result
+
+    @_locked
+    def fuzzy_search(self, keyword: str, usage=None, limit: int = FUZZY_TOP_K, cancelled=None,
+                     with_scores: bool = False):
+        """模糊搜索：空格分隔的每个词都要作为子序列命中标题、标题拼音首字母或内容。
+
+        标题与首字母命中权重加倍（命中标题时不再扫描内容），再叠加使用频率/最近使用加分
+        （usage: id -> (次数, 时间戳)）；用大小为 limit 的堆取前 K 条，不对全部结果排序。
+        候选按每个词分别用倒排表求交（内容或标题 ∪ 首字母）后再取交集；超过 FUZZY_SCORE_LIMIT 条时
+        只给常用片段、标题/首字母命中的和文件中靠前的打分。新查询包含已缓存的未截断查询时只在其命中里打分。
+        with_scores 为真时返回 [(分数, 片段)]，供多个来源合并排序。
+        """
+        terms = _fold(keyword or "").split()
+        if not terms:
+            return self.search("")
+        usage = usage or {}
+        query = " ".join(terms)
+        cands = self._fuzzy_cache.best_base(query)
+        capped = False
+        if cands is None:
+            cands = title_cands = None
+            for term in terms:
+                pruned = self._term_cache.get(term)
+                if pruned is None:
+                    keys = set(term)
+                    initial = self._intersect(self._initial_chars, keys)
+                    pruned = (self._intersect(self._chars, keys) | initial,
+                              self._intersect(self._title_chars, keys) | initial)
+                    self._term_cache.put(term, pruned)
+                found, title_found = pruned
+                cands = found if cands is None else cands & found
+                title_cands = title_found if title_cands is None else title_cands & title_found
+            if len(cands) > FUZZY_SCORE_LIMIT:
+                # 候选太多：按 常用片段 -> 标题/首字母命中 -> 文件顺序 的优先级截断
+                first = [d for d in map(self._by_id.get, usage) if d is not None and d in cands]
+                picked = set(first)
+                first += sorted(title_cands - picked)[:FUZZY_SCORE_LIMIT]
+                picked.update(first)
+                if len(first) < FUZZY_SCORE_LIMIT:
+                    first += sorted(cands - picked)[:FUZZY_SCORE_LIMIT - len(first)]
+                cands = first[:FUZZY_SCORE_LIMIT]
+                capped = True
+        now = time.time()
+        titles = self._titles
+        initials = self._initials
+        docs = self._docs
+        matched = []
+        aborted = []
+
+        def scored():
+            for i, d in enumerate(cands):
+                if cancelled is not None and i % SEARCH_CANCEL_CHECK_EVERY == 0 and cancelled():
+                    aborted.append(True)
+                    return
+                total = _score_terms(
+                    terms, titles[d], initials[d],
+                    lambda: self._content(d, FUZZY_CONTENT_SCAN),
+                )
+                if total is not None:
+                    matched.append(d)
+                    total += _usage_bonus(usage.get(docs[d].id), now)
+                    yield total, -d
+
+        top = heapq.nlargest(limit, scored())
+        if aborted:
+            return None
+        if not capped:
+            self._fuzzy_cache.put(query, matched)
+        if with_scores:
+            return [(score, docs[-neg]) for score, neg in top]
+        return [docs[-neg] for _, neg in top]
+
+
 def open_snippets_file() -> None:
     path = get_snippets_path()
-    if not os.path.isfile(path):
-        save_snippets(get_default_snippets())
+    if not os.path.isfile(path) or os.path.exists(get_journal_path(path)):
+        # 先把变更日志合并进文件，外部编辑器看到的才是最新数据
+        save_snippets(load_snippets(path))
     if sys.platform == "win32":
         os.startfile(path)
     else:
         subprocess.run(["xdg-open", path], check=False)
 
 
-def _next_snippet_id(snippets: list) -> str:
-    """生成新片段的 id。"""
+def _assign_ids(store, snippets: list) -> None:
+    """从 store.next_id() 起给新片段依次编号（GUI 线程提交时调用，不会与期间新增的片段重号）。"""
+    num = int(store.next_id()[len(store.id_prefix):])
+    for snippet in snippets:
+        snippet.id = f"{store.id_prefix}{num}"
+        num += 1
+
+
+def _next_snippet_id(ids) -> str:
+    """由已有 id 生成新片段的 id。"""
     nums = []
-    for s in snippets:
+    for sid in ids:
         try:
-            nums.append(int(s.get("id", 0)))
+            nums.append(int(sid or 0))
         except (TypeError, ValueError):
             pass
     return str(max(nums, default=0) + 1)
 
 
-class SnippetEditDialog(QDialog):
-    """新增/编辑单条片段的对话框。"""
+def _file_stamp(path: str):
+    """文件的 (mtime, 大小, inode)，用于判断内容是否变化；文件不存在返回 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
 
-    def __init__(self, parent=None, snippet=None):
-        super().__init__(parent)
-        self.setWindowTitle("编辑片段" if snippet else "新增片段")
-        self.setMinimumWidth(400)
-        layout = QFormLayout(self)
-        self.title_edit = QLineEdit()
-        self.title_edit.setPlaceholderText("标题（用于搜索和列表显示）")
-        layout.addRow("标题：", self.title_edit)
-        self.content_edit = QPlainTextEdit()
-        self.content_edit.setPlaceholderText("内容（粘贴到焦点时的文本，可多行）")
-        self.content_edit.setMinimumHeight(120)
-        layout.addRow("内容：", self.content_edit)
-        btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        btns.accepted.connect(self.accept)
-        btns.rejected.connect(self.reject)
-        layout.addRow(btns)
-        if snippet:
-            self.title_edit.setText(snippet.get("title", ""))
-            self.content_edit.setPlainText(snippet.get("content", ""))
 
-    def get_data(self):
-        return {
-            "title": self.title_edit.text().strip(),
-            "content": self.content_edit.toPlainText(),
-        }
+class SnippetStore(QObject):
+    """片段数据的内存缓存：片段列表 + 搜索索引，按文件 (mtime, 大小, inode) 判断是否过期。
 
+    用 QFileSystemWatcher 监听文件，外部修改后在后台线程重新解析并建索引，
+    完成后在 GUI 线程整体替换并发出 changed 信号；调出窗口时不再做任何文件 I/O。
 
-class SnippetsMaintenanceDialog(QDialog):
-    """片段维护界面：列表 + 新增/编辑/删除。"""
+    单条增删改（add / update / remove_at）只向变更日志追加一行，
+    日志达到 JOURNAL_COMPACT_ENTRIES 条或调用 compact() 时才原子重写整个 snippets.json。
 
-    def __init__(self, parent=None):
+    作为附加来源（见 LayeredSnippetStore）时：id_prefix 加在内存中的 id 前（写回文件时去掉），
+    避免与其他来源的 id 冲突；readonly 的来源从不写文件；文件不存在时为空库而不是示例片段。
+    """
+
+    changed = pyqtSignal()
+    _reloaded = pyqtSignal(int, object, object, object)
+
+    def __init__(self, path: str = None, parent=None, readonly: bool = False, id_prefix: str = "", name: str = ""):
         super().__init__(parent)
-        self.setWindowTitle("维护片段数据")
-        self.setMinimumSize(640, 400)
-        self._snippets = []
-        layout = QVBoxLayout(self)
-        self.table = QTableWidget()
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["标题", "内容预览", "id"])
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
-        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
-        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
-        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.table.doubleClicked.connect(self._on_edit)
-        layout.addWidget(self.table)
-        btn_layout = QHBoxLayout()
-        add_btn = QPushButton("新增")
-        add_btn.clicked.connect(self._on_add)
-        edit_btn = QPushButton("编辑")
-        edit_btn.clicked.connect(self._on_edit)
-        del_btn = QPushButton("删除")
-        del_btn.clicked.connect(self._on_delete)
-        close_btn = QPushButton("关闭")
-        close_btn.clicked.connect(self.accept)
-        btn_layout.addWidget(add_btn)
-        btn_layout.addWidget(edit_btn)
-        btn_layout.addWidget(del_btn)
+        self.path = path or get_snippets_path()
+        self.journal_path = get_journal_path(self.path)
+        self.readonly = readonly
+        self.id_prefix = id_prefix
+        self.name = name
+        self.snippets = []
+        self.index = SnippetIndex()
+        self.revision = 0          # 内容每变化一次 +1（加载、重新加载、增删改），供合并查询判断缓存是否有效
+        self._stamp = None
+        self._loaded = False
+        self._journal_entries = 0
+        self._version = 0          # 本进程每次保存 +1，用来丢弃保存前发起的后台加载结果
+        self._reloading = False
+        self._watcher = None
+        self._reload_timer = None
+        self._reloaded.connect(self._on_reloaded)
+
+    def _current_stamp(self):
+        return (_file_stamp(self.path), _file_stamp(self.journal_path))
+
+    def _count_journal(self) -> int:
+        return len(_read_journal(self.journal_path))
+
+    def _read_records(self) -> list:
+        records = _to_records(load_snippets(self.path, defaults=not self.id_prefix))
+        if self.id_prefix:
+            for snippet in records:
+                if snippet.id is not None:
+                    snippet.id = self.id_prefix + str(snippet.id)
+        return records
+
+    def _local_id(self, sid):
+        """去掉 id_prefix，得到文件中的 id。"""
+        if self.id_prefix and isinstance(sid, str) and sid.startswith(self.id_prefix):
+            return sid[len(self.id_prefix):]
+        return sid
+
+    def _dump(self, snippet: Snippet) -> dict:
+        data = snippet.to_dict()
+        data["id"] = self._local_id(data["id"])
+        return data
+
+    def load(self) -> None:
+        """同步加载（启动时）。"""
+        stamp = self._current_stamp()
+        snippets = self._read_records()
+        self.snippets = snippets
+        self.index.build(snippets)
+        self._stamp = stamp
+        self._loaded = True
+        self._journal_entries = self._count_journal()
+        self.revision += 1
+        self.changed.emit()
+
+    def load_async(self) -> None:
+        """在后台线程完成首次加载（启动时不阻塞托盘和窗口创建）。"""
+        self.reload_if_changed()
+
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def is_stale(self) -> bool:
+        return self._current_stamp() != self._stamp
+
+    def save(self) -> None:
+        """整体重写 snippets.json（同时清空变更日志）。"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        save_snippets([self._dump(s) for s in self.snippets], self.path)
+        self._journal_entries = 0
+        self._version += 1
+        self.revision += 1
+        self._stamp = self._current_stamp()
+
+    def compact(self) -> None:
+        """把变更日志合并进 snippets.json。"""
+        if self._journal_entries and not self.readonly:
+            self.save()
+
+    def _append(self, entry: dict) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        append_journal(entry, self.path)
+        self._journal_entries += 1
+        self._version += 1
+        self.revision += 1
+        self._stamp = self._current_stamp()
+        self._watch_file()
+        if self._journal_entries >= JOURNAL_COMPACT_ENTRIES:
+            self.save()
+
+    def next_id(self) -> str:
+        return self.id_prefix + _next_snippet_id(self._local_id(s.id) for s in self.snippets)
+
+    def overrides(self) -> set:
+        """本层片段在 "overrides" 字段中声明要遮蔽的低层片段 id（「名称:id」，可为字符串或列表）。"""
+        found = set()
+        for s in self.snippets:
+            value = s.extra.get("overrides") if s.extra else None
+            if isinstance(value, str):
+                found.add(value)
+            elif isinstance(value, list):
+                found.update(v for v in value if isinstance(v, str))
+        return found
+
+    def get(self, snippet_id: str):
+        """按 id 取片段，没有时返回 None；查索引里的 id 表，不扫描片段列表。"""
+        return self.index.get(snippet_id)
+
+    def add(self, snippet: Snippet) -> None:
+        """追加到末尾：更新索引并记一条日志。"""
+        self.snippets.append(snippet)
+        self.index.add(snippet)
+        self._persist_put(snippet)
+
+    def snapshot(self):
+        """当前片段序列的快照，供后台线程遍历（导出）。"""
+        return list(self.snippets)
+
+    def iter_contents(self):
+        """遍历全部内容（导入去重用），可在后台线程调用。"""
+        return (s.content for s in list(self.snippets))
+
+    def prepare_many(self, snippets: list) -> list:
+        """批量导入的耗时部分，在后台线程调用：算好新片段的索引数据，不改动当前索引和片段列表。"""
+        return [SnippetIndex.prepare(snippet) for snippet in snippets]
+
+    def add_many(self, snippets: list, prepared=None) -> None:
+        """批量追加（GUI 线程）：此时才分配 id 并把片段并入索引，不逐条写日志，整体保存一次。"""
+        _assign_ids(self, snippets)
+        for snippet, entry in zip(snippets, prepared or [None] * len(snippets)):
+            self.index.add(snippet, entry)
+        self.snippets.extend(snippets)
+        self.save()
+
+    def update(self, snippet: Snippet) -> None:
+        """snippet 已被调用方就地修改。"""
+        self.index.update(snippet)
+        self._persist_put(snippet)
+
+    def remove_at(self, row: int) -> dict:
+        snippet = self.snippets.pop(row)
+        self.index.remove(snippet)
+        if snippet.id is None:
+            self.save()
+        else:
+            self._append({"op": "delete", "id": self._local_id(snippet.id)})
+        return snippet
+
+    def _persist_put(self, snippet: Snippet) -> None:
+        # 没有 id 的旧数据无法按 id 重放，退回整体保存
+        if snippet.id is None:
+            self.save()
+        else:
+            self._append({"op": "put", "snippet": self._dump(snippet)})
+
+    def watch(self) -> None:
+        """开始监听片段文件及其所在目录（文件被整体替换或新建时目录会变化）。"""
+        if self._watcher is not None:
+            return
+        self._reload_timer = QTimer(self)
+        self._reload_timer.setSingleShot(True)
+        self._reload_timer.setInterval(STORE_RELOAD_DELAY_MS)
+        self._reload_timer.timeout.connect(self.reload_if_changed)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_path_changed)
+        self._watcher.directoryChanged.connect(self._on_path_changed)
+        self._watcher.addPath(os.path.dirname(self.path))
+        self._watch_file()
+
+    def _watch_file(self):
+        if self._watcher is None:
+            return
+        watched = self._watcher.files()
+        for p in (self.path, self.journal_path):
+            if os.path.isfile(p) and p not in watched:
+                self._watcher.addPath(p)
+
+    def _on_path_changed(self, _path):
+        self._reload_timer.start()
+
+    def reload_if_changed(self) -> bool:
+        """文件有变化时在后台线程重新加载，返回是否发起了加载。"""
+        self._watch_file()
+        if self._reloading or not self.is_stale():
+            return False
+        self._reloading = True
+        version = self._version
+
+        def work():
+            stamp = self._current_stamp()
+            snippets = self._read_records()
+            index = SnippetIndex(snippets)
+            entries = self._count_journal()
+            self._reloaded.emit(version, (stamp, entries), snippets, index)
+
+        threading.Thread(target=work, name="FastTypeStoreReload", daemon=True).start()
+        return True
+
+    def _on_reloaded(self, version, stamp, snippets, index):
+        self._reloading = False
+        if version != self._version:
+            # 加载期间本进程又保存过，结果作废，按最新文件状态重新判断
+            self.reload_if_changed()
+            return
+        self.snippets = snippets
+        self.index = index
+        self._stamp, self._journal_entries = stamp
+        self._loaded = True
+        self.revision += 1
+        self.changed.emit()
+        # 加载期间文件可能又被改过
+        self.reload_if_changed()
+
+
+def get_sqlite_path() -> str:
+    return os.path.join(os.path.dirname(get_snippets_path()), SQLITE_FILE)
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snippets (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    initials TEXT NOT NULL DEFAULT ''
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS snippets_fts USING fts5(
+    title, content, content='snippets', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS snippets_ai AFTER INSERT ON snippets BEGIN
+    INSERT INTO snippets_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS snippets_ad AFTER DELETE ON snippets BEGIN
+    INSERT INTO snippets_fts(snippets_fts, rowid, title, content)
+    VALUES ('delete', old.rowid, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS snippets_au AFTER UPDATE ON snippets BEGIN
+    INSERT INTO snippets_fts(snippets_fts, rowid, title, content)
+    VALUES ('delete', old.rowid, old.title, old.content);
+    INSERT INTO snippets_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+"""
+
+
+def _open_sqlite(db_path: str, readonly: bool = False):
+    """打开片段库并注册 fold()（与 _fold 相同；LIKE 只对 ASCII 忽略大小写）；readonly 为真时只用于查询。"""
+    import sqlite3
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.create_function("fold", 1, _fold, deterministic=True)
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SQLITE_SCHEMA)
+    return conn
+
+
+def sqlite_backend_available() -> bool:
+    """当前 Python 自带的 SQLite 是否支持 FTS5 trigram 分词（SQLite >= 3.34）。"""
+    import sqlite3
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def migrate_json_to_sqlite(json_path: str = None, db_path: str = None) -> int:
+    """把 snippets.json（含变更日志）一次性导入 SQLite 库，覆盖库中已有数据，返回导入条数。"""
+    snippets = load_snippets(json_path)
+    db_path = db_path or get_sqlite_path()
+    next_num = int(_next_snippet_id(s.get("id") for s in snippets))
+    rows = []
+    seen = set()
+    for s in snippets:
+        sid = s.get("id")
+        # 库中 id 为 TEXT：5 与 "5" 按同一个 id 去重
+        sid = None if sid is None else str(sid)
+        if sid is None or sid in seen:
+            sid = str(next_num)
+            next_num += 1
+        seen.add(sid)
+        title = s.get("title", "")
+        rows.append((sid, title, s.get("content", ""), _fold(_title_initials(title))))
+    conn = _open_sqlite(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM snippets")
+            conn.executemany(
+                "INSERT INTO snippets (id, title, content, initials) VALUES (?, ?, ?, ?)", rows
+            )
+    finally:
+        conn.close()
+    return len(rows)
+
+
+class _SqliteRows:
+    """SQLite 结果集：只保存 rowid 列表，按页从库里取片段（带缓存），视图滚动到哪取到哪。"""
+
+    def __init__(self, store, rowids: list):
+        self._store = store
+        self.rowids = rowids
+
+    def __len__(self):
+        return len(self.rowids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self.rowids)))]
+        if i < 0:
+            i += len(self.rowids)
+        return self._store._get_row(self.rowids, i)
+
+    def __iter__(self):
+        for i in range(len(self.rowids)):
+            yield self[i]
+
+
+class SqliteSnippetStore(QObject):
+    """SQLite + FTS5（trigram 分词）片段库，适合几十万条以上的大库。
+
+    接口与 SnippetStore 相同；搜索在库内完成，结果只是 rowid 列表，片段按页懒加载。
+    搜索用单独的只读连接（WAL 下读写互不阻塞），后台查询时界面线程仍可取行。
+    index 属性指向自身，提供 search / fuzzy_search。
+    """
+
+    changed = pyqtSignal()
+
+    readonly = False
+    id_prefix = ""
+    name = ""
+
+    def __init__(self, path: str = None, parent=None, json_path: str = None):
+        super().__init__(parent)
+        self.path = path or get_sqlite_path()
+        # 库文件不存在时从这里迁移（默认是库旁边的 snippets.json）
+        self.json_path = json_path or os.path.join(os.path.dirname(self.path), SNIPPETS_FILE)
+        self.revision = 0
+        self.snippets = _SqliteRows(self, [])
+        self._conn = None
+        self._lock = threading.RLock()
+        self._reader = None               # 搜索用的只读连接，由 _read_lock 保护
+        self._read_lock = threading.Lock()
+        self._row_cache = OrderedDict()   # rowid -> 片段
+
+    @property
+    def index(self):
+        return self
+
+    def load(self) -> None:
+        json_path = self.json_path
+        # 只有变更日志、还没合并出 snippets.json 的库也要导入：load_snippets 会像 JSON 存储一样重放日志
+        if not os.path.exists(self.path) and (
+            os.path.exists(json_path) or os.path.exists(get_journal_path(json_path))
+        ):
+            migrate_json_to_sqlite(json_path, db_path=self.path)
+        with self._lock:
+            if self._conn is None:
+                self._conn = _open_sqlite(self.path)
+            if self._conn.execute("SELECT 1 FROM snippets LIMIT 1").fetchone() is None:
+                with self._conn:
+                    for s in get_default_snippets():
+                        self._insert(Snippet.from_dict(s))
+            rowids = [r for (r,) in self._conn.execute("SELECT rowid FROM snippets ORDER BY rowid")]
+            self._row_cache.clear()
+        with self._read_lock:
+            if self._reader is None:
+                self._reader = _open_sqlite(self.path, readonly=True)
+        self.snippets = _SqliteRows(self, rowids)
+        self.revision += 1
+        self.changed.emit()
+
+    def load_async(self) -> None:
+        """只读取 rowid 列表，足够快，直接同步加载。"""
+        self.load()
+
+    def is_loaded(self) -> bool:
+        return self._conn is not None
+
+    def is_stale(self) -> bool:
+        return False
+
+    def watch(self) -> None:
+        """库只通过本程序修改，无需监听文件。"""
+
+    def reload_if_changed(self) -> bool:
+        return False
+
+    def save(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def compact(self) -> None:
+        self.save()
+
+    def close(self) -> None:
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get_row(self, rowids: list, i: int) -> dict:
+        rowid = rowids[i]
+        with self._lock:
+            row = self._row_cache.get(rowid)
+            if row is not None:
+                self._row_cache.move_to_end(rowid)
+                return row
+            start = i - i % SQLITE_PAGE_SIZE
+            page = [r for r in rowids[start:start + SQLITE_PAGE_SIZE] if r not in self._row_cache]
+            marks = ",".join("?" * len(page))
+            for rid, sid, title, content in self._conn.execute(
+                "SELECT rowid, id, title, CASE WHEN length(content) <= ? THEN content END "
+                f"FROM snippets WHERE rowid IN ({marks})",
+                [SNIPPET_INLINE_CONTENT_CHARS] + page,
+            ):
+                if content is None:
+                    self._row_cache[rid] = Snippet(sid, title, blob=self, key=rid)
+                else:
+                    self._row_cache[rid] = Snippet(sid, title, content)
+            while len(self._row_cache) > SQLITE_ROW_CACHE:
+                self._row_cache.popitem(last=False)
+            return self._row_cache.get(rowid) or Snippet()
+
+    def read(self, rowid: int) -> str:
+        """长内容按需从库里读取（Snippet 的 blob 接口）。"""
+        return self.read_prefix(rowid, None)
+
+    def read_prefix(self, rowid: int, chars) -> str:
+        with self._lock:
+            if chars is None:
+                row = self._conn.execute("SELECT content FROM snippets WHERE rowid = ?", (rowid,)).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT substr(content, 1, ?) FROM snippets WHERE rowid = ?", (chars, rowid)
+                ).fetchone()
+        return row[0] if row else ""
+
+    def _query(self, sql: str, params, cancelled=None, consume=list):
+        """在只读连接上执行查询，返回 consume(游标)（默认取出全部行），不占用写连接的锁。
+
+        cancelled() 为 True 时通过 progress handler 中断，返回 None。
+        """
+        import sqlite3
+        with self._read_lock:
+            reader = self._reader
+            if cancelled is not None:
+                reader.set_progress_handler(lambda: 1 if cancelled() else 0, 10000)
+            try:
+                return consume(reader.execute(sql, params))
+            except sqlite3.OperationalError:
+                if cancelled is not None and cancelled():
+                    return None
+                raise
+            finally:
+                if cancelled is not None:
+                    reader.set_progress_handler(None, 0)
+
+    def search(self, keyword: str, cancelled=None):
+        if not keyword or not keyword.strip():
+            return _SqliteRows(self, list(self.snippets.rowids))
+        needle = keyword.strip()
+        if len(needle) >= 3:
+            sql = "SELECT rowid FROM snippets_fts WHERE snippets_fts MATCH ? ORDER BY rowid"
+            params = (_fts_phrase(needle),)
+        elif needle.isascii():
+            like = f"%{_like_escape(needle)}%"
+            sql = (
+                "SELECT rowid FROM snippets WHERE title LIKE ? ESCAPE '\\' "
+                "OR content LIKE ? ESCAPE '\\' ORDER BY rowid"
+            )
+            params = (like, like)
+        else:
+            # LIKE 只对 ASCII 忽略大小写，其他字符折叠后再找
+            sql = "SELECT rowid FROM snippets WHERE instr(fold(title), ?) OR instr(fold(content), ?) ORDER BY rowid"
+            params = (_fold(needle), _fold(needle))
+        rows = self._query(sql, params, cancelled)
+        if rows is None:
+            return None
+        return _SqliteRows(self, [r for (r,) in rows])
+
+    def ranked(self, ids):
+        """空查询结果：ids 对应的行排在最前，其余按 rowid 顺序。"""
+        ids = list(ids)
+        rowids = self.snippets.rowids
+        if not ids or self._conn is None:
+            return _SqliteRows(self, list(rowids))
+        with self._lock:
+            marks = ",".join("?" * len(ids))
+            found = dict(self._conn.execute(f"SELECT id, rowid FROM snippets WHERE id IN ({marks})", ids))
+        front = [found[sid] for sid in ids if sid in found]
+        taken = set(front)
+        return _SqliteRows(self, front + [r for r in rowids if r not in taken])
+
+    def fuzzy_search(self, keyword: str, usage=None, limit: int = FUZZY_TOP_K, cancelled=None,
+                     with_scores: bool = False):
+        """用 LIKE '%a%b%c%' 在库内筛出子序列候选，再用与内存索引相同的打分取前 K 条。
+
+        候选逐行流入大小为 limit 的堆，全部候选都参与打分；含非 ASCII 字符的词先用 fold() 折叠再匹配。
+        """
+        terms = _fold(keyword or "").split()
+        if not terms:
+            return self.search("")
+        where = []
+        params = []
+        for term in terms:
+            pattern = "%" + "%".join(_like_escape(ch) for ch in term) + "%"
+            if term.isascii():
+                where.append(
+                    "(title LIKE ? ESCAPE '\\' OR initials LIKE ? ESCAPE '\\' "
+                    "OR content LIKE ? ESCAPE '\\')"
+                )
+            else:
+                where.append(
+                    "(fold(title) LIKE ? ESCAPE '\\' OR initials LIKE ? ESCAPE '\\' "
+                    f"OR fold(substr(content, 1, {FUZZY_CONTENT_SCAN})) LIKE ? ESCAPE '\\')"
+                )
+            params += [pattern, pattern, pattern]
+        sql = (
+            f"SELECT rowid, id, title, initials, substr(content, 1, {FUZZY_CONTENT_SCAN}) "
+            f"FROM snippets WHERE {' AND '.join(where)}"
+        )
+        usage = usage or {}
+        now = time.time()
+
+        def scored(rows):
+            for i, (rowid, sid, title, initials, content) in enumerate(rows):
+                if cancelled is not None and i % SEARCH_CANCEL_CHECK_EVERY == 0 and cancelled():
+                    return
+                total = _score_terms(terms, _fold(title), initials, lambda: _fold(content))
+                if total is not None:
+                    yield total + _usage_bonus(usage.get(sid), now), -rowid
+
+        top = self._query(sql, params, cancelled, lambda rows: heapq.nlargest(limit, scored(rows)))
+        if top is None or cancelled is not None and cancelled():
+            return None
+        rows = _SqliteRows(self, [-neg for _, neg in top])
+        if with_scores:
+            return [(score, rows[i]) for i, (score, _) in enumerate(top)]
+        return rows
+
+    def get(self, snippet_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT rowid FROM snippets WHERE id = ?", (snippet_id,)).fetchone()
+        if row is None:
+            return None
+        return self._get_row([row[0]], 0)
+
+    def next_id(self) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(CAST(id AS INTEGER)) FROM snippets WHERE id GLOB '[0-9]*'"
+            ).fetchone()
+        return str((row[0] or 0) + 1)
+
+    def overrides(self) -> set:
+        """库中不保存附加字段，SQLite 片段库不遮蔽其他来源。"""
+        return set()
+
+    def _insert(self, snippet: Snippet) -> int:
+        title = snippet.title
+        cur = self._conn.execute(
+            "INSERT INTO snippets (id, title, content, initials) VALUES (?, ?, ?, ?)",
+            (snippet.id, title, snippet.content, _fold(_title_initials(title))),
+        )
+        return cur.lastrowid
+
+    def add(self, snippet: Snippet) -> None:
+        with self._lock, self._conn:
+            rowid = self._insert(snippet)
+            self._row_cache[rowid] = snippet
+        self.snippets.rowids.append(rowid)
+        self.revision += 1
+
+    def snapshot(self):
+        return _SqliteRows(self, list(self.snippets.rowids))
+
+    def iter_contents(self):
+        """按 rowid 分批读出全部内容，每批只短暂持锁。"""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, content FROM snippets WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, SQLITE_PAGE_SIZE * 4),
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for _, content in rows:
+                yield content
+
+    def prepare_many(self, snippets: list) -> list:
+        """在后台线程中算好要写入的 (标题, 内容, 首字母)，不动数据库。"""
+        return [(s.title, s.content, _fold(_title_initials(s.title))) for s in snippets]
+
+    def add_many(self, snippets: list, prepared=None) -> None:
+        """GUI 线程中分配 id、用一个事务写入并追加 rowid，库和结果集同步变化。"""
+        if prepared is None:
+            prepared = self.prepare_many(snippets)
+        with self._lock, self._conn:
+            _assign_ids(self, snippets)
+            last = self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM snippets").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO snippets (id, title, content, initials) VALUES (?, ?, ?, ?)",
+                ((s.id,) + row for s, row in zip(snippets, prepared)),
+            )
+            rowids = [r for (r,) in self._conn.execute(
+                "SELECT rowid FROM snippets WHERE rowid > ? ORDER BY rowid", (last,)
+            )]
+        self.snippets.rowids.extend(rowids)
+        self.revision += 1
+
+    def update(self, snippet: Snippet) -> None:
+        title = snippet.title
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE snippets SET title = ?, content = ?, initials = ? WHERE id = ?",
+                (title, snippet.content, _fold(_title_initials(title)), snippet.id),
+            )
+        self.revision += 1
+
+    def remove_at(self, row: int) -> dict:
+        snippet = self.snippets[row]
+        rowid = self.snippets.rowids.pop(row)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM snippets WHERE rowid = ?", (rowid,))
+            self._row_cache.pop(rowid, None)
+        self.revision += 1
+        return snippet
+
+
+class _ChainedRows:
+    """把多个来源的结果（列表或 SQLite 结果集，可从某个位置开始）首尾相接成一个只读序列，不复制元素。"""
+
+    def __init__(self, parts):
+        self._parts = [(seq, start) for seq, start in parts if len(seq) > start]
+        self._offsets = []
+        total = 0
+        for seq, start in self._parts:
+            self._offsets.append(total)
+            total += len(seq) - start
+        self._len = total
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        k = bisect.bisect_right(self._offsets, i) - 1
+        seq, start = self._parts[k]
+        return seq[start + i - self._offsets[k]]
+
+    def __iter__(self):
+        for seq, start in self._parts:
+            for i in range(start, len(seq)):
+                yield seq[i]
+
+
+def _chain_results(parts):
+    """各来源结果合并：都是列表时直接拼成列表（列表模型可做增量更新），否则用 _ChainedRows。"""
+    if all(isinstance(seq, list) for seq, _ in parts):
+        merged = []
+        for seq, start in parts:
+            merged.extend(seq[start:] if start else seq)
+        return merged
+    return _ChainedRows(parts)
+
+
+class LayeredSnippetStore(QObject):
+    """多个片段来源按优先级叠加：第一层是个人片段库，其后依次是 config.json "sources" 中的来源。
+
+    每层是独立的存储，各自加载、建索引、按自己的文件状态缓存和重新加载，刷新一层不会重新解析其他层；
+    查询时才合并各层结果：高优先级层在前（模糊模式按分数合并，同分时高优先级在前）。
+    只有被高层片段用 "overrides" 字段点名（「名称:id」）的低层片段才被遮蔽，同标题的片段照常显示。
+    index 属性指向自身，接口与单个存储相同。
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, layers: list, parent=None):
+        super().__init__(parent)
+        self.layers = layers
+        self._lock = threading.RLock()
+        self._hidden = None   # (各层 revision, 被遮蔽片段的 id(对象) 集合)
+        self._ranked = None   # (ids, 各层 revision, 合并结果)
+        for layer in layers:
+            layer.setParent(self)
+            layer.changed.connect(self.changed)
+
+    @property
+    def index(self):
+        return self
+
+    @property
+    def primary(self):
+        return self.layers[0]
+
+    @property
+    def snippets(self):
+        return self.primary.snippets
+
+    def writable_layers(self) -> list:
+        return [layer for layer in self.layers if not layer.readonly]
+
+    def load(self) -> None:
+        for layer in self.layers:
+            layer.load()
+
+    def load_async(self) -> None:
+        for layer in self.layers:
+            layer.load_async()
+
+    def is_loaded(self) -> bool:
+        # 附加来源可能在较慢的网络共享上，不等它们；加载完成后会再发 changed
+        return self.primary.is_loaded()
+
+    def watch(self) -> None:
+        for layer in self.layers:
+            layer.watch()
+
+    def reload_if_changed(self) -> bool:
+        return any([layer.reload_if_changed() for layer in self.layers])
+
+    def compact(self) -> None:
+        for layer in self.layers:
+            layer.compact()
+
+    def save(self) -> None:
+        for layer in self.writable_layers():
+            layer.save()
+
+    def next_id(self) -> str:
+        return self.primary.next_id()
+
+    def get(self, snippet_id: str):
+        for layer in self.layers:
+            snippet = layer.get(snippet_id)
+            if snippet is not None:
+                return snippet
+        return None
+
+    def _revisions(self) -> tuple:
+        return tuple((id(layer.index), layer.revision) for layer in self.layers)
+
+    def _shadowed(self) -> set:
+        """低层中被高层片段用 overrides 点名遮蔽的片段（id(对象)），各层内容不变时直接用缓存。"""
+        with self._lock:
+            key = self._revisions()
+            if self._hidden is not None and self._hidden[0] == key:
+                return self._hidden[1]
+            hidden = set()
+            above = self.primary.overrides()
+            for layer in self.layers[1:]:
+                if above:
+                    hidden.update(id(s) for s in list(layer.snippets) if s.id in above)
+                above |= layer.overrides()
+            self._hidden = (key, hidden)
+            return hidden
+
+    def _visible(self, n: int, results):
+        if n == 0 or results is None:
+            return results
+        hidden = self._shadowed()
+        return [s for s in results if id(s) not in hidden] if hidden else results
+
+    def search(self, keyword: str, cancelled=None):
+        parts = []
+        for n, layer in enumerate(self.layers):
+            results = self._visible(n, layer.index.search(keyword, cancelled=cancelled))
+            if results is None:
+                return None
+            parts.append((results, 0))
+        return _chain_results(parts)
+
+    def ranked(self, ids):
+        """空查询结果：ids 中的片段（不论来自哪一层）按给定顺序排在最前，其余按层顺序。"""
+        ids = tuple(ids)
+        key = self._revisions()
+        with self._lock:
+            if self._ranked is not None and self._ranked[:2] == (ids, key):
+                return self._ranked[2]
+        wanted = {sid: pos for pos, sid in enumerate(ids)}
+        front = []
+        parts = []
+        for n, layer in enumerate(self.layers):
+            results = self._visible(n, layer.index.ranked(ids))
+            k = 0
+            while k < len(results) and results[k].id in wanted:
+                front.append(results[k])
+                k += 1
+            parts.append((results, k))
+        front.sort(key=lambda s: wanted[s.id])
+        merged = _chain_results([(front, 0)] + parts)
+        with self._lock:
+            self._ranked = (ids, key, merged)
+        return merged
+
+    def fuzzy_search(self, keyword: str, usage=None, limit: int = FUZZY_TOP_K, cancelled=None,
+                     with_scores: bool = False):
+        if not (keyword or "").split():
+            return self.search("")
+        hidden = self._shadowed()
+        scored = []
+        for n, layer in enumerate(self.layers):
+            top = layer.index.fuzzy_search(keyword, usage=usage, limit=limit, cancelled=cancelled, with_scores=True)
+            if top is None:
+                return None
+            scored.extend(
+                (score, -n, -i, snippet) for i, (score, snippet) in enumerate(top)
+                if not n or id(snippet) not in hidden
+            )
+        top = heapq.nlargest(limit, scored, key=lambda item: item[:3])
+        if with_scores:
+            return [(item[0], item[3]) for item in top]
+        return [item[3] for item in top]
+
+
+def get_snippet_sources(config: dict) -> list:
+    """config.json 中的附加片段来源：[{"path": 文件或目录, "name": 名称, "readonly": 是否只读}]。
+
+    path 为目录时使用其中的 snippets.json；name 缺省取目录名，用作 id 前缀（「名称:id」）。
+    """
+    sources = []
+    used = set()
+    for i, item in enumerate(config.get("sources") or []):
+        if isinstance(item, str):
+            item = {"path": item}
+        if not isinstance(item, dict) or not item.get("path"):
+            continue
+        path = os.path.expanduser(str(item["path"]))
+        if os.path.isdir(path) or not os.path.splitext(path)[1]:
+            path = os.path.join(path, SNIPPETS_FILE)
+        name = str(item.get("name") or os.path.basename(os.path.dirname(os.path.abspath(path))) or f"source{i + 1}")
+        name = name.replace(":", "_")
+        while name in used:
+            name += "_"
+        used.add(name)
+        sources.append({"path": path, "name": name, "readonly": bool(item.get("readonly", True))})
+    return sources
+
+
+def create_snippet_store(config: dict, parent=None):
+    """按配置 "store" 选择个人片段库后端：json（默认）或 sqlite；配置了 "sources" 时叠加附加来源。"""
+    store = None
+    if config.get("store") == STORE_BACKEND_SQLITE:
+        if sqlite_backend_available():
+            store = SqliteSnippetStore(parent=parent, json_path=get_snippets_path())
+        else:
+            print("当前 Python 的 SQLite 不支持 FTS5 trigram，改用 JSON 存储。")
+    if store is None:
+        store = SnippetStore(parent=parent)
+    sources = get_snippet_sources(config)
+    if not sources:
+        return store
+    layers = [store] + [
+        SnippetStore(src["path"], readonly=src["readonly"], id_prefix=src["name"] + ":", name=src["name"])
+        for src in sources
+    ]
+    return LayeredSnippetStore(layers, parent=parent)
+
+
+def transfer_format(path: str) -> str:
+    """按路径判断导入格式：目录为文本文件目录，.csv 为 CSV，其余按 JSON Lines。"""
+    if os.path.isdir(path):
+        return TRANSFER_DIR
+    if path.lower().endswith(".csv"):
+        return TRANSFER_CSV
+    return TRANSFER_JSONL
+
+
+def _iter_jsonl(path: str):
+    total = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for raw in f:
+            try:
+                data = json.loads(raw.decode("utf-8-sig"))
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                yield data, f.tell(), total
+
+
+def _iter_csv(path: str):
+    import csv
+    import io
+    total = os.path.getsize(path)
+    with open(path, "rb") as raw:
+        rows = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [h.strip().lower() for h in header]
+        if "content" in names:
+            columns = [(name, names.index(name)) for name in ("id", "title", "content") if name in names]
+        else:
+            # 没有表头：第一列标题、第二列内容（只有一列时作为内容）
+            columns = None
+            rows = _chain_row(header, rows)
+        for row in rows:
+            if columns is not None:
+                data = {name: row[i] for name, i in columns if i < len(row)}
+            elif len(row) > 1:
+                data = {"title": row[0], "content": row[1]}
+            elif row:
+                data = {"content": row[0]}
+            else:
+                continue
+            yield data, raw.tell(), total
+
+
+def _chain_row(first, rows):
+    yield first
+    yield from rows
+
+
+def _iter_text_dir(path: str):
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(TRANSFER_TEXT_SUFFIXES))
+    for done, file in enumerate(files, 1):
+        try:
+            with open(file, "r", encoding="utf-8-sig") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        title = os.path.splitext(os.path.relpath(file, path))[0].replace(os.sep, "/")
+        yield {"title": title, "content": content}, done, len(files)
+
+
+def iter_import_records(path: str):
+    """流式读取待导入的片段：逐条产出 (片段字典, 已读量, 总量)，不把整个文件读进内存。"""
+    fmt = transfer_format(path)
+    if fmt == TRANSFER_DIR:
+        return _iter_text_dir(path)
+    if fmt == TRANSFER_CSV:
+        return _iter_csv(path)
+    return _iter_jsonl(path)
+
+
+def _content_hash(text: str) -> bytes:
+    import hashlib
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _export_filename(title: str, sid, used: set) -> str:
+    """标题转成可用的文件名（保留 / 作为子目录），重名时追加 id。"""
+    parts = [re.sub(r'[\\:*?"<>|\x00-\x1f]', "_", p).strip(" .") for p in (title or "").split("/")]
+    name = "/".join(p[:TRANSFER_FILENAME_CHARS] for p in parts if p) or str(sid)
+    if name.lower() in used:
+        name = f"{name} ({sid})"
+    used.add(name.lower())
+    return name + ".txt"
+
+
+def export_snippets(rows, path: str, fmt: str, report=None, cancelled=None, id_prefix: str = ""):
+    """逐条写出片段，返回写出的条数；被取消时返回 None。
+
+    文件格式先写临时文件再替换，目录格式每条一个 .txt（标题作文件名）。
+    id_prefix 为附加来源的「名称:」前缀，写出时去掉，导出文件与该来源自己的文件一致。
+    """
+
+    def local_id(sid):
+        return sid[len(id_prefix):] if id_prefix and isinstance(sid, str) and sid.startswith(id_prefix) else sid
+
+    import csv
+    total = len(rows)
+    if fmt == TRANSFER_DIR:
+        used = set()
+        os.makedirs(path, exist_ok=True)
+        for n, snippet in enumerate(rows, 1):
+            if cancelled is not None and cancelled():
+                return None
+            file = os.path.join(path, *_export_filename(snippet.title, local_id(snippet.id), used).split("/"))
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            with open(file, "w", encoding="utf-8", newline="") as f:
+                f.write(snippet.content)
+            if report is not None:
+                report(n, total)
+        return total
+    tmp = path + ".tmp"
+    # CSV 带 BOM，Excel 直接打开不乱码
+    with open(tmp, "w", encoding="utf-8-sig" if fmt == TRANSFER_CSV else "utf-8", newline="") as f:
+        writer = csv.writer(f) if fmt == TRANSFER_CSV else None
+        if writer is not None:
+            writer.writerow(("id", "title", "content"))
+        for n, snippet in enumerate(rows, 1):
+            if cancelled is not None and cancelled():
+                break
+            if writer is not None:
+                writer.writerow((local_id(snippet.id), snippet.title, snippet.content))
+            else:
+                data = snippet.to_dict()
+                data["id"] = local_id(data["id"])
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            if report is not None:
+                report(n, total)
+        else:
+            n = total
+    if cancelled is not None and cancelled():
+        os.remove(tmp)
+        return None
+    os.replace(tmp, path)
+    return n
+
+
+class SnippetTransfer(QObject):
+    """片段导入/导出任务：在后台线程流式读写，通过信号报告进度和结果。
+
+    导入时按内容哈希去重（合并模式），并在后台算好索引数据（prepare_many），不改动存储本身；
+    GUI 线程收到 imported 后调用 store.add_many 分配 id 并一次提交。
+    """
+
+    progress = pyqtSignal(int, int)               # 百分比, 已处理条数
+    imported = pyqtSignal(object, object, int, str)  # 新片段, prepare_many 的结果, 跳过的重复条数, 错误信息
+    exported = pyqtSignal(int, str)                # 写出条数, 错误信息
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self._store = store
+        self._cancel = threading.Event()
+        self._percent = -1
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def _report(self, done: int, total: int, count: int) -> None:
+        percent = done * 100 // total if total else 100
+        if percent != self._percent:
+            self._percent = percent
+            self.progress.emit(percent, count)
+
+    def start_import(self, path: str, merge: bool) -> None:
+        threading.Thread(
+            target=self._run_import, args=(path, merge), name="FastTypeImport", daemon=True
+        ).start()
+
+    def _run_import(self, path: str, merge: bool) -> None:
+        import csv
+        import sqlite3
+        blob = _ContentBlob()
+        snippets = []
+        skipped = 0
+        try:
+            seen = {_content_hash(text) for text in self._store.iter_contents()} if merge else set()
+            for count, (data, done, total) in enumerate(iter_import_records(path), 1):
+                if self._cancel.is_set():
+                    break
+                content = data.get("content")
+                content = "" if content is None else str(content)
+                title = str(data.get("title") or "").strip()
+                if content or title:
+                    digest = _content_hash(content)
+                    if merge and digest in seen:
+                        skipped += 1
+                    else:
+                        seen.add(digest)
+                        extra = {k: v for k, v in data.items() if k not in ("id", "title", "content")}
+                        # id 到 add_many 提交时才分配
+                        snippets.append(Snippet.from_dict(
+                            dict(extra, id=None, title=title or "（无标题）", content=content), blob
+                        ))
+                self._report(done, total, count)
+            blob.seal()
+            if self._cancel.is_set():
+                self.imported.emit([], None, skipped, "已取消")
+                return
+            prepared = self._store.prepare_many(snippets)
+        except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+            self.imported.emit([], None, skipped, str(e))
+            return
+        self.imported.emit(snippets, prepared, skipped, "")
+
+    def start_export(self, path: str, fmt: str) -> None:
+        rows = self._store.snapshot()
+        threading.Thread(
+            target=self._run_export, args=(rows, path, fmt), name="FastTypeExport", daemon=True
+        ).start()
+
+    def _run_export(self, rows, path: str, fmt: str) -> None:
+        import sqlite3
+        try:
+            count = export_snippets(
+                rows, path, fmt, report=lambda n, total: self._report(n, total, n), cancelled=self._cancel.is_set,
+                id_prefix=self._store.id_prefix,
+            )
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.exported.emit(0, str(e))
+            return
+        self.exported.emit(count or 0, "已取消" if count is None else "")
+
+
+def get_usage_path() -> str:
+    return os.path.join(os.path.dirname(get_snippets_path()), USAGE_FILE)
+
+
+class UsageStore:
+    """粘贴记录（片段 id、时间、目标程序）：每次粘贴向 usage.log 追加一行，定期合并进 usage.json。
+
+    每个片段（以及每个“程序 + 片段”）维护一个 frecency 键 k：当前分数 = 2^(k - now/H)，
+    H 为半衰期。新增一次使用只需更新该片段的键，而键的大小顺序不随时间变化，
+    所以常用顺序可以一直保存在有序表里增量维护，调出窗口时不必排序。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or get_usage_path()
+        self.log_path = os.path.join(os.path.dirname(self.path), USAGE_LOG_FILE)
+        self._half_life = FRECENCY_HALF_LIFE_DAYS * 86400
+        self._stats = {}    # id -> {"n": 次数, "last": 最近时间戳, "k": frecency 键, "apps": {程序: 键}}
+        self._order = {}    # 程序（"" 为全局） -> [(-键, id)]，按键从大到小
+        self._log_entries = 0
+
+    def load(self) -> None:
+        self._stats = {}
+        self._order = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._stats = {sid: st for sid, st in data.items() if isinstance(st, dict) and "k" in st}
+        except (OSError, ValueError):
+            pass
+        for sid, st in self._stats.items():
+            st.setdefault("apps", {})
+            self._order.setdefault("", []).append((-st["k"], sid))
+            for app, key in st["apps"].items():
+                self._order.setdefault(app, []).append((-key, sid))
+        for order in self._order.values():
+            order.sort()
+        entries = _read_journal(self.log_path)
+        for entry in entries:
+            try:
+                self._apply(str(entry["id"]), float(entry["t"]), entry.get("app") or "")
+            except (KeyError, TypeError, ValueError):
+                continue
+        self._log_entries = len(entries)
+
+    def _bump(self, key, t: float) -> float:
+        """在时刻 t 给键为 key 的分数加 1（key 为 None 表示首次使用）。"""
+        base = t / self._half_life
+        if key is None:
+            return base
+        return base + math.log2(2.0 ** (key - base) + 1.0)
+
+    def _reorder(self, app: str, sid: str, old, new: float) -> None:
+        order = self._order.setdefault(app, [])
+        if old is not None:
+            i = bisect.bisect_left(order, (-old, sid))
+            if i < len(order) and order[i] == (-old, sid):
+                del order[i]
+        bisect.insort(order, (-new, sid))
+
+    def _apply(self, sid: str, t: float, app: str) -> None:
+        st = self._stats.get(sid)
+        if st is None:
+            st = self._stats[sid] = {"n": 0, "last": 0.0, "k": None, "apps": {}}
+        old = st["k"]
+        st["k"] = self._bump(old, t)
+        st["n"] += 1
+        st["last"] = max(st["last"], t)
+        self._reorder("", sid, old, st["k"])
+        if app:
+            old = st["apps"].get(app)
+            st["apps"][app] = self._bump(old, t)
+            self._reorder(app, sid, old, st["apps"][app])
+
+    def record(self, snippet_id: str, app: str = "", t: float = None) -> None:
+        t = time.time() if t is None else t
+        self._apply(snippet_id, t, app or "")
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"id": snippet_id, "t": round(t, 3), "app": app or ""}, ensure_ascii=False) + "\n")
+            self._log_entries += 1
+            if self._log_entries >= USAGE_COMPACT_ENTRIES:
+                self.compact()
+        except OSError:
+            pass
+
+    def compact(self) -> None:
+        if not self._log_entries:
+            return
+        _atomic_write_json(self.path, self._stats)
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self._log_entries = 0
+
+    def ranked(self, app: str = "", limit: int = FRECENCY_TOP) -> list:
+        """最常用的片段 id：先按该程序内的使用排序，再补上全局排序。"""
+        ids = [sid for _, sid in self._order.get(app, [])[:limit]] if app else []
+        if len(ids) < limit:
+            seen = set(ids)
+            for _, sid in self._order.get("", []):
+                if len(ids) >= limit:
+                    break
+                if sid not in seen:
+                    ids.append(sid)
+        return ids
+
+    def entries(self) -> dict:
+        """id -> (次数, 最近时间戳)，供模糊搜索的使用加分。"""
+        return {sid: (st["n"], st["last"]) for sid, st in self._stats.items()}
+
+
+class SnippetTableModel(QAbstractTableModel):
+    """片段列表的轻量模型：只持有片段引用，显示文本在 data() 里按需生成，只有可见行有开销。
+
+    columns 为列字段列表（"title" / "preview" / "id"），preview_len 为内容预览截取长度。
+    """
+
+    HEADERS = {"title": "标题", "preview": "内容预览", "id": "id"}
+    # 增量更新时最多拆成多少段删除，超过则直接重置模型
+    MAX_DIFF_RUNS = 32
+
+    def __init__(self, columns, preview_len=60, parent=None):
+        super().__init__(parent)
+        self._columns = list(columns)
+        self._preview_len = preview_len
+        self._rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and 0 <= section < len(self._columns):
+            return self.HEADERS.get(self._columns[section], "")
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._rows):
+            return None
+        snippet = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            field = self._columns[index.column()]
+            if field == "preview":
+                return snippet.preview(self._preview_len)
+            value = getattr(snippet, field, "")
+            return "" if value is None else str(value)
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignLeft | Qt.AlignVCenter)
+        if role == Qt.UserRole:
+            return snippet
+        return None
+
+    def rows(self) -> list:
+        return self._rows
+
+    def snippet_at(self, row: int):
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        return None
+
+    def set_rows(self, rows) -> None:
+        """替换结果列表。新结果是旧结果的收窄（子序列）或追加时发行增删信号，否则整体重置。
+
+        rows 也可以是按需取数的序列（如 SQLite 结果集），此时总是整体重置。
+        """
+        old = self._rows
+        if rows is old:
+            return
+        if not isinstance(rows, list) or not isinstance(old, list):
+            self.beginResetModel()
+            self._rows = rows
+            self.endResetModel()
+            return
+        runs = self._removed_runs(old, rows)
+        if runs is not None:
+            old = self._rows = list(old)
+            for first, last in reversed(runs):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del old[first:last + 1]
+                self.endRemoveRows()
+            self._rows = rows
+            return
+        n = len(old)
+        if n and len(rows) > n and all(a is b for a, b in zip(old, rows)):
+            self.beginInsertRows(QModelIndex(), n, len(rows) - 1)
+            self._rows = rows
+            self.endInsertRows()
+            return
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+    @classmethod
+    def _removed_runs(cls, old: list, new: list):
+        """new 是 old 的子序列时返回被删除的连续区间 [(first, last), ...]，否则 None。"""
+        if not old or len(new) > len(old):
+            return None
+        runs = []
+        j = 0
+        run_start = None
+        for i, item in enumerate(old):
+            if j < len(new) and new[j] is item:
+                j += 1
+                if run_start is not None:
+                    runs.append((run_start, i - 1))
+                    run_start = None
+                    if len(runs) > cls.MAX_DIFF_RUNS:
+                        return None
+            elif run_start is None:
+                run_start = i
+        if j != len(new):
+            return None
+        if run_start is not None:
+            runs.append((run_start, len(old) - 1))
+        return runs if len(runs) <= cls.MAX_DIFF_RUNS else None
+
+    @contextmanager
+    def inserting(self, row: int, count: int = 1):
+        """在 with 块内由调用方往底层序列的 row 位置插入 count 行。"""
+        self.beginInsertRows(QModelIndex(), row, row + count - 1)
+        try:
+            yield
+        finally:
+            self.endInsertRows()
+
+    @contextmanager
+    def removing(self, row: int):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        try:
+            yield
+        finally:
+            self.endRemoveRows()
+
+    def refresh_row(self, row: int) -> None:
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self._columns) - 1))
+
+
+class SnippetEditDialog(QDialog):
+    """新增/编辑单条片段的对话框。"""
+
+    def __init__(self, parent=None, snippet=None):
+        super().__init__(parent)
+        self.setWindowTitle("编辑片段" if snippet else "新增片段")
+        self.setMinimumWidth(400)
+        layout = QFormLayout(self)
+        self.title_edit = QLineEdit()
+        self.title_edit.setPlaceholderText("标题（用于搜索和列表显示）")
+        layout.addRow("标题：", self.title_edit)
+        self.content_edit = QPlainTextEdit()
+        self.content_edit.setPlaceholderText("内容（粘贴到焦点时的文本，可多行）")
+        self.content_edit.setMinimumHeight(120)
+        layout.addRow("内容：", self.content_edit)
+        btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        btns.accepted.connect(self.accept)
+        btns.rejected.connect(self.reject)
+        layout.addRow(btns)
+        if snippet:
+            self.title_edit.setText(snippet.title)
+            self.content_edit.setPlainText(snippet.content)
+
+    def get_data(self):
+        return {
+            "title": self.title_edit.text().strip(),
+            "content": self.content_edit.toPlainText(),
+        }
+
+
+class SnippetsMaintenanceDialog(QDialog):
+    """片段维护界面：列表 + 新增/编辑/删除。"""
+
+    def __init__(self, parent=None, store=None):
+        """store 由主窗口传入时直接在其上增删改，主窗口的搜索索引随之增量更新。"""
+        super().__init__(parent)
+        self.setWindowTitle("维护片段数据")
+        self.setMinimumSize(640, 400)
+        if store is None:
+            store = create_snippet_store(load_config(), parent=self)
+            store.load()
+        # 叠加了多个来源时只能编辑可写的来源，默认是个人片段库
+        self._stores = store.writable_layers() if isinstance(store, LayeredSnippetStore) else [store]
+        store = self._stores[0]
+        self._store = store
+        store.changed.connect(self._load_table)
+        layout = QVBoxLayout(self)
+        if len(self._stores) > 1:
+            source_layout = QHBoxLayout()
+            source_layout.addWidget(QLabel("片段库："))
+            self.source_combo = QComboBox()
+            for layer in self._stores:
+                self.source_combo.addItem(layer.name or "个人", layer)
+            self.source_combo.currentIndexChanged.connect(self._on_source_changed)
+            source_layout.addWidget(self.source_combo)
+            source_layout.addStretch()
+            layout.addLayout(source_layout)
+        self.model = SnippetTableModel(("title", "preview", "id"), preview_len=80, parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeToContents)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.doubleClicked.connect(self._on_edit)
+        layout.addWidget(self.table)
+        btn_layout = QHBoxLayout()
+        add_btn = QPushButton("新增")
+        add_btn.clicked.connect(self._on_add)
+        edit_btn = QPushButton("编辑")
+        edit_btn.clicked.connect(self._on_edit)
+        del_btn = QPushButton("删除")
+        del_btn.clicked.connect(self._on_delete)
+        import_btn = QPushButton("导入")
+        import_menu = QMenu(import_btn)
+        import_menu.addAction("JSON Lines / CSV 文件…", lambda: self._on_import(directory=False))
+        import_menu.addAction("文本文件目录…", lambda: self._on_import(directory=True))
+        import_btn.setMenu(import_menu)
+        export_btn = QPushButton("导出")
+        export_menu = QMenu(export_btn)
+        export_menu.addAction("JSON Lines…", lambda: self._on_export(TRANSFER_JSONL))
+        export_menu.addAction("CSV…", lambda: self._on_export(TRANSFER_CSV))
+        export_menu.addAction("文本文件目录…", lambda: self._on_export(TRANSFER_DIR))
+        export_btn.setMenu(export_menu)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(add_btn)
+        btn_layout.addWidget(edit_btn)
+        btn_layout.addWidget(del_btn)
+        btn_layout.addSpacing(12)
+        btn_layout.addWidget(import_btn)
+        btn_layout.addWidget(export_btn)
         btn_layout.addStretch()
         btn_layout.addWidget(close_btn)
         layout.addLayout(btn_layout)
+        self._edit_buttons = (add_btn, edit_btn, del_btn, import_btn, export_btn)
+        # 导入/导出进度：任务进行中显示，关闭对话框会取消任务
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        self._transfer = None
         self._load_table()
 
     def _load_table(self):
-        self._snippets = load_snippets()
-        self.table.setRowCount(len(self._snippets))
-        for i, s in enumerate(self._snippets):
-            self.table.setItem(i, 0, QTableWidgetItem(s.get("title", "")))
-            content = s.get("content", "")
-            preview = (content[:80] + "…") if len(content) > 80 else content
-            self.table.setItem(i, 1, QTableWidgetItem(preview))
-            self.table.setItem(i, 2, QTableWidgetItem(s.get("id", "")))
+        # 模型直接引用 store.snippets，之后的增删改由 store 完成、模型发出行级信号
+        self.model.set_rows(self._store.snippets)
+
+    def _on_source_changed(self, i: int):
+        self._store.changed.disconnect(self._load_table)
+        self._store = self._stores[i]
+        self._store.changed.connect(self._load_table)
+        self._load_table()
+
+    def _current_row(self) -> int:
+        index = self.table.currentIndex()
+        return index.row() if index.isValid() else -1
 
     def _on_add(self):
         dlg = SnippetEditDialog(self, snippet=None)
@@ -324,65 +2910,1045 @@ class SnippetsMaintenanceDialog(QDialog):
         data = dlg.get_data()
         if not data["title"] and not data["content"]:
             return
-        new_id = _next_snippet_id(self._snippets)
-        self._snippets.append({
-            "id": new_id,
-            "title": data["title"] or "（无标题）",
-            "content": data["content"],
-        })
-        save_snippets(self._snippets)
-        self._load_table()
+        snippet = Snippet(self._store.next_id(), data["title"] or "（无标题）", data["content"])
+        with self.model.inserting(self.model.rowCount()):
+            self._store.add(snippet)
+        self.table.scrollToBottom()
+
+    def _on_edit(self):
+        row = self._current_row()
+        snippet = self.model.snippet_at(row)
+        if snippet is None:
+            QMessageBox.information(self, "提示", "请先选中一条片段。")
+            return
+        dlg = SnippetEditDialog(self, snippet=snippet)
+        if dlg.exec_() != QDialog.Accepted:
+            return
+        data = dlg.get_data()
+        snippet.title = data["title"] or "（无标题）"
+        snippet.content = data["content"]
+        self._store.update(snippet)
+        self.model.refresh_row(row)
+
+    def _on_delete(self):
+        row = self._current_row()
+        snippet = self.model.snippet_at(row)
+        if snippet is None:
+            QMessageBox.information(self, "提示", "请先选中一条片段。")
+            return
+        title = snippet.title
+        if QMessageBox.question(
+            self, "确认删除",
+            f"确定要删除「{title}」吗？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        ) != QMessageBox.Yes:
+            return
+        with self.model.removing(row):
+            self._store.remove_at(row)
+
+    def _begin_transfer(self) -> SnippetTransfer:
+        transfer = SnippetTransfer(self._store, parent=self)
+        transfer.progress.connect(self._on_transfer_progress)
+        self._transfer = transfer
+        for btn in self._edit_buttons:
+            btn.setEnabled(False)
+        self.table.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+        self.progress_bar.setVisible(True)
+        return transfer
+
+    def _end_transfer(self) -> None:
+        self._transfer = None
+        for btn in self._edit_buttons:
+            btn.setEnabled(True)
+        self.table.setEnabled(True)
+        self.progress_bar.setVisible(False)
+
+    def _on_transfer_progress(self, percent: int, count: int):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"%p%（{count} 条）")
+
+    def _on_import(self, directory: bool):
+        if directory:
+            path = QFileDialog.getExistingDirectory(self, "选择要导入的文本文件目录")
+        else:
+            path, _ = QFileDialog.getOpenFileName(
+                self, "选择要导入的文件", "", "JSON Lines / CSV (*.jsonl *.ndjson *.csv);;所有文件 (*)"
+            )
+        if not path:
+            return
+        answer = QMessageBox.question(
+            self, "导入方式",
+            "是否跳过与现有片段内容相同的条目（合并去重）？\n选择「否」则全部追加。",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+            QMessageBox.Yes,
+        )
+        if answer == QMessageBox.Cancel:
+            return
+        transfer = self._begin_transfer()
+        transfer.imported.connect(self._on_imported)
+        transfer.start_import(path, merge=answer == QMessageBox.Yes)
+
+    def _on_imported(self, snippets, prepared, skipped: int, error: str):
+        self._end_transfer()
+        if snippets:
+            # 后台只做了预处理，此时才真正写入存储
+            with self.model.inserting(self.model.rowCount(), len(snippets)):
+                self._store.add_many(snippets, prepared)
+            self.table.scrollToBottom()
+        if not self.isVisible():
+            return
+        if error:
+            QMessageBox.warning(self, "导入失败", f"导入未完成：{error}")
+            return
+        message = f"已导入 {len(snippets)} 条片段。"
+        if skipped:
+            message += f"\n跳过内容重复的 {skipped} 条。"
+        QMessageBox.information(self, "导入完成", message)
+
+    def _on_export(self, fmt: str):
+        if fmt == TRANSFER_DIR:
+            path = QFileDialog.getExistingDirectory(self, "选择导出目录（每条片段一个 .txt 文件）")
+        else:
+            suffix = ".csv" if fmt == TRANSFER_CSV else ".jsonl"
+            path, _ = QFileDialog.getSaveFileName(
+                self, "导出片段", "snippets" + suffix, f"{fmt.upper()} (*{suffix})"
+            )
+            if path and not path.lower().endswith(suffix):
+                path += suffix
+        if not path:
+            return
+        transfer = self._begin_transfer()
+        transfer.exported.connect(lambda count, error: self._on_exported(path, count, error))
+        transfer.start_export(path, fmt)
+
+    def _on_exported(self, path: str, count: int, error: str):
+        self._end_transfer()
+        if not self.isVisible():
+            return
+        if error:
+            QMessageBox.warning(self, "导出失败", f"导出未完成：{error}")
+            return
+        QMessageBox.information(self, "导出完成", f"已导出 {count} 条片段到\n{path}")
+
+    def done(self, result):
+        if self._transfer is not None:
+            self._transfer.cancel()
+        super().done(result)
+
+
+def _search_errors() -> tuple:
+    """搜索中可预期的错误（读长内容、正则、数据库）；sqlite3 只在用 SQLite 存储时才已导入。"""
+    sqlite3 = sys.modules.get("sqlite3")
+    return (OSError, ValueError, re.error) + ((sqlite3.Error,) if sqlite3 is not None else ())
+
+
+class SearchWorker(QObject):
+    """在后台线程执行搜索。
+
+    每个查询带一个代号（generation），GUI 线程发起新查询时更新 latest_generation，
+    旧查询会在下一次检查时放弃；结果通过 results_ready(代号, 结果列表) 送回 GUI 线程，
+    查询出错时打印错误并发出 search_failed(代号, 错误信息)，界面不会停留在上一次的结果上。
+    """
+
+    results_ready = pyqtSignal(int, object)
+    search_failed = pyqtSignal(int, str)
+
+    def __init__(self, store):
+        super().__init__()
+        self._store = store
+        self.latest_generation = 0
+
+    @pyqtSlot(int, str, str, object, object)
+    def run_query(self, generation, keyword, mode, usage, index=None):
+        def cancelled():
+            return generation != self.latest_generation
+
+        if cancelled():
+            return
+        try:
+            index = index or self._store.index
+            if mode == SEARCH_MODE_FUZZY:
+                results = index.fuzzy_search(keyword, usage=usage, cancelled=cancelled)
+            else:
+                results = index.search(keyword, cancelled=cancelled)
+        except _search_errors() as e:
+            print(f"搜索 {keyword!r} 失败：{e!r}")
+            self.search_failed.emit(generation, str(e) or type(e).__name__)
+            return
+        except Exception:
+            # 程序错误：打印完整堆栈；不让异常逃出槽函数（PyQt 会因此中止进程）
+            import traceback
+            traceback.print_exc()
+            self.search_failed.emit(generation, "内部错误")
+            return
+        if results is not None and not cancelled():
+            self.results_ready.emit(generation, results)
+
+
+class _NoFocusRectDelegate(QStyledItemDelegate):
+    """绘制时不画点状焦点框，选中行样式和缩进保持正常。"""
+
+    def paint(self, painter, option, index):
+        opt = QStyleOptionViewItem(option)
+        opt.state &= ~QStyle.State_HasFocus
+        super().paint(painter, opt, index)
+
+
+def parse_hotkey(keys: str) -> tuple:
+    """把 "ctrl+alt+1" 这类写法解析为 RegisterHotKey 的 (修饰键位, 虚拟键码)；写法不对时抛 ValueError。"""
+    modifiers = 0
+    vk = None
+    for part in keys.lower().split("+"):
+        part = part.strip()
+        if part in _HOTKEY_MODIFIERS:
+            modifiers |= _HOTKEY_MODIFIERS[part]
+        elif vk is not None:
+            raise ValueError(f"热键 {keys!r} 含有多个非修饰键")
+        elif len(part) == 1 and part.isascii() and part.isalnum():
+            vk = ord(part.upper())
+        elif part in _HOTKEY_KEYS:
+            vk = _HOTKEY_KEYS[part]
+        elif part[:1] == "f" and part[1:].isdigit() and 1 <= int(part[1:]) <= 24:
+            vk = 0x70 + int(part[1:]) - 1
+        elif part.startswith("num") and part[3:].isdigit() and len(part) == 4:
+            vk = 0x60 + int(part[3:])
+        else:
+            raise ValueError(f"热键 {keys!r} 中的 {part!r} 无法识别")
+    if vk is None:
+        raise ValueError(f"热键 {keys!r} 缺少按键")
+    return modifiers, vk
+
+
+class HotkeyBinding:
+    """一个全局热键：keys 为 keyboard 风格写法；search 动作可带预填查询 query 和限定来源 source，paste 动作粘贴 snippet。
+
+    native 为 RegisterHotKey 的 (修饰键位, 虚拟键码)，只在 Windows 上解析；其他系统为 None，写法由 keyboard 注册时校验。
+    """
+
+    __slots__ = ("keys", "action", "query", "source", "snippet", "native")
+
+    def __init__(self, keys: str, action: str = HOTKEY_SEARCH, query: str = "", source: str = "", snippet: str = ""):
+        self.keys = keys
+        self.action = action
+        self.query = query
+        self.source = source
+        self.snippet = snippet
+        self.native = parse_hotkey(keys) if sys.platform == "win32" else None
+
+    @property
+    def identity(self):
+        """判断重复用：Windows 上为键码，其他系统为规范化后的写法。"""
+        if self.native is not None:
+            return self.native
+        return "+".join(part.strip() for part in self.keys.lower().split("+"))
+
+    @property
+    def scoped(self) -> bool:
+        return bool(self.query or self.source)
+
+
+def get_hotkey_bindings(config: dict) -> list:
+    """config.json 中的 "hotkeys"：[{"keys": "alt+q"}, {"keys": "ctrl+alt+1", "action": "paste", "snippet": "12"}, ...]。
+
+    未配置时只有默认的 Alt+Q 搜索；写法有误或重复的条目跳过并打印原因。
+    """
+    items = config.get("hotkeys")
+    if not isinstance(items, list):
+        items = [{"keys": HOTKEY}]
+    bindings = []
+    used = set()
+    for item in items:
+        if isinstance(item, str):
+            item = {"keys": item}
+        if not isinstance(item, dict) or not item.get("keys"):
+            continue
+        action = item.get("action") or HOTKEY_SEARCH
+        snippet = str(item.get("snippet") or "")
+        if action not in (HOTKEY_SEARCH, HOTKEY_PASTE) or (action == HOTKEY_PASTE and not snippet):
+            print(f"热键 {item['keys']!r} 的动作无效，已跳过。")
+            continue
+        try:
+            binding = HotkeyBinding(
+                str(item["keys"]), action, str(item.get("query") or ""), str(item.get("source") or ""), snippet
+            )
+        except ValueError as e:
+            print(f"{e}，已跳过。")
+            continue
+        if binding.identity in used:
+            print(f"热键 {binding.keys!r} 重复，已跳过。")
+            continue
+        used.add(binding.identity)
+        bindings.append(binding)
+    return bindings
+
+
+class HotkeyRegistry(QObject):
+    """注册配置中的全部热键，触发时发出 triggered(序号, 收到时的 time.perf_counter())。
+
+    Windows 用原生 RegisterHotKey（第 i 个热键 id 为 HOTKEY_ID_BASE + i，WM_HOTKEY 由主窗口 nativeEvent 交给 dispatch）；
+    其他系统用 keyboard，回调在键盘线程里发信号，由 Qt 排队送到 GUI 线程。
+    """
+
+    triggered = pyqtSignal(int, float)
+
+    def __init__(self, bindings: list, parent=None):
+        super().__init__(parent)
+        self.bindings = bindings
+        self._hwnd = None
+        self._native_ids = []
+        self._handles = []
+
+    def register(self, hwnd: int) -> list:
+        """注册全部热键，返回注册失败的写法列表。"""
+        failed = []
+        if sys.platform == "win32":
+            self._hwnd = hwnd
+            for i, binding in enumerate(self.bindings):
+                hotkey_id = HOTKEY_ID_BASE + i
+                if register_native_hotkey(hwnd, hotkey_id, *binding.native):
+                    self._native_ids.append(hotkey_id)
+                else:
+                    failed.append(binding.keys)
+            return failed
+        try:
+            import keyboard
+        except Exception:
+            return [binding.keys for binding in self.bindings]
+        for i, binding in enumerate(self.bindings):
+            try:
+                self._handles.append(
+                    keyboard.add_hotkey(binding.keys, lambda i=i: self.triggered.emit(i, time.perf_counter()), suppress=False)
+                )
+            except Exception:
+                failed.append(binding.keys)
+        return failed
+
+    def dispatch(self, hotkey_id: int, received_at: float) -> bool:
+        if hotkey_id not in self._native_ids:
+            return False
+        self.triggered.emit(hotkey_id - HOTKEY_ID_BASE, received_at)
+        return True
+
+    def unregister(self) -> None:
+        for hotkey_id in self._native_ids:
+            unregister_native_hotkey(self._hwnd, hotkey_id)
+        self._native_ids = []
+        if self._handles:
+            try:
+                import keyboard
+                for handle in self._handles:
+                    keyboard.remove_hotkey(handle)
+            except Exception:
+                pass
+            self._handles = []
+
+
+class LatencyTracer:
+    """按阶段记录“快捷键→窗口可输入”和粘贴流程的耗时（单调时钟，毫秒）。
+
+    每次交互是一个 span：begin() 开始，mark() 打点，end() 结束后写一行 JSON 到追踪文件，
+    并把各阶段相对上一阶段的耗时放进滚动窗口，用于 p50/p95/p99 统计。只在 GUI 线程调用。
+    """
+
+    def __init__(self, path: str = None, enabled: bool = False, window: int = TRACE_WINDOW):
+        self.enabled = enabled
+        self.path = path or os.path.join(os.path.dirname(get_snippets_path()), TRACE_FILE)
+        self._window = window
+        self._spans = {}
+        self._samples = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "LatencyTracer":
+        env = os.environ.get("FASTTYPE_TRACE", "").strip()
+        enabled = bool(config.get("trace")) or env not in ("", "0")
+        return cls(path=config.get("trace_file") or None, enabled=enabled)
+
+    def begin(self, kind: str, t0: float = None) -> None:
+        """开始一次 kind 类型的交互；t0 为 time.perf_counter() 时刻（如热键到达时），未完成的同类 span 被丢弃。"""
+        if self.enabled:
+            self._spans[kind] = (time.time(), t0 if t0 is not None else time.perf_counter(), [])
+
+    def active(self, kind: str) -> bool:
+        return kind in self._spans
+
+    def mark(self, kind: str, stage: str) -> None:
+        span = self._spans.get(kind)
+        if span is not None:
+            span[2].append((stage, time.perf_counter()))
+
+    def end(self, kind: str, stage: str = None) -> None:
+        if stage is not None:
+            self.mark(kind, stage)
+        span = self._spans.pop(kind, None)
+        if span is None:
+            return
+        wall, t0, marks = span
+        stages = []
+        prev = t0
+        for name, t in marks:
+            self._sample(kind, name, (t - prev) * 1000)
+            stages.append([name, round((t - t0) * 1000, 2)])
+            prev = t
+        self._sample(kind, "total", (prev - t0) * 1000)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"kind": kind, "ts": round(wall, 3), "stages": stages}) + "\n")
+        except OSError:
+            pass
+
+    def _sample(self, kind: str, stage: str, ms: float) -> None:
+        key = (kind, stage)
+        values = self._samples.get(key)
+        if values is None:
+            values = self._samples[key] = deque(maxlen=self._window)
+        values.append(ms)
+
+    @staticmethod
+    def _percentile(ordered: list, pct: float) -> float:
+        k = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+        return ordered[k]
+
+    def stats(self) -> list:
+        """[(kind, stage, 样本数, p50, p95, p99)]，阶段按首次出现的顺序。"""
+        result = []
+        for (kind, stage), values in self._samples.items():
+            ordered = sorted(values)
+            result.append((kind, stage, len(ordered), *(
+                round(self._percentile(ordered, pct), 1) for pct in (50, 95, 99)
+            )))
+        return result
+
+    def report(self) -> str:
+        if not self.enabled:
+            return "延迟追踪未开启：在 config.json 中设置 \"trace\": true 或设置环境变量 FASTTYPE_TRACE=1 后重启。"
+        if not self._samples:
+            return f"还没有记录。调出窗口、粘贴几次后再查看。\n追踪文件：{self.path}"
+        lines = [f"{'阶段':<28}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)"]
+        for kind, stage, n, p50, p95, p99 in self.stats():
+            lines.append(f"{kind + '/' + stage:<28}{n:>6}{p50:>9}{p95:>9}{p99:>9}")
+        lines.append("")
+        lines.append(f"追踪文件：{self.path}")
+        return "\n".join(lines)
+
+
+class PasteTimingProfile:
+    """按目标程序（进程映像名）学习的“切回焦点后、发送按键前”的等待时间，保存在 paste_timing.json。
+
+    没有记录的程序按上限（原来的固定延迟）等待；目标读取了剪贴板说明按键已被接收，下次缩短等待，
+    超时仍未读取则退回上限。等待时间变化时才写文件，只变了命中/未命中计数的留到 flush()（退出时）再写。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(os.path.dirname(get_snippets_path()), PASTE_TIMING_FILE)
+        self._apps = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._apps = {k: v for k, v in data.items() if isinstance(v, dict) and "settle_ms" in v}
+        except (OSError, ValueError):
+            pass
+
+    def settle_ms(self, app: str, upper: float) -> float:
+        entry = self._apps.get(app) if app else None
+        if entry is None:
+            return upper
+        return min(upper, entry["settle_ms"])
+
+    def record(self, app: str, upper: float, read: bool) -> None:
+        if not app:
+            return
+        entry = self._apps.setdefault(app, {"settle_ms": upper, "hits": 0, "misses": 0})
+        previous = entry["settle_ms"]
+        if read:
+            entry["settle_ms"] = round(max(PASTE_SETTLE_MIN_MS, min(upper, previous) * PASTE_SETTLE_SHRINK), 1)
+            entry["hits"] = entry.get("hits", 0) + 1
+        else:
+            entry["settle_ms"] = upper
+            entry["misses"] = entry.get("misses", 0) + 1
+        self._dirty = True
+        if entry["settle_ms"] != previous:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            _atomic_write_json(self.path, self._apps)
+            self._dirty = False
+        except OSError:
+            pass
+
+
+class PasteTarget:
+    """一次粘贴的目标：进程映像名和使用的粘贴方式。"""
+
+    __slots__ = ("process", "method")
+
+    def __init__(self, process: str, method: str):
+        self.process = process
+        self.method = method
+
+    @property
+    def types_text(self) -> bool:
+        return self.method in (PASTE_TYPEWRITER, PASTE_BRACKETED)
+
+    def wrap(self, text: str) -> str:
+        """括号粘贴：键入时包上 ESC[200~ … ESC[201~，让 shell 按整段粘贴处理（不逐行执行）。"""
+        if self.method == PASTE_BRACKETED:
+            return "\x1b[200~" + text + "\x1b[201~"
+        return text
+
+
+def get_default_paste_strategies() -> dict:
+    return {
+        "default": PASTE_CTRL_V,
+        "rules": [
+            {"process": "xshell.exe", "method": PASTE_TYPEWRITER},
+            {"process": "xshellex.exe", "method": PASTE_TYPEWRITER},
+            {"title": "xshell", "method": PASTE_TYPEWRITER},
+            {"process": "putty.exe", "method": PASTE_SHIFT_INSERT},
+            {"process": "kitty.exe", "method": PASTE_SHIFT_INSERT},
+            {"process": "mobaxterm.exe", "method": PASTE_SHIFT_INSERT},
+            {"process": "windowsterminal.exe", "method": PASTE_CTRL_SHIFT_V},
+            {"class": "CASCADIA_HOSTING_WINDOW_CLASS", "method": PASTE_CTRL_SHIFT_V},
+            {"process": "mintty.exe", "method": PASTE_SHIFT_INSERT},
+        ],
+    }
+
+
+class PasteStrategyRegistry:
+    """目标窗口 → 粘贴方式。
+
+    规则按顺序匹配 process（进程映像名）、class（窗口类名）或 title（标题包含），第一条命中的生效；
+    文件不存在时写入默认规则，文件修改后下次查询自动重新读取。查询结果按窗口句柄缓存，
+    进程名按 PID 缓存并持有进程句柄，进程退出后相应缓存被淘汰。
+    """
+
+    def __init__(self, path: str = None, capacity: int = PASTE_TARGET_CACHE):
+        self.path = path or os.path.join(os.path.dirname(get_snippets_path()), PASTE_STRATEGY_FILE)
+        self.capacity = capacity
+        self.default = PASTE_CTRL_V
+        self.rules = []
+        self._stamp = None
+        self._windows = OrderedDict()  # hwnd -> (pid, PasteTarget)
+        self._processes = OrderedDict()  # pid -> (进程句柄, 映像名)
+
+    def _load(self) -> None:
+        stamp = _file_stamp(self.path)
+        if stamp is not None and stamp == self._stamp:
+            return
+        data = get_default_paste_strategies()
+        if stamp is None:
+            try:
+                _atomic_write_json(self.path, data)
+                stamp = _file_stamp(self.path)
+            except OSError:
+                pass
+        else:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    data = loaded
+            except (OSError, ValueError):
+                pass
+        self._stamp = stamp
+        default = data.get("default", PASTE_CTRL_V)
+        self.default = default if default in PASTE_METHODS else PASTE_CTRL_V
+        self.rules = []
+        for rule in data.get("rules") or []:
+            if not isinstance(rule, dict) or rule.get("method") not in PASTE_METHODS:
+                continue
+            for field in ("process", "class", "title"):
+                value = rule.get(field)
+                if isinstance(value, str) and value:
+                    self.rules.append((field, value.lower(), rule["method"]))
+                    break
+        self._windows.clear()
+
+    def _evict_exited(self) -> None:
+        for pid, (handle, _name) in list(self._processes.items()):
+            if process_exited(handle):
+                self._drop_process(pid)
+
+    def _drop_process(self, pid) -> None:
+        handle, _name = self._processes.pop(pid)
+        close_process(handle)
+        for hwnd in [h for h, (p, _t) in self._windows.items() if p == pid]:
+            del self._windows[hwnd]
+
+    def _process_name(self, pid) -> str:
+        entry = self._processes.get(pid)
+        if entry is not None:
+            self._processes.move_to_end(pid)
+            return entry[1]
+        handle = open_process(pid)
+        if handle is None:
+            return ""
+        name = process_image_name(handle)
+        self._processes[pid] = (handle, name)
+        if len(self._processes) > self.capacity:
+            self._drop_process(next(iter(self._processes)))
+        return name
+
+    def _match(self, process: str, hwnd) -> str:
+        window_class = title = None
+        for field, value, method in self.rules:
+            if field == "process":
+                if process == value:
+                    return method
+            elif field == "class":
+                if window_class is None:
+                    window_class = get_window_class(hwnd).lower()
+                if window_class == value:
+                    return method
+            else:
+                if title is None:
+                    title = get_window_title(hwnd).lower()
+                if value in title:
+                    return method
+        return self.default
+
+    def resolve(self, hwnd) -> PasteTarget:
+        self._load()
+        pid = get_window_pid(hwnd) if hwnd else None
+        if pid is None:
+            return PasteTarget("", self.default)
+        self._evict_exited()
+        cached = self._windows.get(hwnd)
+        if cached is not None and cached[0] == pid and pid in self._processes:
+            self._windows.move_to_end(hwnd)
+            return cached[1]
+        process = self._process_name(pid)
+        target = PasteTarget(process, self._match(process, hwnd))
+        if pid in self._processes:
+            self._windows[hwnd] = (pid, target)
+            if len(self._windows) > self.capacity:
+                self._windows.popitem(last=False)
+        return target
+
+    def close(self) -> None:
+        for pid in list(self._processes):
+            self._drop_process(pid)
+
+
+class ClipboardManager(QObject):
+    """基于 QClipboard 的剪贴板暂存/恢复：保存全部 MIME 格式（图片、富文本等），不调用外部程序。
+
+    窗口弹出后在空闲时预先取快照（prefetch），粘贴时剪贴板若没再变化就直接用，不占粘贴路径的时间。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._clipboard = QApplication.clipboard()
+        self._snapshot = None
+        self._clipboard.dataChanged.connect(self._invalidate)
+
+    def _invalidate(self):
+        self._snapshot = None
+
+    def _take(self) -> dict:
+        mime = self._clipboard.mimeData()
+        snapshot = {}
+        if mime is not None:
+            for fmt in mime.formats():
+                snapshot[fmt] = bytes(mime.data(fmt))
+        return snapshot
+
+    def prefetch(self) -> None:
+        if self._snapshot is None:
+            try:
+                self._snapshot = self._take()
+            except Exception:
+                self._snapshot = None
+
+    def snapshot(self) -> dict:
+        """取出当前剪贴板内容（格式 -> 字节），优先用预取的快照。"""
+        snapshot, self._snapshot = self._snapshot, None
+        if snapshot is None:
+            try:
+                snapshot = self._take()
+            except Exception:
+                snapshot = {}
+        return snapshot
+
+    def set_text(self, text: str) -> None:
+        self._clipboard.setText(text)
+
+    def text(self) -> str:
+        return self._clipboard.text()
+
+    def restore(self, snapshot: dict) -> None:
+        if not snapshot:
+            self._clipboard.clear()
+            return
+        mime = QMimeData()
+        for fmt, data in snapshot.items():
+            mime.setData(fmt, QByteArray(data))
+        self._clipboard.setMimeData(mime)
+
+
+class TemplateCancelled(Exception):
+    """渲染模板时用户取消了输入。"""
+
+
+class TemplateRenderer:
+    """粘贴时按片段的渲染计划展开占位符（计划已在加载时编译好，这里只做拼接）。
+
+    lookup(id) 取被引用的片段，ask(提示) 询问 {input:…} 的值（返回 None 表示取消），
+    clipboard() 返回当前剪贴板文本。同一批粘贴中相同提示只问一次。
+    """
+
+    def __init__(self, lookup, ask, clipboard):
+        self._lookup = lookup
+        self._ask = ask
+        self._clipboard = clipboard
+        self._inputs = {}
+        self._now = None
+
+    def render(self, snippet: Snippet) -> str:
+        return self._render(snippet, (snippet.id,))
+
+    def _render(self, snippet: Snippet, stack: tuple) -> str:
+        plan = snippet.plan
+        if not plan:
+            return snippet.content
+        out = []
+        for part in plan:
+            if isinstance(part, str):
+                out.append(part)
+                continue
+            name, arg = part
+            if name in _TEMPLATE_TIME_FORMATS:
+                if self._now is None:
+                    self._now = time.localtime()
+                try:
+                    out.append(time.strftime(arg or _TEMPLATE_TIME_FORMATS[name], self._now))
+                except ValueError:
+                    out.append(self._literal(name, arg))
+            elif name == "clipboard":
+                out.append(self._clipboard())
+            elif name == "input":
+                if arg not in self._inputs:
+                    value = self._ask(arg)
+                    if value is None:
+                        raise TemplateCancelled(arg)
+                    self._inputs[arg] = value
+                out.append(self._inputs[arg])
+            else:
+                # 附加来源中的片段（id 为「来源名:id」）优先引用同一来源里的片段
+                source, sep, _ = str(snippet.id).partition(":")
+                ref = self._lookup(f"{source}:{arg}") if sep else None
+                if ref is not None:
+                    arg = f"{source}:{arg}"
+                else:
+                    ref = self._lookup(arg)
+                if ref is None or arg in stack or len(stack) >= TEMPLATE_MAX_DEPTH:
+                    out.append(self._literal(name, arg))
+                else:
+                    out.append(self._render(ref, stack + (arg,)))
+        return "".join(out)
+
+    @staticmethod
+    def _literal(name: str, arg) -> str:
+        return "{" + name + (":" + arg if arg is not None else "") + "}"
+
+
+class _SendInputSink:
+    """Windows：SendInput 发送 Unicode 字符事件，不依赖键盘布局。"""
+
+    def send(self, text: str) -> None:
+        send_unicode_text(text)
+
+    def cancel_requested(self) -> bool:
+        return escape_pressed()
+
+
+class _KeyboardSink:
+    """其他系统：用 keyboard 按块写入。"""
+
+    def send(self, text: str) -> None:
+        import keyboard
+        keyboard.write(text, delay=0)
+
+    def cancel_requested(self) -> bool:
+        import keyboard
+        return keyboard.is_pressed("esc")
+
+
+class FakeInputSink:
+    """测试用：不发送按键，只记录收到的文本（给了 path 时同时追加写入该文件）。"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.chunks = []
+        self.cancelled = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def send(self, text: str) -> None:
+        self.chunks.append(text)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text)
+
+    def cancel_requested(self) -> bool:
+        return self.cancelled
+
+
+def create_input_sink():
+    """环境变量 FASTTYPE_INPUT_SINK=<文件> 时用 FakeInputSink 写入该文件，便于在 Linux 上测试。"""
+    path = os.environ.get("FASTTYPE_INPUT_SINK")
+    if path:
+        return FakeInputSink(path)
+    if sys.platform == "win32":
+        return _SendInputSink()
+    return _KeyboardSink()
+
+
+class TypewriterEngine(QObject):
+    """逐字键入引擎：在后台线程按块发送文本，块间留间隔；按 Esc 或 cancel() 可中止。"""
+
+    finished = pyqtSignal(int, bool, int)  # 任务号, 是否完整键入, 已键入字符数
+
+    def __init__(self, sink=None, chunk_chars: int = TYPEWRITER_CHUNK_CHARS,
+                 interval_ms: float = TYPEWRITER_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.sink = sink if sink is not None else create_input_sink()
+        self.chunk_chars = max(1, int(chunk_chars))
+        self.interval_ms = max(0.0, float(interval_ms))
+        self._job = 0
+        self._cancel = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: dict, parent=None) -> "TypewriterEngine":
+        return cls(
+            chunk_chars=config.get("typewriter_chunk_chars", TYPEWRITER_CHUNK_CHARS),
+            interval_ms=config.get("typewriter_interval_ms", TYPEWRITER_INTERVAL_MS),
+            parent=parent,
+        )
+
+    def type_text(self, text: str) -> int:
+        """开始键入，返回任务号；进行中的上一个任务会被取消。"""
+        self.cancel()
+        self._job += 1
+        self._cancel = threading.Event()
+        text = text.replace("\r\n", "\n")
+        threading.Thread(
+            target=self._run, args=(self._job, text, self._cancel), name="FastTypeTypewriter", daemon=True
+        ).start()
+        return self._job
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def _run(self, job: int, text: str, cancel: threading.Event) -> None:
+        sent = 0
+        completed = False
+        try:
+            for start in range(0, len(text), self.chunk_chars):
+                if cancel.is_set() or self.sink.cancel_requested():
+                    break
+                chunk = text[start:start + self.chunk_chars]
+                self.sink.send(chunk)
+                sent += len(chunk)
+                if self.interval_ms and sent < len(text):
+                    cancel.wait(self.interval_ms / 1000)
+            else:
+                completed = True
+        except Exception:
+            pass
+        self.finished.emit(job, completed, sent)
 
-    def _on_edit(self):
-        row = self.table.currentRow()
-        if row < 0 or row >= len(self._snippets):
-            QMessageBox.information(self, "提示", "请先选中一条片段。")
-            return
-        snippet = self._snippets[row]
-        dlg = SnippetEditDialog(self, snippet=snippet)
-        if dlg.exec_() != QDialog.Accepted:
-            return
-        data = dlg.get_data()
-        snippet["title"] = data["title"] or "（无标题）"
-        snippet["content"] = data["content"]
-        save_snippets(self._snippets)
-        self._load_table()
 
-    def _on_delete(self):
-        row = self.table.currentRow()
-        if row < 0 or row >= len(self._snippets):
-            QMessageBox.information(self, "提示", "请先选中一条片段。")
-            return
-        title = self._snippets[row].get("title", "")
-        if QMessageBox.question(
-            self, "确认删除",
-            f"确定要删除「{title}」吗？",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No,
-        ) != QMessageBox.Yes:
-            return
-        self._snippets.pop(row)
-        save_snippets(self._snippets)
-        self._load_table()
+_ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
 
 
-class _NoFocusRectDelegate(QStyledItemDelegate):
-    """绘制时不画点状焦点框，选中行样式和缩进保持正常。"""
+class PreviewLoader(QObject):
+    """在后台线程读取片段内容的前 PREVIEW_MAX_CHARS 个字符供预览，结果放进小型 LRU 缓存。
 
-    def paint(self, painter, option, index):
-        opt = QStyleOptionViewItem(option)
-        opt.state &= ~QStyle.State_HasFocus
-        super().paint(painter, opt, index)
+    request() 用新的预读列表替换尚未处理的旧请求；每读完一条发出 loaded(片段)。
+    """
+
+    loaded = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cache = OrderedDict()   # id(片段) -> (片段, 文本, 是否截断)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def read(snippet: Snippet):
+        text = snippet.head(PREVIEW_MAX_CHARS + 1).replace("\r\n", "\n")
+        return text[:PREVIEW_MAX_CHARS], len(text) > PREVIEW_MAX_CHARS
+
+    def get(self, snippet: Snippet):
+        """已缓存时返回 (文本, 是否截断)，否则 None。"""
+        with self._lock:
+            entry = self._cache.get(id(snippet))
+            if entry is None or entry[0] is not snippet:
+                return None
+            self._cache.move_to_end(id(snippet))
+            return entry[1:]
+
+    def request(self, snippets) -> None:
+        with self._lock:
+            self._pending = deque(
+                s for s in snippets
+                if s is not None and (self._cache.get(id(s)) or (None,))[0] is not s
+            )
+            if not self._pending:
+                return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="FastTypePreview", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._pending.clear()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._pending:
+                    self._wake.clear()
+                    continue
+                snippet = self._pending.popleft()
+            try:
+                text, truncated = self.read(snippet)
+            except Exception:
+                continue
+            with self._lock:
+                self._cache[id(snippet)] = (snippet, text, truncated)
+                while len(self._cache) > PREVIEW_CACHE:
+                    self._cache.popitem(last=False)
+            self.loaded.emit(snippet)
 
 
 class MainWindow(QWidget):
+    _search_requested = pyqtSignal(int, str, str, object, object)
+    # 调出后搜索框真正拿到焦点时发出，参数为从调出到获得焦点的毫秒数
+    focus_acquired = pyqtSignal(float)
+
     def __init__(self):
         super().__init__()
-        self.snippets = []
+        self.config = load_config()
+        self.tracer = LatencyTracer.from_config(self.config)
+        self.paste_timing = PasteTimingProfile()
+        self.paste_strategies = PasteStrategyRegistry()
+        # 调出窗口前的前台窗口及其进程名：在热键处理中取一次并缓存，显示路径只读缓存
+        self._prev_foreground_hwnd = None
+        self._target_process = ""
+        self.clipboard = ClipboardManager(self)
+        # 延迟渲染中的剪贴板文本（仅 Windows），目标读取后 _clip_rendered 置真
+        self._clip_offer = None
+        self._clip_rendered = False
+        self.typewriter = TypewriterEngine.from_config(self.config, parent=self)
+        self.typewriter.finished.connect(self._on_typing_finished)
+        self._typing_job = 0
+        self._after_typing = None
+        # 批量粘贴：Ctrl+回车加入队列的片段；发送中尚未粘贴的文本
+        self._queued = []
+        self._paste_pending = deque()
+        self._paste_separator_key = None
+        self.batch_separator = self.config.get("batch_separator", BATCH_SEPARATOR_TAB)
+        if self.batch_separator not in BATCH_SEPARATORS:
+            self.batch_separator = BATCH_SEPARATOR_TAB
+        self.store = create_snippet_store(self.config, parent=self)
+        self.store.changed.connect(self._on_store_changed)
         self.filtered = []
         self.selected_index = 0
+        self.search_mode = self.config.get("search_mode", SEARCH_MODE_SUBSTRING)
+        if self.search_mode not in SEARCH_MODE_LABELS:
+            self.search_mode = SEARCH_MODE_SUBSTRING
+        # 使用记录：空查询按常用程度排序；_usage 为 id -> (次数, 最近时间戳)，用于模糊模式加分
+        self.usage = UsageStore()
+        self.usage.load()
+        self._usage = self.usage.entries()
+        self._scope_source = ""
+        self.hotkeys = HotkeyRegistry(get_hotkey_bindings(self.config), self)
+        self.hotkeys.triggered.connect(self._on_hotkey, Qt.QueuedConnection)
+        self._setup_search_worker()
         self._setup_ui()
-        self._load_snippets()
+        self._setup_preview()
+        self._setup_ready_state()
+        # 片段在后台线程加载，窗口先建好；加载完成后 store.changed 会刷新结果
+        self.tracer.begin("load")
+        self.store.load_async()
+        self.store.watch()
+
+    def _setup_ready_state(self):
+        """隐藏期间让窗口保持“就绪状态”：空查询的结果页已排好并渲染过，调出时只需 show。"""
+        self._ready_key = None
+        self._ready_timer = QTimer(self)
+        self._ready_timer.setSingleShot(True)
+        self._ready_timer.setInterval(READY_STATE_DELAY_MS)
+        self._ready_timer.timeout.connect(self._prepare_ready_state)
+        # 调出后等待窗口激活；超时先重抢一次前台，再超时放弃
+        self._focus_pending = False
+        self._focus_retried = False
+        self._shown_at = 0.0
+        self._focus_timer = QTimer(self)
+        self._focus_timer.setSingleShot(True)
+        self._focus_timer.timeout.connect(self._on_focus_timeout)
+
+    def _schedule_ready_state(self):
+        self._ready_key = None
+        if not self.isVisible():
+            self._ready_timer.start()
+
+    def _prepare_ready_state(self):
+        """在空闲时清空搜索框、排好空查询结果并离屏绘制一遍，把布局、样式和首屏渲染的开销挪出调出路径。"""
+        if self.isVisible() or not self.store.is_loaded():
+            return
+        ids = tuple(self.usage.ranked(self._target_app()))
+        self._scope_source = ""
+        self.search_edit.blockSignals(True)
+        self.search_edit.clear()
+        self.search_edit.blockSignals(False)
+        self.selected_index = 0
+        self._search_timer.stop()
+        self._show_results(self._next_search_generation(), self.store.index.ranked(ids))
+        self.result_table.scrollToTop()
+        self.winId()
+        self.ensurePolished()
+        self.layout().activate()
+        self.grab()
+        self._ready_key = ids
+
+    def _setup_search_worker(self):
+        """输入时的搜索放到后台线程：防抖合并连续按键，过期结果按代号丢弃。"""
+        self._search_generation = 0
+        self._results_generation = 0
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self._start_search)
+        self._search_thread = QThread(self)
+        self._search_worker = SearchWorker(self.store)
+        self._search_worker.moveToThread(self._search_thread)
+        self._search_requested.connect(self._search_worker.run_query)
+        self._search_worker.results_ready.connect(self._on_search_results)
+        self._search_worker.search_failed.connect(self._on_search_failed)
+        self._search_thread.start()
+
+    def stop_search_thread(self):
+        self._next_search_generation()
+        self._search_thread.quit()
+        self._search_thread.wait()
 
     def _setup_ui(self):
         self.setWindowTitle("FastType")
@@ -405,9 +3971,9 @@ class MainWindow(QWidget):
         layout.addWidget(self.search_edit)
 
         # 结果列表：无表头，标题列固定宽、内容列拉伸
-        self.result_table = QTableWidget()
-        self.result_table.setColumnCount(2)
-        self.result_table.setHorizontalHeaderLabels(["标题", "内容预览"])
+        self.result_model = SnippetTableModel(("title", "preview"), preview_len=60, parent=self)
+        self.result_table = QTableView()
+        self.result_table.setModel(self.result_model)
         self.result_table.horizontalHeader().setVisible(False)
         self.result_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
         self.result_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
@@ -416,24 +3982,58 @@ class MainWindow(QWidget):
         self.result_table.verticalHeader().setDefaultSectionSize(28)
         self.result_table.horizontalHeader().setDefaultAlignment(Qt.AlignLeft | Qt.AlignVCenter)
         self.result_table.setAlternatingRowColors(False)
-        self.result_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.result_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.result_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.result_table.setFocusPolicy(Qt.StrongFocus)
         self.result_table.setShowGrid(False)
         self.result_table.setAttribute(11, False)  # Qt.WA_ShowFocusRect
         self.result_table.setItemDelegate(_NoFocusRectDelegate(self.result_table))
-        self.result_table.cellDoubleClicked.connect(self._on_cell_activated)
-        self.result_table.currentCellChanged.connect(self._on_row_changed)
-        layout.addWidget(self.result_table)
+        self.result_table.doubleClicked.connect(self._on_cell_activated)
+        self.result_table.selectionModel().currentRowChanged.connect(self._on_row_changed)
+
+        # 预览区：选中片段的完整内容（长内容后台读取、分块填入），高亮当前搜索词
+        self.preview_edit = QPlainTextEdit()
+        self.preview_edit.setObjectName("preview")
+        self.preview_edit.setReadOnly(True)
+        self.preview_edit.setFocusPolicy(Qt.NoFocus)
+        self.preview_edit.setUndoRedoEnabled(False)
+        self.preview_hint = QLabel(f"内容较长，仅预览前 {PREVIEW_MAX_CHARS // 1024}K 字符")
+        self.preview_hint.setVisible(False)
+        preview_box = QWidget()
+        preview_layout = QVBoxLayout(preview_box)
+        preview_layout.setContentsMargins(0, 0, 0, 0)
+        preview_layout.setSpacing(2)
+        preview_layout.addWidget(self.preview_edit)
+        preview_layout.addWidget(self.preview_hint)
+        splitter = QSplitter(Qt.Vertical)
+        splitter.setChildrenCollapsible(False)
+        splitter.addWidget(self.result_table)
+        splitter.addWidget(preview_box)
+        splitter.setSizes([250, 140])
+        layout.addWidget(splitter)
 
         # 状态栏
         status = QHBoxLayout()
         self.status_label = QLabel("0 条")
+        self.mode_btn = QPushButton()
+        self.mode_btn.setFlat(True)
+        self.mode_btn.setToolTip("切换搜索模式：包含（按文件顺序）/ 模糊（按相关度排序）")
+        self.mode_btn.clicked.connect(self._toggle_search_mode)
+        self._update_mode_button()
+        self.separator_btn = QPushButton()
+        self.separator_btn.setFlat(True)
+        self.separator_btn.setToolTip("批量粘贴时条目之间按的键：Tab / 回车 / 无")
+        self.separator_btn.clicked.connect(self._toggle_batch_separator)
+        self._update_separator_button()
         open_btn = QPushButton("编辑片段数据")
         open_btn.setFlat(True)
         open_btn.clicked.connect(self._open_snippets_file)
         status.addWidget(self.status_label)
         status.addStretch()
+        status.addWidget(self.separator_btn)
+        status.addSpacing(12)
+        status.addWidget(self.mode_btn)
+        status.addSpacing(12)
         status.addWidget(open_btn)
         status_widget = QWidget()
         status_widget.setObjectName("statusBar")
@@ -458,18 +4058,18 @@ class MainWindow(QWidget):
             }
             QLineEdit:focus { outline: none; }
             QLineEdit::placeholder { color: #8e8e93; }
-            QTableWidget {
+            QTableView {
                 background: #fff;
                 border: none;
                 border-radius: 6px;
                 gridline-color: transparent;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 4px 10px;
                 font-size: 13px;
                 color: #1d1d1f;
             }
-            QTableWidget::item:selected, QTableWidget::item:hover {
+            QTableView::item:selected, QTableView::item:hover {
                 background: #e8e8ed;
                 color: #1d1d1f;
             }
@@ -480,6 +4080,15 @@ class MainWindow(QWidget):
                 border: none;
                 background: transparent;
             }
+            QPlainTextEdit#preview {
+                background: #fff;
+                border: none;
+                border-radius: 6px;
+                padding: 4px 6px;
+                color: #1d1d1f;
+                font-family: "Consolas", "Menlo", "Microsoft YaHei", monospace;
+                font-size: 12px;
+            }
             QPushButton:hover { color: #0051d5; }
             QLabel { color: #8e8e93; font-size: 12px; }
             #statusBar {
@@ -495,28 +4104,30 @@ class MainWindow(QWidget):
 
     def eventFilter(self, obj, event):
         from PyQt5.QtCore import QEvent
-        if obj == self.search_edit and event.type() == QEvent.KeyPress:
-            if event.key() in (Qt.Key_Down, Qt.Key_Up):
+        if obj == self.search_edit and event.type() == QEvent.FocusIn and self._focus_pending:
+            self._on_focus_acquired()
+        if obj in (self.search_edit, self.result_table) and event.type() == QEvent.KeyPress:
+            key = event.key()
+            modifiers = event.modifiers()
+            if key in (Qt.Key_Return, Qt.Key_Enter) and modifiers & Qt.ControlModifier:
+                self._queue_selected()
+                return True
+            if key in (Qt.Key_Down, Qt.Key_Up):
                 self.result_table.setFocus()
-                self._move_selection(1 if event.key() == Qt.Key_Down else -1)
+                self._move_selection(1 if key == Qt.Key_Down else -1, bool(modifiers & Qt.ShiftModifier))
                 return True
         if obj == self.result_table:
-            from PyQt5.QtCore import QEvent
             if event.type() == QEvent.KeyPress:
                 key = event.key()
                 if key == Qt.Key_Return or key == Qt.Key_Enter:
                     self._paste_current()
                     return True
-                if key == Qt.Key_Up:
-                    self._move_selection(-1)
-                    return True
-                if key == Qt.Key_Down:
-                    self._move_selection(1)
-                    return True
         return super().eventFilter(obj, event)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
+            self._queued = []
+            self._update_status()
             self.hide()
             return
         if event.key() in (Qt.Key_Up, Qt.Key_Down):
@@ -525,133 +4136,588 @@ class MainWindow(QWidget):
             return
         super().keyPressEvent(event)
 
-    def _load_snippets(self):
-        self.snippets = load_snippets()
-        self._apply_filter()
+    def _on_store_changed(self):
+        """片段数据被（后台）重新加载后刷新结果；窗口隐藏时在空闲时重建就绪状态。"""
+        self.tracer.end("load", "snippet_load")
+        self._reset_preview()
+        if self.isVisible():
+            self._apply_filter()
+        else:
+            self._schedule_ready_state()
 
     def _on_search_changed(self, text):
+        if not text.strip():
+            self._apply_filter()
+            return
+        self._next_search_generation()
+        self._search_timer.start()
+
+    def _next_search_generation(self) -> int:
+        self._search_generation += 1
+        self._search_worker.latest_generation = self._search_generation
+        return self._search_generation
+
+    def _start_search(self):
+        generation = self._next_search_generation()
+        keyword = self.search_edit.text().strip()
+        self._search_requested.emit(generation, keyword, self.search_mode, dict(self._usage), self._scope_index())
+
+    def _on_search_results(self, generation, results):
+        if generation != self._search_generation:
+            return
+        self._show_results(generation, results)
+
+    def _on_search_failed(self, generation, message):
+        if generation != self._search_generation:
+            return
+        self._show_results(generation, [])
+        self.status_label.setText(f"搜索失败：{message}")
+
+    def _search_pending(self) -> bool:
+        return self._results_generation != self._search_generation
+
+    def _update_mode_button(self):
+        self.mode_btn.setText(f"模式：{SEARCH_MODE_LABELS[self.search_mode]}")
+
+    def _toggle_search_mode(self):
+        if self.search_mode == SEARCH_MODE_SUBSTRING:
+            self.search_mode = SEARCH_MODE_FUZZY
+        else:
+            self.search_mode = SEARCH_MODE_SUBSTRING
+        self.config["search_mode"] = self.search_mode
+        try:
+            save_config(self.config)
+        except Exception:
+            pass
+        self._update_mode_button()
+        self.selected_index = 0
         self._apply_filter()
+        self.search_edit.setFocus()
 
     def _apply_filter(self):
+        """在 GUI 线程同步搜索（显示窗口、切换模式等场景），并作废进行中的后台查询。"""
+        self._search_timer.stop()
+        generation = self._next_search_generation()
         keyword = self.search_edit.text().strip()
-        self.filtered = filter_snippets(self.snippets, keyword)
+        index = self._scope_index() or self.store.index
+        if not keyword:
+            # 空查询：常用片段在前（当前目标程序里用得多的优先），顺序已预先维护好
+            results = index.ranked(self.usage.ranked(self._target_app()))
+        elif self.search_mode == SEARCH_MODE_FUZZY:
+            results = index.fuzzy_search(keyword, usage=self._usage)
+        else:
+            results = index.search(keyword)
+        self.tracer.mark("popup", "filter")
+        self._show_results(generation, results)
+        self.tracer.mark("popup", "table_refresh")
+
+    def _show_results(self, generation, results):
+        self._results_generation = generation
+        self.filtered = results
         self.selected_index = min(self.selected_index, max(0, len(self.filtered) - 1))
         self._refresh_list()
-        self.status_label.setText(f"{len(self.filtered)} 条")
+        self._update_status()
+
+    def _scope_index(self):
+        """当前热键限定的来源（config "sources" 中的 name）的索引；未限定或找不到该来源时为 None。"""
+        if not self._scope_source:
+            return None
+        for layer in getattr(self.store, "layers", ()):
+            if layer.name == self._scope_source:
+                return layer.index
+        return None
+
+    def _update_status(self):
+        text = f"{len(self.filtered)} 条"
+        if self._scope_index() is not None:
+            text = f"来源：{self._scope_source}  ·  " + text
+        if self._queued:
+            text += f"  ·  队列 {len(self._queued)} 条（回车依次粘贴）"
+        self.status_label.setText(text)
 
     def _refresh_list(self):
-        self.result_table.setRowCount(len(self.filtered))
-        align_left = Qt.AlignLeft | Qt.AlignVCenter
-        for i, s in enumerate(self.filtered):
-            title = s.get("title", "")
-            content = s.get("content", "")
-            preview = (content[:60] + "…") if len(content) > 60 else content
-            title_item = QTableWidgetItem(title)
-            title_item.setData(Qt.UserRole, content)
-            title_item.setTextAlignment(align_left)
-            self.result_table.setItem(i, 0, title_item)
-            preview_item = QTableWidgetItem(preview)
-            preview_item.setTextAlignment(align_left)
-            self.result_table.setItem(i, 1, preview_item)
+        self.result_model.set_rows(self.filtered)
         if self.filtered:
-            self.result_table.setCurrentCell(self.selected_index, 0)
-            self.result_table.scrollTo(self.result_table.model().index(self.selected_index, 0))
+            self._select_row(self.selected_index)
+        self._update_preview()
+
+    def _select_row(self, row: int):
+        index = self.result_model.index(row, 0)
+        self.result_table.setCurrentIndex(index)
+        self.result_table.scrollTo(index)
 
-    def _on_row_changed(self, row, col, prev_row, prev_col):
+    def _on_row_changed(self, current, previous):
+        row = current.row()
         if 0 <= row < len(self.filtered):
             self.selected_index = row
+        self._update_preview()
+
+    def _setup_preview(self):
+        self.preview_loader = PreviewLoader(self)
+        self.preview_loader.loaded.connect(self._on_preview_loaded)
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(PREVIEW_SETTLE_MS)
+        self._preview_timer.timeout.connect(self._load_preview)
+        self._preview_fill_timer = QTimer(self)
+        self._preview_fill_timer.setInterval(0)
+        self._preview_fill_timer.timeout.connect(self._fill_preview)
+        self._preview_snippet = None    # 预览区对应的片段（可能还在等待读取）
+        self._preview_text = None       # 已读到的预览文本，None 表示尚未读到
+        self._preview_pos = 0           # 已填入控件的字符数
+        self._preview_matches = None    # (查询, [(起点, 长度)])
+
+    def _current_snippet(self):
+        if 0 <= self.selected_index < len(self.filtered):
+            return self.filtered[self.selected_index]
+        return None
+
+    def _preview_neighbours(self) -> list:
+        n = len(self.filtered)
+        rows = []
+        for d in range(1, PREVIEW_PREFETCH_ROWS + 1):
+            rows += [self.selected_index + d, self.selected_index - d]
+        return [self.filtered[r] for r in rows if 0 <= r < n]
+
+    def _update_preview(self):
+        """选中行或查询变化时更新预览：已缓存（或内容较短）立即显示，否则等选择停下来再后台读取。"""
+        snippet = self._current_snippet()
+        if snippet is self._preview_snippet:
+            if self._preview_text is not None:
+                self._highlight_preview()
+            return
+        self._preview_snippet = snippet
+        self._preview_text = None
+        self._preview_fill_timer.stop()
+        if snippet is None:
+            self._preview_timer.stop()
+            self.preview_edit.clear()
+            self.preview_hint.setVisible(False)
+            return
+        if snippet.content_source is None:
+            self._render_preview(*PreviewLoader.read(snippet))
+        else:
+            cached = self.preview_loader.get(snippet)
+            if cached is not None:
+                self._render_preview(*cached)
+            else:
+                # 不显示上一条的内容，避免看错
+                self.preview_edit.clear()
+                self.preview_hint.setVisible(False)
+                self._preview_timer.start()
+                return
+        self.preview_loader.request(self._preview_neighbours())
+
+    def _load_preview(self):
+        if self._preview_snippet is not None and self._preview_text is None:
+            self.preview_loader.request([self._preview_snippet] + self._preview_neighbours())
+
+    def _on_preview_loaded(self, snippet):
+        if snippet is self._preview_snippet and self._preview_text is None:
+            cached = self.preview_loader.get(snippet)
+            if cached is not None:
+                self._render_preview(*cached)
+
+    def _render_preview(self, text: str, truncated: bool):
+        self._preview_text = text
+        self._preview_pos = 0
+        self._preview_matches = None
+        self.preview_edit.clear()
+        self.preview_hint.setVisible(truncated)
+        self._fill_preview()
+        if self._preview_pos < len(text):
+            self._preview_fill_timer.start()
 
-    def _move_selection(self, delta):
+    def _fill_preview(self):
+        """向预览控件追加一块文本；长内容分多次在事件循环空闲时填入，不阻塞按键。"""
+        text = self._preview_text
+        if text is None or self._preview_pos >= len(text):
+            self._preview_fill_timer.stop()
+            return
+        chunk = text[self._preview_pos:self._preview_pos + PREVIEW_CHUNK_CHARS]
+        cursor = QTextCursor(self.preview_edit.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(chunk)
+        self._preview_pos += len(chunk)
+        if self._preview_pos == len(chunk):
+            self.preview_edit.moveCursor(QTextCursor.Start)
+        if self._preview_pos >= len(text):
+            self._preview_fill_timer.stop()
+        self._highlight_preview()
+
+    def _highlight_preview(self):
+        """高亮预览中当前搜索词的出现位置（只标已填入的部分，最多 PREVIEW_MAX_HIGHLIGHTS 处）。"""
+        query = self.search_edit.text().strip()
+        if self._preview_matches is None or self._preview_matches[0] != query:
+            self._preview_matches = (query, self._find_matches(self._preview_text, query))
+        fmt = QTextCharFormat()
+        fmt.setBackground(QColor("#ffe58f"))
+        selections = []
+        for start, length in self._preview_matches[1]:
+            if start + length > self._preview_pos:
+                break
+            selection = QTextEdit.ExtraSelection()
+            cursor = QTextCursor(self.preview_edit.document())
+            cursor.setPosition(start)
+            cursor.setPosition(start + length, QTextCursor.KeepAnchor)
+            selection.cursor = cursor
+            selection.format = fmt
+            selections.append(selection)
+        self.preview_edit.setExtraSelections(selections)
+
+    def _find_matches(self, text: str, query: str) -> list:
+        terms = query.split() if self.search_mode == SEARCH_MODE_FUZZY else [query]
+        terms = sorted({t for t in terms if t}, key=len, reverse=True)
+        if not text or not terms:
+            return []
+        pattern = re.compile("|".join(re.escape(t) for t in terms), re.I)
+        matches = []
+        for m in pattern.finditer(text):
+            matches.append((m.start(), m.end() - m.start()))
+            if len(matches) >= PREVIEW_MAX_HIGHLIGHTS:
+                break
+        if matches and _ASTRAL_RE.search(text, 0, sum(matches[-1])):
+            # 文档位置按 UTF-16 计，补齐 BMP 以外字符（如 emoji）造成的偏移
+            shifted = []
+            extra = prev = 0
+            for start, length in matches:
+                extra += len(_ASTRAL_RE.findall(text, prev, start))
+                inner = len(_ASTRAL_RE.findall(text, start, start + length))
+                shifted.append((start + extra, length + inner))
+                extra += inner
+                prev = start + length
+            matches = shifted
+        return matches
+
+    def _move_selection(self, delta, extend=False):
         n = len(self.filtered)
         if n == 0:
             return
+        if extend:
+            # Shift+↑↓：在当前选择上追加一行（多选后回车按顺序批量粘贴）
+            self.selected_index = max(0, min(n - 1, self.selected_index + delta))
+            index = self.result_model.index(self.selected_index, 0)
+            self.result_table.selectionModel().setCurrentIndex(
+                index, QItemSelectionModel.Select | QItemSelectionModel.Rows
+            )
+            self.result_table.scrollTo(index)
+            return
         self.selected_index = (self.selected_index + delta) % n
-        self.result_table.setCurrentCell(self.selected_index, 0)
-        self.result_table.scrollTo(self.result_table.model().index(self.selected_index, 0))
+        self._select_row(self.selected_index)
+
+    def _selected_snippets(self) -> list:
+        rows = sorted(index.row() for index in self.result_table.selectionModel().selectedRows())
+        rows = [row for row in rows if 0 <= row < len(self.filtered)]
+        if not rows and 0 <= self.selected_index < len(self.filtered):
+            rows = [self.selected_index]
+        return [self.filtered[row] for row in rows]
+
+    def _queue_selected(self):
+        """Ctrl+回车：把选中的片段加入粘贴队列，清空搜索框继续找下一条。"""
+        if self._search_pending():
+            self._apply_filter()
+        selected = self._selected_snippets()
+        if not selected:
+            return
+        self._queued.extend(selected)
+        self.selected_index = 0
+        self.search_edit.clear()
+        self.search_edit.setFocus()
+        self._update_status()
+
+    def _update_separator_button(self):
+        self.separator_btn.setText(f"分隔：{BATCH_SEPARATOR_LABELS[self.batch_separator]}")
+
+    def _toggle_batch_separator(self):
+        order = list(BATCH_SEPARATORS)
+        self.batch_separator = order[(order.index(self.batch_separator) + 1) % len(order)]
+        self.config["batch_separator"] = self.batch_separator
+        try:
+            save_config(self.config)
+        except Exception:
+            pass
+        self._update_separator_button()
+        self.search_edit.setFocus()
 
     def _on_enter(self):
+        # 回车时后台结果还没回来，就地同步搜一次，避免粘贴上一次查询的结果
+        if self._search_pending():
+            self._apply_filter()
         self._paste_current()
 
-    def _on_cell_activated(self, row, col):
+    def _on_cell_activated(self, index):
+        row = index.row()
         if 0 <= row < len(self.filtered):
-            content = self.filtered[row].get("content", "")
-            if content:
-                self._paste_to_focus(content)
+            self._paste_snippets(self._queued + [self.filtered[row]])
 
     def _paste_current(self):
-        if 0 <= self.selected_index < len(self.filtered):
-            content = self.filtered[self.selected_index].get("content", "")
-            if content:
-                self._paste_to_focus(content)
+        """粘贴队列中的片段，再接上当前选中的（可多选）片段。"""
+        self._paste_snippets(self._queued + self._selected_snippets())
+
+    def _paste_snippet(self, snippet: Snippet):
+        self._paste_snippets([snippet])
 
-    def _paste_to_focus(self, text: str):
-        """隐藏窗口后先恢复“按快捷键前的窗口”焦点，再发送 Ctrl+V 或逐字键入，并恢复原剪贴板。"""
+    def _target_app(self) -> str:
+        """调出窗口前的前台程序（进程名，_capture_target 时缓存），取不到时为空串。"""
+        return self._target_process
+
+    def _capture_target(self) -> None:
+        """记下当前前台窗口及其进程名（读规则文件、查进程名），在热键/IPC 处理中调用，不放在显示路径上。"""
         try:
-            old_clip = pyperclip.paste()
+            hwnd = get_foreground_hwnd() if sys.platform == "win32" else None
         except Exception:
-            old_clip = ""
-        restore_hwnd = getattr(self, "_prev_foreground_hwnd", None)
-        use_typewriter = sys.platform == "win32" and restore_hwnd and is_xshell_window(restore_hwnd)
-        if not use_typewriter:
-            pyperclip.copy(text)
+            hwnd = None
+        self._prev_foreground_hwnd = hwnd
+        self._target_process = self.paste_strategies.resolve(hwnd).process if hwnd else ""
+
+    def _ask_template_input(self, label: str):
+        text, ok = QInputDialog.getText(self, "FastType", label)
+        return text if ok else None
+
+    def _paste_snippets(self, snippets: list):
+        contents = []
+        app = self._target_app()
+        renderer = TemplateRenderer(self.store.get, self._ask_template_input, self.clipboard.text)
+        for snippet in snippets:
+            try:
+                content = renderer.render(snippet)
+            except TemplateCancelled:
+                self.search_edit.setFocus()
+                return
+            if not content:
+                continue
+            contents.append(content)
+            if snippet.id is not None:
+                self.usage.record(snippet.id, app)
+                count, _ = self._usage.get(snippet.id, (0, 0.0))
+                self._usage[snippet.id] = (count + 1, time.time())
+        self._queued = []
+        if not contents:
+            self._update_status()
+            return
+        self.tracer.begin("paste")
+        self._paste_to_focus(contents)
+
+    def _paste_to_focus(self, texts):
+        """隐藏窗口后先恢复“按快捷键前的窗口”焦点，再发送 Ctrl+V 或逐字键入，并恢复原剪贴板。
+
+        texts 可以是多条文本：按顺序逐条粘贴、条目之间按一次分隔键；切焦点和剪贴板暂存/恢复整批只做一次。
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        restore_hwnd = self._prev_foreground_hwnd
+        target = self.paste_strategies.resolve(restore_hwnd)
+        separator_key, separator_char = BATCH_SEPARATORS[self.batch_separator]
+        # 逐字键入不经过剪贴板，无需暂存和恢复
+        old_clip = None if target.types_text else self.clipboard.snapshot()
+        clip_seq = get_clipboard_sequence()
+        if target.types_text:
+            paste_text = target.wrap(separator_char.join(texts))
+            self._paste_pending = deque()
+        else:
+            paste_text = None
+            self._copy_for_paste(texts[0])
+            self._paste_pending = deque(texts[1:])
+        self._paste_separator_key = separator_key
+        self.tracer.mark("paste", "clipboard_set")
         self.hide()
-        paste_text = text if use_typewriter else None
-        QTimer.singleShot(
+        self.tracer.mark("paste", "window_hidden")
+        if sys.platform == "win32":
+            # 窗口已隐藏、剪贴板序号已前进（文本已就位）即可切回焦点
+            def ready():
+                if self.isVisible():
+                    return False
+                return paste_text is not None or clip_seq is None or get_clipboard_sequence() != clip_seq
+        else:
+            ready = None
+        self._wait_until(
+            ready,
             PASTE_DELAY_MS,
-            lambda: self._do_send_paste(old_clip, restore_hwnd, paste_text),
+            lambda ok, waited: self._do_send_paste(old_clip, restore_hwnd, paste_text, target),
         )
 
-    def _do_send_paste(self, restore_clip: str, restore_hwnd=None, paste_text=None):
+    def _copy_for_paste(self, text: str) -> None:
+        """Windows 上用延迟渲染放入剪贴板，以便知道目标何时读取；不可用时退回 QClipboard。"""
+        self._clip_offer = None
+        self._clip_rendered = False
+        if sys.platform == "win32":
+            self._clip_offer = text
+            try:
+                if offer_clipboard_text(int(self.winId())):
+                    return
+            except Exception:
+                pass
+            self._clip_offer = None
+        self.clipboard.set_text(text)
+
+    def _wait_until(self, condition, timeout_ms: float, then) -> None:
+        """每 PASTE_POLL_MS 检查一次 condition，满足或等满 timeout_ms 后调用 then(是否满足, 已等毫秒)。
+
+        condition 为 None 表示该平台无法观测，直接等满上限。
+        """
+        if condition is None:
+            QTimer.singleShot(int(timeout_ms), lambda: then(False, timeout_ms))
+            return
+        start = time.perf_counter()
+        timer = QTimer(self)
+        timer.setInterval(PASTE_POLL_MS)
+
+        def check():
+            waited = (time.perf_counter() - start) * 1000
+            ok = condition()
+            if ok or waited >= timeout_ms:
+                timer.stop()
+                timer.deleteLater()
+                then(ok, waited)
+                return True
+            return False
+
+        timer.timeout.connect(check)
+        if not check():
+            timer.start()
+
+    def _do_send_paste(self, restore_clip, restore_hwnd=None, paste_text=None, target=None):
+        self.tracer.mark("paste", "paste_delay")
         if sys.platform == "win32" and restore_hwnd is not None:
             set_foreground_hwnd(restore_hwnd)
-            delay = PASTE_DELAY_AFTER_FOCUS_XSHELL_MS if paste_text else PASTE_DELAY_AFTER_FOCUS_MS
-            QTimer.singleShot(
-                delay,
-                lambda: self._send_ctrl_v_and_restore_clip(restore_clip, restore_hwnd, paste_text),
-            )
+            upper = PASTE_DELAY_AFTER_FOCUS_XSHELL_MS if paste_text else PASTE_DELAY_AFTER_FOCUS_MS
+
+            def focused(ok, waited):
+                self.tracer.mark("paste", "focus_restored")
+                # 前台切回后再等该程序学到的时间，总等待不超过原来的固定延迟
+                settle = max(0.0, min(self.paste_timing.settle_ms(target and target.process, upper), upper - waited))
+                QTimer.singleShot(
+                    int(settle),
+                    lambda: self._send_ctrl_v_and_restore_clip(restore_clip, restore_hwnd, paste_text, target, upper),
+                )
+
+            self._wait_until(lambda: get_foreground_hwnd() == restore_hwnd, upper, focused)
         else:
-            self._send_ctrl_v_and_restore_clip(restore_clip, None, paste_text)
+            self._send_ctrl_v_and_restore_clip(restore_clip, None, paste_text, target)
 
-    def _send_ctrl_v_and_restore_clip(self, restore_clip: str, restore_hwnd=None, paste_text=None):
+    def _send_ctrl_v_and_restore_clip(self, restore_clip, restore_hwnd=None, paste_text=None,
+                                      target=None, upper: float = None):
+        self.tracer.mark("paste", "focus_settle")
+        if paste_text:
+            # 逐字键入在后台线程进行，键入完成（或按 Esc 取消）后再恢复剪贴板
+            self._after_typing = lambda: self._after_keys_sent(restore_clip, target, upper)
+            self._typing_job = self.typewriter.type_text(paste_text)
+            return
+        import keyboard
         try:
-            if paste_text:
-                keyboard.write(paste_text, delay=0.02)
-            else:
-                keyboard.press_and_release("ctrl+v")
+            keyboard.press_and_release(target.method if target is not None else PASTE_CTRL_V)
         except Exception:
             pass
-        # 等目标应用读完剪贴板再恢复，否则会贴成旧内容
-        QTimer.singleShot(
-            PASTE_DELAY_BEFORE_RESTORE_CLIP_MS,
-            lambda: self._restore_clipboard(restore_clip),
-        )
+        self._after_keys_sent(restore_clip, target, upper)
 
-    def _restore_clipboard(self, restore_clip: str):
+    def _on_typing_finished(self, job, completed, sent):
+        if job != self._typing_job or self._after_typing is None:
+            return
+        after, self._after_typing = self._after_typing, None
+        after()
+
+    def _after_keys_sent(self, restore_clip, target=None, upper: float = None):
+        self.tracer.mark("paste", "keys_sent")
+        if restore_clip is None:
+            self._restore_clipboard(None)
+            return
+        # 等目标应用读完剪贴板再恢复，否则会贴成旧内容；延迟渲染时读取可观测，读完即恢复
+        offered = self._clip_offer is not None
+        read = (lambda: self._clip_rendered and not clipboard_is_open()) if offered else None
+
+        def done(ok, waited):
+            if offered and target is not None and upper is not None:
+                self.paste_timing.record(target.process, upper, ok)
+            self._clip_offer = None
+            if self._paste_pending:
+                self._paste_next(restore_clip, target, upper)
+                return
+            self._restore_clipboard(restore_clip)
+
+        self._wait_until(read, PASTE_DELAY_BEFORE_RESTORE_CLIP_MS, done)
+
+    def _paste_next(self, restore_clip, target=None, upper: float = None):
+        """批量粘贴的下一条：目标读完上一条后按一次分隔键，换上下一条再发粘贴键。"""
+        import keyboard
         try:
-            pyperclip.copy(restore_clip)
+            if self._paste_separator_key:
+                keyboard.press_and_release(self._paste_separator_key)
         except Exception:
             pass
+        self._copy_for_paste(self._paste_pending.popleft())
+        self._send_ctrl_v_and_restore_clip(restore_clip, None, None, target, upper)
+
+    def _restore_clipboard(self, restore_clip):
+        if restore_clip is not None:
+            try:
+                self.clipboard.restore(restore_clip)
+            except Exception:
+                pass
+        self.tracer.end("paste", "clipboard_restored")
 
     def _open_snippets_file(self):
-        dlg = SnippetsMaintenanceDialog(self)
+        dlg = SnippetsMaintenanceDialog(self, store=self.store)
         dlg.exec_()
-        self._load_snippets()
+        self._reset_preview()
+        self._apply_filter()
 
-    def _on_hotkey_show(self):
-        """由快捷键触发，在主线程里取前台窗口再显示，避免在键盘线程里调 Win32。"""
-        try:
-            prev_hwnd = get_foreground_hwnd() if sys.platform == "win32" else None
-        except Exception:
-            prev_hwnd = None
-        self.show_and_focus(prev_hwnd)
+    def _reset_preview(self):
+        """片段内容可能已变：丢弃预览缓存，下次按当前选择重新显示。"""
+        self.preview_loader.clear()
+        self._preview_snippet = None
 
-    def show_and_focus(self, prev_foreground_hwnd=None):
-        if prev_foreground_hwnd is not None:
-            self._prev_foreground_hwnd = prev_foreground_hwnd
-        self._load_snippets()
-        self.search_edit.clear()
-        self.selected_index = 0
-        self._apply_filter()
+    def _on_hotkey(self, index: int, received_at: float):
+        """配置的第 index 个热键：打开（限定范围的）搜索，或不弹窗直接粘贴指定片段。"""
+        binding = self.hotkeys.bindings[index]
+        if binding.action == HOTKEY_PASTE:
+            self._paste_by_hotkey(binding)
+        else:
+            self._on_hotkey_show(received_at, binding)
+
+    def _paste_by_hotkey(self, binding: HotkeyBinding):
+        """直接粘贴到当前前台窗口，不经过窗口显示/聚焦；先等热键里的修饰键松开，免得和粘贴键叠在一起。"""
+        snippet = self.store.get(binding.snippet)
+        if snippet is None:
+            print(f"热键 {binding.keys} 对应的片段 {binding.snippet} 不存在。")
+            return
+        # 窗口开着时粘贴到调出它之前的窗口，与回车粘贴一致
+        if not self.isVisible():
+            self._capture_target()
+        self._wait_until(
+            lambda: not modifier_keys_down(),
+            HOTKEY_RELEASE_TIMEOUT_MS,
+            lambda ok, waited: self._paste_snippets([snippet]),
+        )
+
+    def _on_hotkey_show(self, received_at: float = None, scope: HotkeyBinding = None):
+        """由快捷键触发，在主线程里取前台窗口（及其进程名）再显示，避免在键盘线程里调 Win32。
+
+        received_at 为收到热键时的 time.perf_counter()，用于延迟追踪；scope 为带预填查询或限定来源的热键。
+        """
+        self.tracer.begin("popup", received_at)
+        self.tracer.mark("popup", "dispatch")
+        if not self.isVisible():
+            self._capture_target()
+        self.show_and_focus(scope)
+
+    def show_and_focus(self, scope: HotkeyBinding = None):
+        """显示并聚焦窗口；只用 _capture_target 缓存的目标程序，不做 I/O。"""
+        if not self.tracer.active("popup"):
+            self.tracer.begin("popup")
+        self._shown_at = time.perf_counter()
+        self._ready_timer.stop()
+        # 隐藏期间已备好的结果页仍对得上（数据和当前程序的常用排序都没变）就直接显示，否则现场过滤一次
+        scoped = scope is not None and scope.scoped
+        if not scoped and self._ready_key is not None and self._ready_key == tuple(self.usage.ranked(self._target_app())):
+            self.tracer.mark("popup", "ready")
+        else:
+            self._scope_source = scope.source if scoped else ""
+            self.search_edit.blockSignals(True)
+            self.search_edit.setText(scope.query if scoped else "")
+            self.search_edit.blockSignals(False)
+            self.selected_index = 0
+            self._apply_filter()
+        self._ready_key = None
         self.show()
         if sys.platform == "win32":
             try:
@@ -665,15 +4731,49 @@ class MainWindow(QWidget):
                 _force_our_window_foreground(self)
             except Exception:
                 pass
+        self.tracer.mark("popup", "window_shown")
+        # 未激活的窗口里 setFocus 只记下焦点控件，窗口被激活时 Qt 会补发 FocusIn，由 eventFilter 上报
+        self._focus_pending = True
+        self._focus_retried = False
         self.search_edit.setFocus()
-        for delay_ms in FOCUS_SEARCH_DELAYS_MS:
-            QTimer.singleShot(delay_ms, self._focus_search_again)
+        if self.search_edit.hasFocus():
+            self._on_focus_acquired()
+        else:
+            self._focus_timer.start(FOCUS_ACQUIRE_TIMEOUT_MS)
+        # 趁用户输入时预先保存剪贴板，粘贴时不必再读
+        QTimer.singleShot(0, self.clipboard.prefetch)
 
-    def _focus_search_again(self):
-        if self.isVisible():
-            self.raise_()
-            self.activateWindow()
-            self.search_edit.setFocus()
+    def _on_focus_acquired(self):
+        self._focus_pending = False
+        self._focus_timer.stop()
+        self.tracer.end("popup", "search_focused")
+        self.focus_acquired.emit((time.perf_counter() - self._shown_at) * 1000.0)
+
+    def _on_focus_timeout(self):
+        """迟迟没被激活（前台锁等）：再抢一次前台；仍不行就结束本次记录，免得之后的搜索被记进来。"""
+        if not self._focus_pending or not self.isVisible():
+            return
+        if self._focus_retried:
+            self._focus_pending = False
+            self.tracer.end("popup", "focus_timeout")
+            return
+        self._focus_retried = True
+        self.raise_()
+        self.activateWindow()
+        if sys.platform == "win32":
+            try:
+                _force_our_window_foreground(self)
+            except Exception:
+                pass
+        self.search_edit.setFocus()
+        self._focus_timer.start(FOCUS_GIVE_UP_MS - FOCUS_ACQUIRE_TIMEOUT_MS)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._focus_pending = False
+        self._focus_timer.stop()
+        # 粘贴、Esc、点 X 都会走到这里：等空闲时把窗口恢复到就绪状态（常用排序可能刚变过）
+        self._schedule_ready_state()
 
     def closeEvent(self, event):
         """点标题栏 X 时只隐藏窗口，不关闭，否则用该窗口注册的热键会失效。"""
@@ -687,22 +4787,278 @@ class MainWindow(QWidget):
                 try:
                     ptr = ctypes.cast(ctypes.c_void_p(int(message)), ctypes.POINTER(_MSG))
                     msg = ptr.contents
-                    if msg.message == WM_HOTKEY and msg.wParam == HOTKEY_ID:
-                        QTimer.singleShot(0, self._on_hotkey_show)
+                    if msg.message == WM_HOTKEY and self.hotkeys.dispatch(msg.wParam, time.perf_counter()):
+                        return (True, 0)
+                    if msg.message == WM_RENDERFORMAT and msg.wParam == CF_UNICODETEXT and self._clip_offer is not None:
+                        render_clipboard_text(self._clip_offer)
+                        self._clip_rendered = True
+                        return (True, 0)
+                    if msg.message == WM_RENDERALLFORMATS and self._clip_offer is not None:
+                        render_all_clipboard_text(int(self.winId()), self._clip_offer)
                         return (True, 0)
                 except Exception:
                     pass
         return super().nativeEvent(eventType, message)
 
 
+def _migrate_to_sqlite() -> None:
+    """命令行 --migrate-sqlite：把 snippets.json 导入 snippets.db 并切换到 SQLite 后端。"""
+    if not sqlite_backend_available():
+        print("当前 Python 的 SQLite 不支持 FTS5 trigram（需要 SQLite 3.34 以上），无法迁移。")
+        sys.exit(1)
+    count = migrate_json_to_sqlite()
+    config = load_config()
+    config["store"] = STORE_BACKEND_SQLITE
+    save_config(config)
+    print(f"已导入 {count} 条片段到 {get_sqlite_path()}，之后将使用 SQLite 存储。")
+
+
+class _StartupProbe:
+    """--startup-probe <文件>：记录冷启动各阶段耗时（毫秒）写成 JSON 后退出，供 bench_startup.py 使用。
+
+    起点取环境变量 FASTTYPE_PROBE_T0（启动进程前的 time.time()），没有则取本模块开始执行的时刻。
+    """
+
+    TIMEOUT_MS = 30000
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self.t0 = float(os.environ["FASTTYPE_PROBE_T0"])
+        except (KeyError, ValueError):
+            self.t0 = _PROCESS_T0
+        self.marks = {}
+        self._done = False
+
+    @classmethod
+    def from_argv(cls, argv):
+        if "--startup-probe" in argv:
+            i = argv.index("--startup-probe")
+            if i + 1 < len(argv):
+                return cls(argv[i + 1])
+        return None
+
+    def mark(self, name: str) -> None:
+        self.marks.setdefault(name, round((time.time() - self.t0) * 1000, 2))
+
+    def attach(self, window) -> None:
+        """窗口建好后：等片段加载完成，再模拟一次调出，窗口画出来后写结果退出。"""
+        self.mark("window_created")
+        QTimer.singleShot(self.TIMEOUT_MS, self.finish)
+        if window.store.is_loaded():
+            self._popup(window)
+        else:
+            window.store.changed.connect(lambda: self._popup(window))
+
+    def _popup(self, window):
+        if "first_popup" in self.marks or "popup_requested" in self.marks:
+            return
+        self.mark("snippets_loaded")
+        self.mark("popup_requested")
+        window.show_and_focus()
+        QTimer.singleShot(0, lambda: (self.mark("first_popup"), self.finish()))
+
+    def finish(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.marks, f)
+        QApplication.instance().quit()
+
+
+def get_ipc_name() -> str:
+    """QLocalServer 监听名；fasttype_cli.py 中有同样的计算，两边需保持一致。"""
+    if sys.platform == "win32":
+        return IPC_PIPE_PREFIX + re.sub(r"[^\w.-]", "_", getpass.getuser())
+    return os.path.join(os.path.dirname(get_snippets_path()), IPC_SOCKET_FILE)
+
+
+def _ipc_server_alive(name: str) -> bool:
+    """是否有进程正在该名字上监听（能连上即是）。"""
+    from PyQt5.QtNetwork import QLocalSocket
+    sock = QLocalSocket()
+    sock.connectToServer(name)
+    alive = sock.waitForConnected(IPC_CONNECT_TIMEOUT_MS)
+    sock.abort()
+    return alive
+
+
+def notify_running_instance(request: dict) -> bool:
+    """把请求发给已在运行的 FastType；连不上（没有实例在运行）时返回 False。"""
+    from PyQt5.QtNetwork import QLocalSocket
+    sock = QLocalSocket()
+    sock.connectToServer(get_ipc_name())
+    if not sock.waitForConnected(IPC_CONNECT_TIMEOUT_MS):
+        return False
+    sock.write(json.dumps(request).encode("utf-8") + b"\n")
+    sock.waitForBytesWritten(IPC_CONNECT_TIMEOUT_MS)
+    sock.waitForReadyRead(IPC_CONNECT_TIMEOUT_MS)
+    sock.disconnectFromServer()
+    return True
+
+
+class IpcServer(QObject):
+    """托盘进程的本机 IPC 服务：每行一个 JSON 请求、每行一个 JSON 应答。
+
+    直接用已加载的索引回答 search / get，paste 粘贴到当前前台窗口，show 调出窗口（第二次启动时用）。
+    片段还没加载完时收到的请求，等加载完成再应答。
+    """
+
+    def __init__(self, get_window, parent=None):
+        from PyQt5.QtNetwork import QLocalServer
+        super().__init__(parent)
+        self._get_window = get_window
+        self._server = QLocalServer(self)
+        self._server.setSocketOptions(QLocalServer.UserAccessOption)
+        self._server.newConnection.connect(self._on_new_connection)
+        self._buffers = {}
+        self._waiting = []
+        self._waiting_window = None
+
+    def listen(self) -> bool:
+        """开始监听；名字已被另一个在运行的实例占用时返回 False（不删除它的 socket）。
+
+        启动时的单实例检查与这里不是原子的：两个实例同时启动时，后监听的一方在这里失败。
+        Windows 的命名管道允许多个监听者，所以先试连一次，能连上就视为已有实例。
+        """
+        from PyQt5.QtNetwork import QLocalServer
+        name = get_ipc_name()
+        if _ipc_server_alive(name):
+            return False
+        if self._server.listen(name):
+            return True
+        # 连不上却监听失败：多半是上次异常退出留下的 socket 文件，确认仍连不上后删掉再试一次
+        if _ipc_server_alive(name):
+            return False
+        QLocalServer.removeServer(name)
+        return self._server.listen(name)
+
+    def close(self) -> None:
+        self._server.close()
+
+    def _on_new_connection(self):
+        while self._server.hasPendingConnections():
+            sock = self._server.nextPendingConnection()
+            self._buffers[sock] = b""
+            sock.readyRead.connect(lambda s=sock: self._on_ready_read(s))
+            sock.disconnected.connect(lambda s=sock: self._drop(s))
+
+    def _drop(self, sock):
+        self._buffers.pop(sock, None)
+        self._waiting = [(s, line) for s, line in self._waiting if s is not sock]
+        sock.deleteLater()
+
+    def _on_ready_read(self, sock):
+        data = self._buffers.get(sock, b"") + bytes(sock.readAll())
+        *lines, rest = data.split(b"\n")
+        self._buffers[sock] = rest
+        for line in lines:
+            if line.strip():
+                self._dispatch(sock, line)
+
+    def _dispatch(self, sock, line: bytes):
+        window = self._get_window()
+        if not window.store.is_loaded():
+            if self._waiting_window is not window:
+                self._waiting_window = window
+                window.store.changed.connect(self._flush_waiting)
+            self._waiting.append((sock, line))
+            return
+        self._reply(sock, self._handle(window, line))
+
+    def _flush_waiting(self):
+        waiting, self._waiting = self._waiting, []
+        for sock, line in waiting:
+            self._dispatch(sock, line)
+
+    def _reply(self, sock, response: dict):
+        if sock in self._buffers:
+            sock.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            sock.flush()
+
+    def _handle(self, window, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            cmd = request.get("cmd")
+        except (ValueError, AttributeError):
+            return {"ok": False, "error": "请求不是 JSON 对象"}
+        try:
+            if cmd == "ping":
+                return {"ok": True, "pid": os.getpid()}
+            if cmd == "search":
+                return {"ok": True, "results": self._search(window, request)}
+            if cmd in ("get", "paste"):
+                snippet = window.store.get(str(request.get("id")))
+                if snippet is None:
+                    return {"ok": False, "error": f"没有 id 为 {request.get('id')} 的片段"}
+                if cmd == "get":
+                    return {"ok": True, "snippet": {"id": snippet.id, "title": snippet.title, "content": snippet.content}}
+                window._capture_target()
+                window._paste_snippets([snippet])
+                return {"ok": True}
+            if cmd == "show":
+                window._on_hotkey_show()
+                return {"ok": True}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        return {"ok": False, "error": f"未知命令：{cmd}"}
+
+    @staticmethod
+    def _search(window, request: dict) -> list:
+        query = str(request.get("query") or "").strip()
+        limit = max(1, int(request.get("limit") or IPC_SEARCH_LIMIT))
+        preview_len = int(request.get("preview") or 60)
+        if not query:
+            results = window.store.index.ranked(window.usage.ranked())
+        elif request.get("mode", window.search_mode) == SEARCH_MODE_FUZZY:
+            results = window.store.index.fuzzy_search(query, usage=window._usage, limit=limit)
+        else:
+            results = window.store.index.search(query)
+        return [
+            {"id": snippet.id, "title": snippet.title, "preview": snippet.preview(preview_len)}
+            for snippet in results[:limit]
+        ]
+
+
+def _preload_paste_modules() -> None:
+    """启动后空闲时再导入粘贴用的模块，不拖慢托盘出现，也避免首次粘贴时才导入。"""
+    try:
+        import keyboard  # noqa: F401
+    except Exception:
+        pass
+
+
 def main():
+    if "--migrate-sqlite" in sys.argv[1:]:
+        _migrate_to_sqlite()
+        return
+    probe = _StartupProbe.from_argv(sys.argv)
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
     app.setApplicationName("FastType")
-    window = MainWindow()
+    # 单实例：已有 FastType 在运行时让它弹出窗口后直接退出，避免重复注册热键
+    if probe is None and notify_running_instance({"cmd": "show"}):
+        return
+    window = None
 
-    tray = QSystemTrayIcon(parent=window)
-    if tray.isSystemTrayAvailable():
+    def ensure_window():
+        """主窗口（样式表、片段加载、全局热键）在托盘出现后才创建。"""
+        nonlocal window
+        if window is not None:
+            return window
+        window = MainWindow()
+        app.aboutToQuit.connect(window.stop_search_thread)
+        app.aboutToQuit.connect(window.store.compact)
+        app.aboutToQuit.connect(window.paste_strategies.close)
+        app.aboutToQuit.connect(window.usage.compact)
+        app.aboutToQuit.connect(window.paste_timing.flush)
+        _register_hotkey(app, window)
+        return window
+
+    tray = QSystemTrayIcon()
+    tray_available = tray.isSystemTrayAvailable()
+    if tray_available:
         icon = _app_icon()
         if icon is not None:
             tray.setIcon(icon)
@@ -710,40 +5066,56 @@ def main():
             tray.setIcon(app.style().standardIcon(QStyle.SP_ComputerIcon))
         menu = QMenu()
         show_act = QAction("显示 FastType", menu)
-        show_act.triggered.connect(window.show_and_focus)
+        show_act.triggered.connect(lambda: ensure_window().show_and_focus())
         menu.addAction(show_act)
+        stats_act = QAction("延迟统计", menu)
+        stats_act.triggered.connect(lambda: _show_latency_stats(ensure_window()))
+        menu.addAction(stats_act)
         quit_act = QAction("退出", menu)
         quit_act.triggered.connect(app.quit)
         menu.addAction(quit_act)
         tray.setContextMenu(menu)
         tray.activated.connect(
-            lambda reason: window.show_and_focus() if reason == QSystemTrayIcon.DoubleClick else None
+            lambda reason: ensure_window().show_and_focus() if reason == QSystemTrayIcon.DoubleClick else None
         )
         tray.show()
+    if probe is not None:
+        probe.mark("tray_shown")
     else:
-        window.show_and_focus()
-
-    # Windows 用原生 RegisterHotKey（稳定，不会过一会失效）；其他系统用 keyboard
-    if sys.platform == "win32":
-        win_hwnd = int(window.winId())
-        if not register_native_hotkey(win_hwnd):
-            print("全局快捷键注册失败（Alt+Q 可能被占用），请以管理员身份运行或更换快捷键。")
-        app.aboutToQuit.connect(lambda: unregister_native_hotkey(win_hwnd))
-    else:
-        def on_hotkey():
-            try:
-                QTimer.singleShot(0, window._on_hotkey_show)
-            except Exception:
-                pass
+        ipc = IpcServer(ensure_window, parent=app)
+        if not ipc.listen():
+            # 与同时启动的另一个实例竞争失败：交给它弹出窗口，本进程退出，不重复注册热键
+            if notify_running_instance({"cmd": "show"}):
+                return
+            print("本机 IPC 服务启动失败，fasttype_cli.py 将无法连接。")
+        app.aboutToQuit.connect(ipc.close)
 
-        try:
-            keyboard.add_hotkey(HOTKEY, on_hotkey, suppress=False)
-        except Exception as e:
-            print("全局快捷键注册失败（可能需要管理员权限）:", e)
+    def deferred_init():
+        w = ensure_window()
+        if probe is not None:
+            probe.attach(w)
+        elif not tray_available:
+            w.show_and_focus()
+        QTimer.singleShot(STARTUP_PRELOAD_DELAY_MS, _preload_paste_modules)
 
-    window.hide()
+    QTimer.singleShot(0, deferred_init)
     sys.exit(app.exec_())
 
 
+def _show_latency_stats(window) -> None:
+    box = QMessageBox(QMessageBox.Information, "FastType 延迟统计", "")
+    box.setTextFormat(Qt.RichText)
+    box.setText(f"<pre>{html.escape(window.tracer.report())}</pre>")
+    box.exec_()
+
+
+def _register_hotkey(app, window) -> None:
+    # Windows 用原生 RegisterHotKey（稳定，不会过一会失效）；其他系统用 keyboard
+    failed = window.hotkeys.register(int(window.winId()))
+    if failed:
+        print(f"全局快捷键注册失败（{'、'.join(failed)} 可能被占用或需要管理员权限），请以管理员身份运行或更换快捷键。")
+    app.aboutToQuit.connect(window.hotkeys.unregister)
+
+
 if __name__ == "__main__":
     main()
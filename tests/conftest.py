@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""测试公共设置：从仓库根目录导入 main，Qt 用 offscreen 平台，用户目录指向临时目录。"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+_HOME = tempfile.mkdtemp(prefix="fasttype-test-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = _HOME
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from PyQt5.QtCore import QCoreApplication  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    return QCoreApplication.instance() or QCoreApplication([])
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""SnippetIndex.search 的结果必须与线性的 filter_snippets（re.I 子串匹配）完全一致。"""
+import random
+import string
+
+import main
+
+SPECIALS = ["Straße", "STRASSE", "ẞ", "İstanbul", "ıi", "I", "ΣΊΣΥΦΟΣ", "σίσυφος", "ﬁle", "file",
+            "K", "Ångström", "ǰx", "邮箱", "服务器", "데이터"]
+QUERIES = ["ss", "ß", "ẞ", "strasse", "straße", "STRASSE", "i", "İ", "ı", "istanbul", "İSTANBUL",
+           "σ", "ς", "Σίσυφος", "fi", "ﬁ", "ﬁle", "k", "K", "å", "ǰ", "邮", "邮箱", "服务器", "데이터",
+           "e", "zzz", "\0"]
+LIMIT = main.INDEX_PREFIX_CHARS
+OVERLAP = main.INDEX_TAIL_OVERLAP
+
+
+def _word(rng, n):
+    return "".join(rng.choice(string.ascii_lowercase + "邮箱服务器 ") for _ in range(n))
+
+
+def _needle(rng, n):
+    # 大写字母 + 数字，不会偶然出现在填充文本中
+    return "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(n))
+
+
+def _corpus(seed=7):
+    rng = random.Random(seed)
+    snippets, needles = [], []
+
+    def add(title, content):
+        snippets.append({"id": str(len(snippets) + 1), "title": title, "content": content})
+
+    for _ in range(400):
+        add(_word(rng, rng.randint(1, 8)) + rng.choice(["", rng.choice(SPECIALS)]),
+            _word(rng, rng.randint(0, 200)) + " " + rng.choice(SPECIALS))
+    # 跨越内存前段末尾、尾部起点（前段末尾往前 OVERLAP 个字符）以及倒排表范围的查询词
+    for boundary in (LIMIT - OVERLAP, LIMIT, main.FUZZY_CONTENT_SCAN):
+        for length in (1, 2, OVERLAP - 1, OVERLAP, OVERLAP + 1):
+            for shift in (-length, -length + 1, -1, 0, 1):
+                start = max(0, boundary + shift)
+                needle = _needle(rng, length)
+                needles.append(needle)
+                for prefix in ("", "ß" * 40):
+                    # 前面放 ß：折叠后变长，前段边界在折叠文本中的位置随之移动
+                    head = prefix + _word(rng, max(0, start - len(prefix)))
+                    add("长内容", head + needle + _word(rng, LIMIT + rng.randint(0, 600)))
+    return snippets, needles
+
+
+def _check(index, snippets, queries):
+    mismatches = []
+    for q in queries:
+        want = [s["id"] for s in main.filter_snippets(snippets, q)]
+        got = [s.id for s in index.search(q)]
+        if want != got:
+            mismatches.append((q, sorted(set(want) ^ set(got))[:5]))
+    return mismatches
+
+
+def test_search_matches_filter_snippets():
+    snippets, needles = _corpus()
+    records = main._to_records(snippets)
+    assert any(r._blob is not None for r in records)   # 覆盖到 blob 中的长内容
+    index = main.SnippetIndex(records)
+    queries = QUERIES + needles + [n.lower() for n in needles] + [n[1:-1] for n in needles if len(n) > 2]
+    assert _check(index, snippets, queries) == []
+
+
+def test_typing_narrowing_uses_cache_correctly():
+    snippets, needles = _corpus(seed=11)
+    index = main.SnippetIndex(main._to_records(snippets))
+    for text in ["straße", "STRASSE", "İstanbul", "ﬁle", needles[40], needles[-1].lower()]:
+        for end in range(1, len(text) + 1):
+            assert _check(index, snippets, [text[:end]]) == [], text[:end]
+
+
+def test_search_after_edits_matches_filter_snippets():
+    rng = random.Random(3)
+    snippets, needles = _corpus(seed=5)
+    records = main._to_records(snippets)
+    index = main.SnippetIndex(records)
+    index.search("ss")   # 先填充缓存，编辑后必须失效
+    for _ in range(60):
+        i = rng.randrange(len(records))
+        records[i].content = records[i].content + " edited " + rng.choice(SPECIALS)
+        snippets[i]["content"] = records[i].content
+        index.update(records[i])
+    for _ in range(40):
+        i = rng.randrange(len(records))
+        index.remove(records.pop(i))
+        snippets.pop(i)
+    for _ in range(20):
+        data = {"id": f"n{_}", "title": rng.choice(SPECIALS), "content": rng.choice(needles) + " ß"}
+        snippets.append(data)
+        record = main.Snippet.from_dict(data)
+        records.append(record)
+        index.add(record)
+    assert _check(index, snippets, QUERIES + ["edited", "editedß"] + needles[::7]) == []
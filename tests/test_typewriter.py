@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""TypewriterEngine 逐字键入：用 FakeInputSink 记录发出的文本。"""
+import time
+
+import main
+
+
+def _run(qapp, engine, text, timeout=5.0):
+    """开始键入并处理事件直到 finished，返回 (任务号, 是否完整键入, 已键入字符数)。"""
+    results = []
+    engine.finished.connect(lambda *args: results.append(args))
+    job = engine.type_text(text)
+    deadline = time.monotonic() + timeout
+    while not results and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.002)
+    assert results, "键入未在超时前结束"
+    assert results[0][0] == job
+    return results[0]
+
+
+class _CancellingSink(main.FakeInputSink):
+    """收到 after 块后请求取消：via="sink" 模拟按 Esc，via="engine" 模拟调用 cancel()。"""
+
+    def __init__(self, after, via, engine=None):
+        super().__init__()
+        self.after = after
+        self.via = via
+        self.engine = engine
+
+    def send(self, text):
+        super().send(text)
+        if len(self.chunks) == self.after:
+            if self.via == "sink":
+                self.cancelled = True
+            else:
+                self.engine.cancel()
+
+
+def test_types_whole_text_in_chunks(qapp):
+    sink = main.FakeInputSink()
+    engine = main.TypewriterEngine(sink, chunk_chars=4, interval_ms=0)
+    _, completed, sent = _run(qapp, engine, "hello, world")
+    assert completed
+    assert sent == 12
+    assert sink.chunks == ["hell", "o, w", "orld"]
+    assert sink.text == "hello, world"
+
+
+def test_newlines_are_normalized(qapp):
+    sink = main.FakeInputSink()
+    engine = main.TypewriterEngine(sink, chunk_chars=3, interval_ms=0)
+    _, completed, sent = _run(qapp, engine, "ls -l\r\ncd /tmp\nexit\r\n")
+    assert completed
+    assert sink.text == "ls -l\ncd /tmp\nexit\n"
+    assert sent == len(sink.text)
+
+
+def test_astral_characters_are_never_split(qapp):
+    # 😀 / 𠀀 在 UTF-16 中是代理对，按块切分时不能拆开
+    text = "a😀b𠀀c😀😀\n𠀀"
+    sink = main.FakeInputSink()
+    engine = main.TypewriterEngine(sink, chunk_chars=1, interval_ms=0)
+    _, completed, sent = _run(qapp, engine, text)
+    assert completed
+    assert sink.text == text
+    assert sent == len(text)
+    assert all(len(chunk) == 1 for chunk in sink.chunks)
+    for chunk in sink.chunks:
+        chunk.encode("utf-16-le").decode("utf-16-le")   # 每块都是完整的 UTF-16 序列
+
+
+def test_cancel_requested_by_sink_stops_mid_run(qapp):
+    sink = _CancellingSink(after=2, via="sink")
+    engine = main.TypewriterEngine(sink, chunk_chars=5, interval_ms=1)
+    _, completed, sent = _run(qapp, engine, "x" * 100)
+    assert not completed
+    assert sent == 10
+    assert sink.text == "x" * 10
+
+
+def test_cancel_from_engine_stops_mid_run(qapp):
+    engine = main.TypewriterEngine(main.FakeInputSink(), chunk_chars=5, interval_ms=20)
+    sink = engine.sink = _CancellingSink(after=3, via="engine", engine=engine)
+    _, completed, sent = _run(qapp, engine, "y" * 100)
+    assert not completed
+    assert sent == 15
+    assert sink.text == "y" * 15
+
+
+def test_new_job_cancels_previous(qapp):
+    sink = main.FakeInputSink()
+    engine = main.TypewriterEngine(sink, chunk_chars=1, interval_ms=50)
+    results = []
+    engine.finished.connect(lambda *args: results.append(args))
+    first = engine.type_text("a" * 50)
+    second = engine.type_text("done")
+    deadline = time.monotonic() + 5
+    while len(results) < 2 and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.002)
+    by_job = {job: (completed, sent) for job, completed, sent in results}
+    assert by_job[second] == (True, 4)
+    assert by_job[first][0] is False
+    assert sink.text.replace("a", "") == "done"
+
+
+def test_sink_file_receives_text(qapp, tmp_path):
+    path = tmp_path / "typed.txt"
+    engine = main.TypewriterEngine(main.FakeInputSink(str(path)), chunk_chars=2, interval_ms=0)
+    _run(qapp, engine, "第一行\n第二行")
+    assert path.read_text(encoding="utf-8") == "第一行\n第二行"